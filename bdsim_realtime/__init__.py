@@ -1,2 +1,3 @@
 from .run import run
-from . import tuning
+from .event_loop import async_run, arun
+from . import tuning, scheduling, timing
@@ -1,10 +1,10 @@
 from . import data, io
 
-from .data import CSV, DataSender, DataReceiver
+from .data import CSV, DataSender, DataReceiver, Recorder, Replay
 from .sources import Tunable_Waveform
 from .displays import TunerScope
 from .functions import Tunable_Gain
 try:
-    from .vision import Camera, CvtColor, Mask, Threshold, Erode, Dilate, OpenMask, CloseMask, Blobs, Display, DrawKeypoints, InRange
+    from .vision import Camera, Roi, RoiFrame, CvtColor, Mask, Threshold, Erode, Dilate, OpenMask, CloseMask, Blobs, Display, DrawKeypoints, InRange
 except ImportError:
     pass
\ No newline at end of file
@@ -1,21 +1,13 @@
-from typing import Any, Union
+from typing import Any, Deque, Optional, Sequence, Union
+from collections import deque
 from io import IOBase
+import socket
 
-import msgpack
-from bdsim.blocks.discrete import ZOH
-from bdsim.components import Block, Clock, Plug, SinkBlock, SourceBlock, ClockedBlock
+import numpy as np
+from bdsim.components import Block, Clock, Plug, SinkBlock, ClockedBlock
 
-
-# pivate helpers
-_PKT_LEN_SIZE = 4
-def _send_msgpack(transport: IOBase, obj: Any):
-    data = msgpack.dumps(obj)
-    transport.write(len(data).to_bytes(_PKT_LEN_SIZE, 'big') + data)
-    transport.flush() # required
-
-def _recv_msgpack(transport: IOBase) -> Any:
-    data_len = int.from_bytes(transport.read(_PKT_LEN_SIZE), 'big')
-    return msgpack.loads(transport.read(data_len))
+from bdsim_realtime.recording import ChunkedRecorder, RecordFormat, RingRecorder, iter_recording
+from bdsim_realtime.transport import Transport, as_transport
 
 
 class DataSender(SinkBlock, ClockedBlock):
@@ -23,63 +15,102 @@ class DataSender(SinkBlock, ClockedBlock):
     nin = -1
     nout = 0
 
-    def __init__(self, receiver: IOBase, *inputs: Union[Block, Plug], nin: int, clock: Clock, **kwargs: Any):
+    def __init__(
+        self,
+        receiver: Union[Transport, socket.socket, IOBase],
+        *inputs: Union[Block, Plug],
+        nin: int,
+        clock: Clock,
+        schema: Optional[Union[int, Any]] = None,
+        **kwargs: Any
+    ):
+        """
+        :param receiver: where to send the inputs each tick. A connected socket (sent without blocking),
+            a file-like object such as `socket.makefile('rwb')` (blocking), or a :class:`~bdsim_realtime.transport.Transport`.
+            Use a :class:`~bdsim_realtime.transport.SharedMemoryTransport` with one channel per input for receivers on the same host
+        :param schema: if given, the name, dtype and shape of each input ie; `[('x', 'f4'), ('image', 'u1', (48, 64))]`,
+            or the number of float64 inputs. Each tick is then sent as a fixed-size record with a sequence number and timestamp
+            rather than a self-describing msgpack message. See :func:`~bdsim_realtime.transport.record_dtype`, defaults to None
+        """
         super().__init__(nin=nin, nout=0, inputs=inputs, clock=clock, **kwargs)
         
         self._x0 = []
         self.receiver = receiver
+        self.transport = as_transport(receiver)
         self.type = 'datasender'
         self.ready = False
 
-        # SYN -> server(receiver):SYN-ACK -> ACK (copy TCP scheme)
-        _send_msgpack(receiver, {
-            'version': '0.0.1',
-            'role': 'sender'
-        })
-
-        syn_ack = _recv_msgpack(receiver)
-        assert syn_ack['version'] == '0.0.1'
-
-        _send_msgpack(receiver, {
-            'version': '0.0.1',
-            'role': 'sender'
-        })
+        self.transport.handshake('sender', schema)
+        if self.transport.schema is not None:
+            n_channels = len(self.transport.schema['values'].names)
+            assert n_channels == nin, "Schema has {} channels for {} inputs".format(n_channels, nin)
 
     def next(self):
-        _send_msgpack(self.receiver, self.inputs)
+        if self.transport.schema is not None:
+            self.transport.send_record(self.bd.state.t, self.inputs)
+        else:
+            self.transport.send(self.inputs)
         return []
     
     def output(self, t: float):
         return []
 
 
-class DataReceiver(SourceBlock, ZOH):
+class DataReceiver(ClockedBlock):
     # TODO: Should only work with bdsim-realtime
 
     nin = 0
     nout = -1
 
-    def __init__(self, sender: IOBase, *, nout: int, clock: Clock, **kwargs: Any):
+    def __init__(
+        self,
+        sender: Union[Transport, socket.socket, IOBase],
+        *,
+        nout: int,
+        clock: Clock,
+        latest: bool = True,
+        **kwargs: Any
+    ):
+        """
+        :param sender: where to receive outputs from. A connected socket (received without blocking),
+            a file-like object such as `socket.makefile('rwb')` (blocking), or a :class:`~bdsim_realtime.transport.Transport`.
+            Use a :class:`~bdsim_realtime.transport.SharedMemoryTransport` with one channel per output for senders on the same host
+        :param latest: if several packets arrived since the last tick, output only the newest (best for control).
+            Otherwise output them one per tick in order (best for recording). Either way the last
+            values are held while no new data is available, defaults to True
+
+        If the sender negotiated a schema, lost and out-of-order packets are counted in
+        `self.transport.lost` and `self.transport.reordered`.
+        """
         super().__init__(nin=0, nout=nout, clock=clock, **kwargs)
 
         self._x0 = [0] * nout
         self.ndstates = len(self._x0)
         self.sender = sender
+        self.transport = as_transport(sender)
+        self.latest = latest
         self.type = 'datareceiver'
+        self._queued: Deque[Any] = deque()
 
-        syn = _recv_msgpack(sender)
-        assert syn['version'] == '0.0.1'
-
-        _send_msgpack(sender, {
-            'version': '0.0.1',
-            'role': 'receiver'
-        })
-        
-        ack = _recv_msgpack(sender)
-        assert ack['version'] == '0.0.1'
+        self.transport.handshake('receiver')
+        if self.transport.schema is not None:
+            n_channels = len(self.transport.schema['values'].names)
+            assert n_channels == nout, "Schema has {} channels for {} outputs".format(n_channels, nout)
     
     def next(self):
-        _x = _recv_msgpack(self.sender)
+        if self.transport.schema is not None:
+            values = self.transport.poll_records()['values']
+            self._queued.extend(map(list, (values[-1:] if self.latest else values).tolist()))
+        else:
+            self._queued.extend(self.transport.poll())
+        if not self._queued:
+            return self._x  # hold
+
+        if self.latest:
+            _x = self._queued[-1]
+            self._queued.clear()
+        else:
+            _x = self._queued.popleft()
         return _x
     
     def output(self, t: float):
@@ -87,6 +118,113 @@ class DataReceiver(SourceBlock, ZOH):
 
 
 
+class Replay(ClockedBlock):
+    """Plays a recording back into a diagram, ie; to regression-test a controller against field logs.
+
+    Each tick outputs the latest recorded row at or before the current simulation time, holding it between rows.
+    Recordings are streamed in chunks (see :func:`~bdsim_realtime.recording.iter_recording`) so can be of any length.
+
+    Playback is paced by `run()`'s scheduler: in real time by default, or in simulated time with
+    `run(bd, scheduler=VirtualScheduler())` to replay as fast as the diagram can execute.
+    """
+
+    nin = 0
+    nout = -1
+
+    # tolerance for the clock's tick times not exactly matching the recorded times
+    _TIME_EPSILON = 1e-9
+
+    def __init__(
+        self,
+        file: Union[str, IOBase],
+        *,
+        clock: Clock,
+        format: Optional[RecordFormat] = None,
+        outputs: Optional[Sequence[str]] = None,
+        time: Optional[str] = "t",
+        columns: Optional[Sequence[str]] = None,
+        stop: bool = True,
+        chunk_rows: int = 4096,
+        **kwargs: Any
+    ):
+        """
+        :param file: a recording made by the `RECORDER` or `CSV` blocks
+        :param format: defaults to guessing from the file extension
+        :param outputs: the columns to output, in order. Defaults to every column except `time`
+        :param time: the column of recorded times. If None, output one row per tick instead, defaults to 't'
+        :param columns: names of the columns of a CSV file without a header, defaults to 'c0', 'c1', ...
+        :param stop: stop the run once the recording ends. Otherwise hold the last row, defaults to True
+        :param chunk_rows: rows read at a time, defaults to 4096
+        """
+        names, self._chunks = iter_recording(file, format, chunk_rows, columns)
+        if outputs is None:
+            outputs = [name for name in names if name != time]
+        for name in list(outputs) + ([time] if time is not None else []):
+            assert name in names, "Recording has no column {}. Its columns are {}".format(name, names)
+        nout = len(outputs)
+        super().__init__(nin=0, nout=nout, clock=clock, **kwargs)
+
+        self._x0 = [0] * nout
+        self.ndstates = len(self._x0)
+        self.type = 'replay'
+        self.columns = names
+        self.outputs = list(outputs)
+        self.time = time
+        self.stop = stop
+
+        self._output_idx = [names.index(name) for name in outputs]
+        self._time_idx = names.index(time) if time is not None else None
+        self._chunk = np.empty((0, len(names)))
+        self._row = 0  # next unplayed row of self._chunk
+        self.ended = False
+
+    def done(self, **kwargs):
+        # closes the recording's file, if it's still being read
+        self._chunks.close()
+
+    def _next_chunk(self) -> bool:
+        for chunk in self._chunks:
+            if len(chunk):
+                self._chunk, self._row = chunk, 0
+                return True
+        return False
+
+    def next(self):
+        if self.ended:
+            return self._x
+
+        latest = None
+        if self._time_idx is None:
+            if self._row < len(self._chunk) or self._next_chunk():
+                latest = self._chunk[self._row]
+                self._row += 1
+            more = self._row < len(self._chunk) or self._next_chunk()
+        else:
+            t = self.bd.state.t + self._TIME_EPSILON
+            while True:
+                # the rows of this chunk up to t
+                times = self._chunk[self._row:, self._time_idx]
+                end = self._row + int(np.searchsorted(times, t, side='right'))
+                if end > self._row:
+                    latest = self._chunk[end - 1]
+                    self._row = end
+                if end < len(self._chunk):
+                    more = True  # the next row is yet to come
+                    break
+                if not self._next_chunk():
+                    more = False
+                    break
+
+        if not more:
+            self.ended = True
+            if self.stop:
+                self.bd.state.stop = True
+
+        return self._x if latest is None else list(latest[self._output_idx])
+
+    def output(self, t: float):
+        return list(self._x)
+
 
 class CSV(SinkBlock):
 
@@ -107,15 +245,75 @@ class CSV(SinkBlock):
         self.time = time
     
     def step(self):
-        if self.time:
-            self.file.write(str(self.bd.state.t))
-            the_rest = self.inputs
+        values = [self.bd.state.t] + self.inputs if self.time else self.inputs
+        # one write per tick. See Recorder for a block that doesn't flush every tick
+        self.file.write(",".join(map(str, values)) + '\n')
+        self.file.flush()
+
+
+class Recorder(SinkBlock):
+    """Records its inputs each tick into a CSV, npy, parquet, arrow or ring file without blocking on file I/O.
+
+    Unlike :class:`CSV`, samples are buffered into preallocated chunks and written out by a background thread,
+    flushing according to a durability policy rather than every tick. All inputs must be scalars.
+    See :class:`~bdsim_realtime.recording.ChunkedRecorder` for the details.
+
+    The 'ring' format instead writes each tick straight into a memory-mapped file which survives crashes
+    and can be sliced without loading it. See :class:`~bdsim_realtime.recording.RingRecorder`
+    """
+
+    nin = -1
+    nout = 0
+
+    def __init__(
+        self,
+        file: Union[str, IOBase],
+        *inputs: Union[Block, Plug],
+        nin: int,
+        format: RecordFormat = "csv",
+        names: Optional[Sequence[str]] = None,
+        time: bool = True,
+        chunk_rows: int = 1024,
+        flush_rows: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+        fsync: bool = False,
+        capacity: int = 1 << 20,
+        **kwargs: Any
+    ):
+        """
+        :param file: path or binary file object to record to. 'ring' recordings need a path
+        :param format: 'csv', 'npy', 'parquet', 'arrow' or 'ring', defaults to 'csv'
+        :param names: name of each input's column, defaults to 'u0', 'u1', ...
+        :param time: prepend a 't' column of the simulation time, defaults to True
+        :param chunk_rows: rows buffered before being handed to the writer thread, defaults to 1024
+        :param flush_rows: if given, flush recorded rows to the file after at most this many ticks
+        :param flush_interval: if given, flush recorded rows to the file at least this often in seconds.
+            For 'ring', how often to sync the mapping to disk, defaults to None (1s for 'ring')
+        :param fsync: also fsync the file on each flush, defaults to False
+        :param capacity: 'ring' only. Number of most recent ticks kept, defaults to 2**20
+        """
+        super().__init__(nin=nin, nout=0, inputs=inputs, **kwargs)
+        self.type = "recorder"
+        self.time = time
+
+        names = list(names) if names is not None else ["u{}".format(i) for i in range(nin)]
+        assert len(names) == nin, "Got {} names for {} inputs".format(len(names), nin)
+        columns = ["t"] + names if time else names
+        if format == "ring":
+            assert isinstance(file, str), "Ring recordings must be given a path"
+            self.recorder: Union[ChunkedRecorder, RingRecorder] = RingRecorder(
+                file, columns, capacity=capacity, sync_interval=flush_interval if flush_interval is not None else 1.0)
         else:
-            self.file.write(str(self.inputs[0]))
-            the_rest = self.inputs[1:]
+            self.recorder = ChunkedRecorder(
+                file, columns, format=format, chunk_rows=chunk_rows,
+                flush_rows=flush_rows, flush_interval=flush_interval, fsync=fsync)
 
-        for inp in the_rest:
-            self.file.write(",{}".format(inp))
-        
-        self.file.write('\n')
-        self.file.flush()
+    def step(self):
+        # scalar signals are often 1-element arrays
+        row = [u.item() if isinstance(u, np.ndarray) else u for u in self.inputs]
+        if self.time:
+            row.insert(0, self.bd.state.t)
+        self.recorder.append(row)
+
+    def done(self, **kwargs):
+        self.recorder.close()
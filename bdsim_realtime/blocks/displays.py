@@ -33,6 +33,7 @@ class TunerScope(SinkBlock):
         nin=None,
         styles=None,
         labels=None,
+        rate=None,
         tuner: 'Tuner',
         **kwargs
     ):
@@ -48,6 +49,9 @@ class TunerScope(SinkBlock):
         :type scale: 2-element sequence
         :param labels: vertical axis labels
         :type labels: sequence of strings
+        :param rate: display rate to decimate the signals to before they're sent to the tuner, in samples per
+                     second. Defaults to the tuner's own
+        :type rate: float, optional
         :param grid: draw a grid, default is on. Can be boolean or a tuple of 
                      options for grid()
         :type grid: bool or sequence
@@ -110,7 +114,7 @@ class TunerScope(SinkBlock):
         super().__init__(nin=nin, inputs=inputs, **kwargs)
 
         self.tuner = tuner
-        self.scope_id = tuner.register_signal_scope(self.name, nin, styles=styles, labels=labels) \
+        self.scope_id = tuner.register_signal_scope(self.name, nin, styles=styles, labels=labels, rate=rate) \
             if tuner else None
             
         # TODO, wire width
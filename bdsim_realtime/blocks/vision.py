@@ -1,12 +1,18 @@
+import asyncio
+import itertools
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 from os import PathLike
-from threading import Thread, Lock
-from typing import Tuple, Union
+from threading import Thread, Lock, Event
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
 
 import numpy as np
 import flask
+from typing_extensions import Literal
 
 from bdsim.components import (
+    Block,
     Clock,
     SourceBlock,
     SinkBlock,
@@ -15,8 +21,128 @@ from bdsim.components import (
 )
 from bdsim.blocks.discrete import ZOH
 from bdsim_realtime.tuning.tuners import Tuner
+from bdsim_realtime.tuning.tuners import tuner as _tuner
 from bdsim_realtime.tuning.tunable_block import TunableBlock
 from bdsim_realtime.tuning.parameter import HyperParam, RangeParam
+from bdsim_realtime.video import MJPEG_BOUNDARY, FrameEncoder, VideoFormat, _FrameBroadcaster, _Subscriber, mjpeg_stream
+
+
+CaptureMode = Literal["sync", "thread"]
+
+# substrings of the names of cv2.COLOR_* conversions whose output rows depend on more than one input row
+_ROW_COUPLED_COLOR_CODES = ("BAYER", "NV12", "NV21", "YV12", "IYUV", "I420", "420")
+
+
+class RoiFrame(np.ndarray):
+    """An image of a region of interest of a larger frame, optionally downscaled. Output by :class:`Roi`.
+
+    Pixel (x, y) of the image is at `origin + scale * (x, y)` in the full frame. The vision blocks process
+    only the region they're given, output images tagged with the same region, and BLOBS maps the keypoints
+    it detects back into full-frame coordinates.
+
+    :param image: the image of the region, viewed without copying
+    :param origin: (x, y) full-frame coordinates of the image's top-left pixel
+    :param scale: full-frame pixels per image pixel, ie; `2 ** level` of an image pyramid
+    """
+
+    origin: Tuple[int, int] = (0, 0)
+    scale: int = 1
+
+    def __new__(cls, image: np.ndarray, origin: Tuple[int, int] = (0, 0), scale: int = 1):
+        frame = np.asarray(image).view(cls)
+        frame.origin = origin
+        frame.scale = scale
+        return frame
+
+    def __array_finalize__(self, obj):
+        self.origin = getattr(obj, "origin", (0, 0))
+        self.scale = getattr(obj, "scale", 1)
+
+    def __reduce__(self):
+        # keep the region when pickled, ie; sent to another process by run(executor='process')
+        return RoiFrame, (np.asarray(self), self.origin, self.scale)
+
+    def to_frame(self, x: float, y: float) -> Tuple[float, float]:
+        "Maps image coordinates to full-frame coordinates"
+        return self.origin[0] + self.scale * x, self.origin[1] + self.scale * y
+
+    def from_frame(self, x: float, y: float) -> Tuple[float, float]:
+        "Maps full-frame coordinates to image coordinates"
+        return (x - self.origin[0]) / self.scale, (y - self.origin[1]) / self.scale
+
+    def tag(self, image: np.ndarray) -> "RoiFrame":
+        "Views `image`, an image of the same region (ie; computed from this one), as a `RoiFrame` of the region"
+        return RoiFrame(image, self.origin, self.scale)
+
+
+def _with_roi(output: Any, input: Any) -> Any:
+    # tag an image computed from a region of interest with that region
+    if isinstance(input, RoiFrame) and isinstance(output, np.ndarray) and not isinstance(output, RoiFrame):
+        return input.tag(output)
+    return output
+
+
+class _FrameGrabber(Thread):
+    """Continuously reads frames from a `cv2.VideoCapture` into a small pool of reused frame buffers.
+
+    `latest()` returns the newest frame without blocking. Frames are triple-buffered: the frame
+    last returned by `latest()` and the newest frame are never written over, so a returned frame
+    stays valid until the following call to `latest()`.
+
+    :param video_capture: anything with a `cv2.VideoCapture`-like `read(image)` method
+    :param pool_size: number of frame buffers, at least 3
+    """
+
+    def __init__(self, video_capture: Any, pool_size: int = 3):
+        super().__init__(name="frame-grabber", daemon=True)
+        assert pool_size >= 3, "pool_size must be at least 3"
+        self.video_capture = video_capture
+        self._pool: List[Optional[np.ndarray]] = [None] * pool_size
+        self._lock = Lock()
+        self._ready = Event()  # set once the first frame has been read
+        self._stopped = Event()
+        self._newest: Optional[int] = None  # slot of the newest frame not yet returned by latest()
+        self._held: Optional[int] = None  # slot of the frame last returned by latest()
+        self._stamp = 0.0  # when the newest frame was read, by time.monotonic()
+        self.error: Optional[str] = None
+
+        self.frames = 0  # frames read
+        self.dropped = 0  # frames read, then overwritten before latest() could return them
+
+    def run(self):
+        slot = 0
+        while not self._stopped.is_set():
+            ok, frame = self.video_capture.read(self._pool[slot])
+            if not ok or frame is None:
+                self.error = "camera disconnected or video file ended"
+                self._ready.set()
+                return
+            self._pool[slot] = frame  # allocated by the first read into each slot, reused from then on
+
+            with self._lock:
+                if self._newest is not None:
+                    self.dropped += 1
+                self._newest = slot
+                self._stamp = time.monotonic()
+                self.frames += 1
+                slot = next(idx for idx in range(len(self._pool)) if idx != slot and idx != self._held)
+            self._ready.set()
+
+    def latest(self) -> Tuple[np.ndarray, float]:
+        "Returns the newest frame and its age in seconds. Only blocks until the very first frame has been read"
+        self._ready.wait()
+        with self._lock:
+            if self._newest is not None:
+                self._held, self._newest = self._newest, None
+            held, stamp = self._held, self._stamp
+        assert self.error is None and held is not None, "An unknown error occured in OpenCV: " + str(self.error)
+        return self._pool[held], time.monotonic() - stamp  # type: ignore
+
+    def stop(self):
+        self._stopped.set()
+        if self.is_alive():
+            self.join()
+
 
 try:
     import cv2
@@ -44,12 +170,18 @@ try:
         nin = 0
         nout = 1
 
+        # when playing a video file, how many frames ahead of the last read to decode through with grab()
+        # before seeking instead. Seeking decodes from the previous keyframe, so is only worth it for long jumps
+        MAX_SKIP_FRAMES = 64
+
         def __init__(
             self,
             source: Union[cv2.VideoCapture, int, str, PathLike],
             *,
             clock: Clock,
             resolution: Tuple[int, int] = (320, 180),
+            capture: CaptureMode = "sync",
+            pool_size: int = 3,
             **kwargs
         ):
             """
@@ -58,6 +190,12 @@ try:
                 For camera options, construct the cv2.VideoCapture object yourself using https://docs.opencv.org/4.1.0/d8/dfe/classcv_1_1VideoCapture.html#ac4107fb146a762454a8a87715d9b7c96
             :type source: Union[int, string]
             :param `*cv2_args`: Optional arguments to pass into `cv2's VideoCapture constructor`
+            :param capture: 'sync' reads each frame on the clock's tick, blocking until the camera delivers it.
+                'thread' reads frames continuously on a background thread, and each tick takes the newest
+                without waiting. The age of the frame output and the number of frames never output are kept
+                in `self.frame_age` and `self.dropped_frames`. Livestreams only
+            :param pool_size: number of reused frame buffers for capture='thread', at least 3.
+                A frame is only valid until the following tick - copy it to keep it for longer
             :param ``**kwargs``: common Block options
             :return: a VIDEOCAPTURE block
             :rtype: VideoCapture instance
@@ -72,6 +210,13 @@ try:
             for further detail.
             """
             super().__init__(clock=clock, **kwargs)
+            assert capture in ("sync", "thread"), "Unknown capture mode {}".format(capture)
+            self.capture = capture
+            self.pool_size = pool_size
+            self._grabber: Optional[_FrameGrabber] = None
+            self.frame_age = 0.0
+            self.dropped_frames = 0
+
             if isinstance(source, cv2.VideoCapture):
                 self.is_livestream = True
                 self.video_capture = source
@@ -81,15 +226,18 @@ try:
                     # coerce it into str, good if it's something like a pathlib.Path
                     source = str(source)
                 self.video_capture = cv2.VideoCapture(source)
+            assert self.is_livestream or capture == "sync", "capture='thread' only supports livestreams"
 
 
             def set_resolution(res):
                 w, h = res
+                self._stop_grabber()
                 self.video_capture.release()
                 self.video_capture = cv2.VideoCapture(source)
                 self.video_capture.set(cv2.CAP_PROP_EXPOSURE, 40)
                 self.video_capture.set(3, 320)
                 self.video_capture.set(4, 180)
+                self._restart_playback()
 
             set_resolution(resolution)
 
@@ -134,35 +282,155 @@ try:
             if not self.is_livestream:
                 # restart the video if it is
                 self.video_capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                self._restart_playback()
 
         def next(self):
+            if self.capture == "thread":
+                if self._grabber is None:
+                    # started on first use rather than in start() so that it runs in
+                    # the process that executes this block's clock (see run(executor='process'))
+                    self._grabber = _FrameGrabber(self.video_capture, self.pool_size)
+                    self._grabber.start()
+                frame, self.frame_age = self._grabber.latest()
+                self.dropped_frames = self._grabber.dropped
+                return frame
+            return self._read(self.bd.state.t)
+
+        async def async_next(self):
+            # video_capture.read() releases the GIL, so wait for the frame on a worker thread
+            # while the event loop runs other clocks' ticks (see `bdsim_realtime.async_run()`)
+            if self.capture == "thread":
+                return self.next()
             t = self.bd.state.t
-            # set the frame index if we're using a video file
+            return await asyncio.get_running_loop().run_in_executor(None, self._read, t)
+
+        def _restart_playback(self):
+            # the capture is at the start of the video file
+            self._fps = self.video_capture.get(cv2.CAP_PROP_FPS) if not self.is_livestream else 0
+            self._next_frame_n = 0  # index of the frame the next read() decodes
+            self._frame = None  # the frame last read
+
+        def _read(self, t):
+            # play video files at time t: decode sequentially, skipping frames with grab() when t runs ahead,
+            # and only seek on jumps back in time or far ahead
             if t is not None and not self.is_livestream:
-                fps = self.video_capture.get(cv2.CAP_PROP_FPS)
-                frame_n = int(round(t * fps))
-                self.video_capture.set(cv2.CAP_PROP_POS_FRAMES, frame_n)
+                frame_n = int(round(t * self._fps))
+                if frame_n == self._next_frame_n - 1 and self._frame is not None:
+                    return self._frame  # still on the frame last read
+                skip = frame_n - self._next_frame_n
+                if skip < 0 or skip > self.MAX_SKIP_FRAMES:
+                    self.video_capture.set(cv2.CAP_PROP_POS_FRAMES, frame_n)
+                else:
+                    for _ in range(skip):
+                        self.video_capture.grab()
+                self._next_frame_n = frame_n
 
             _, frame = self.video_capture.read()
             assert (
                 frame is not None
             ), "An unknown error occured in OpenCV: camera disconnected or video file ended"
+            self._frame = frame
+            self._next_frame_n += 1
             return frame
 
         def output(self, t=None):
-            # set the frame index if we're using a video file
-            if t is not None and not self.is_livestream:
-                fps = self.video_capture.get(cv2.CAP_PROP_FPS)
-                frame_n = int(round(t * fps))
-                self.video_capture.set(cv2.CAP_PROP_POS_FRAMES, frame_n)
+            # hold the frame read by next(). Only read one here if next() hasn't run yet,
+            # ie; while bdsim evaluates the diagram at compile time
+            if getattr(self._x, "ndim", 0) < 2:
+                self._x = self._read(t)
+            return [self._x]
 
-            _, frame = self.video_capture.read()
-            assert (
-                frame is not None
-            ), "An unknown error occured in OpenCV: camera disconnected or video file ended"
-            return [frame]
+        def done(self, **kwargs):
+            self._stop_grabber()
+
+        def _stop_grabber(self):
+            if self._grabber is not None:
+                self._grabber.stop()
+                self._grabber = None
+
+    
+    class Roi(FunctionBlock, TunableBlock):
+        """
+        :blockname:`ROI`
+
+        Crops a frame to a region of interest and optionally downscales it, so that the vision blocks
+        downstream only process that region. Outputs a :class:`RoiFrame`.
+
+        .. table::
+        :align: left
+
+        +------------+-------------+---------+
+        | inputs     | outputs     |  states |
+        +------------+-------------+---------+
+        | 1          | 1           | 0       |
+        +------------+-------------+---------+
+        | A(H, W, C) | A(h, w, C)  |         |
+        +------------+-------------+---------+
+        """
+
+        type = "roi"
+
+        nin = 1
+        nout = 1
+
+        def __init__(self, input, rect=None, level=0, track=None, **kwargs):
+            """
+            :param input: the frame
+            :param rect: (x, y, width, height) of the region in the frame, defaults to the whole frame
+            :param level: number of times to halve the region's resolution, through an image pyramid
+                (`cv2.pyrDown()`), defaults to 0. The region itself is a view of the frame, not a copy
+            :param track: a block that outputs keypoints, ie; BLOBS. If given, each tick's region is a `rect`-sized
+                window centred on the keypoints it output on the previous tick, or the whole frame while there were none
+            :param ``**kwargs``: common Block options
+            """
+            super().__init__(inputs=[input], nin=1, nout=1, **kwargs)
+            assert track is None or rect is not None, "rect must be given to size the tracking window"
+
+            self.rect = rect
+            self.level = self._param("level", level, min=0, max=4, step=1)
+            self.track = track
+            self._pyramid: List[Optional[np.ndarray]] = []  # reused buffers of each downscaled level
+
+        def output(self, _t=None):
+            [frame] = self.inputs
+            x, y, w, h = self._region(frame)
+            roi = frame[y:y + h, x:x + w]
+            for level in range(self.level):
+                if len(self._pyramid) <= level:
+                    self._pyramid.append(None)
+                roi = self._pyramid[level] = cv2.pyrDown(roi, dst=self._pyramid[level])
+
+            origin, scale = (x, y), 2 ** self.level
+            if isinstance(frame, RoiFrame):  # a region of a region
+                origin, scale = frame.to_frame(x, y), frame.scale * scale
+            return [RoiFrame(roi, origin, scale)]
+
+        def _region(self, frame):
+            frame_h, frame_w = frame.shape[:2]
+            if self.rect is None:
+                return 0, 0, frame_w, frame_h
+
+            x, y, w, h = self.rect
+            if self.track is not None:
+                # the previous tick's keypoints - this block runs before the tracked one
+                [keypoints] = getattr(self.track, "output_values", None) or [None]
+                if not keypoints:
+                    return 0, 0, frame_w, frame_h  # lost, search the whole frame
+                centre = np.mean([kp.pt for kp in keypoints], axis=0)
+                if isinstance(frame, RoiFrame):
+                    centre = frame.from_frame(*centre)
+                x, y = int(round(centre[0] - w / 2)), int(round(centre[1] - h / 2))
+
+            # keep the window inside the frame
+            w, h = min(w, frame_w), min(h, frame_h)
+            return min(max(x, 0), frame_w - w), min(max(y, 0), frame_h - h), w, h
 
     
+    # The image processing blocks below write their outputs into buffers that they reuse from tick to tick
+    # (through OpenCV's `dst` arguments) rather than allocating new frames. Their outputs are therefore only
+    # valid until the block's next tick - copy them to keep them for longer. Blocks on other clocks are given
+    # a copy taken at the end of the tick, so never see a frame being overwritten (see `run()`'s executors).
+
     class CvtColor(FunctionBlock, TunableBlock):
 
         type = "cvtcolor"
@@ -176,14 +444,28 @@ try:
             super().__init__(inputs=[input], nin=1, nout=1, **kwargs)
 
             self.cvt_code = cvt_code
+            self._dst = None
             # TODO: turn cvt_code into a param:
             # self.cvt_code = self._param('cvt_code', cvt_code, oneof=[getattr(
             #     cv2, code) for code in dir(cv2) if code.startswith('COLOR_')])
 
+        @property
+        def pointwise(self) -> bool:
+            # chroma-subsampled and bayer conversions mix neighbouring rows
+            return not any(
+                coupled in name
+                for name in dir(cv2) if name.startswith("COLOR_") and getattr(cv2, name) == self.cvt_code
+                for coupled in _ROW_COUPLED_COLOR_CODES
+            )
+
         def output(self, _t=None):
             [input] = self.inputs
+            converted = self._dst = self._apply(input, self._dst)
+            return [_with_roi(converted, input)]
+
+        def _apply(self, input, dst):
             try:
-                converted = cv2.cvtColor(input, self.cvt_code)
+                return cv2.cvtColor(input, self.cvt_code, dst=dst)
             except AttributeError as e:
                 raise Exception(
                     "Available methods are: {methods}".format(
@@ -192,7 +474,6 @@ try:
                         )
                     )
                 ) from e
-            return [converted]
 
     
     class InRange(FunctionBlock, TunableBlock):
@@ -214,14 +495,29 @@ try:
                 "upper", upper, min=(0, 0, 0), max=(255, 255, 255), step=1
             )
             self.enable = self._param("enable", enable)
+            self._dst = None
+            self._ones = np.ones((0, 0), np.uint8)  # the mask output while disabled
+
+        pointwise = True
 
         def output(self, _t=None):
             [input] = self.inputs
             if self.enable:
-                mask = cv2.inRange(input, self.lower, self.upper)
+                mask = self._dst = self._apply(input, self._dst)
             else:
-                mask = np.ones(input.shape[:2], np.uint8)
-            return [mask]
+                if self._ones.shape != input.shape[:2]:
+                    self._ones = np.ones(input.shape[:2], np.uint8)
+                    self._ones.flags.writeable = False  # shared by every tick
+                mask = self._ones
+            return [_with_roi(mask, input)]
+
+        def _apply(self, input, dst):
+            if self.enable:
+                return cv2.inRange(input, self.lower, self.upper, dst=dst)
+            if dst is None or dst.shape != input.shape[:2] or dst.dtype != np.uint8:
+                dst = np.empty(input.shape[:2], np.uint8)
+            dst.fill(1)
+            return dst
 
     
     class Mask(FunctionBlock):
@@ -232,11 +528,15 @@ try:
 
         def __init__(self, input, **kwargs):
             super().__init__(inputs=[input], nin=2, nout=1, **kwargs)
+            self._dst = None
 
         def output(self, _t=None):
             [input, mask] = self.inputs
-            masked = cv2.bitwise_and(input, input, mask=mask)
-            return [masked]
+            if self._dst is not None and self._dst.shape == input.shape and self._dst.dtype == input.dtype:
+                # only the masked pixels are written, so clear the rest from the last tick
+                self._dst.fill(0)
+            masked = self._dst = cv2.bitwise_and(input, input, dst=self._dst, mask=mask)
+            return [_with_roi(masked, input)]
 
     
     class Threshold(FunctionBlock):
@@ -269,11 +569,18 @@ try:
             self.lower = lower
             self.upper = upper
             self.method = getattr(cv2, "THRESH_{method}".format(method=method.upper()))
+            self._dst = None
+
+        pointwise = True
 
         def output(self, _t=None):
             [input] = self.inputs
-            _, output = cv2.threshold(input, self.lower, self.upper, self.method)
-            return [output]
+            output = self._dst = self._apply(input, self._dst)
+            return [_with_roi(output, input)]
+
+        def _apply(self, input, dst):
+            _, output = cv2.threshold(input, self.lower, self.upper, self.method, dst=dst)
+            return output
 
     class KernelParam2D(HyperParam):
 
@@ -336,14 +643,21 @@ try:
                 "iterations", iterations, min=0, max=10, step=1
             )
             self.enable = self._param("enable", enable)
+            self._dst = None
+
+        pointwise = False
 
         def output(self, _t=None):
             [input] = self.inputs
-            if self.enable:
-                output = self.diadic_func(input, self.kernel, self.iterations)
-            else:
-                output = input
-            return [output]
+            output = self._apply(input, self._dst)
+            if output is not input:
+                self._dst = output
+            return [_with_roi(output, input)]
+
+        def _apply(self, input, dst):
+            if not self.enable:
+                return input
+            return self.diadic_func(input, self.kernel, dst=dst, iterations=self.iterations)
 
     
     class Erode(_Morphological):
@@ -378,63 +692,47 @@ try:
             )
 
     
-    class OpenMask(SubsystemBlock, TunableBlock):
-
-        type = "openmask"
+    class _MorphologyEx(SubsystemBlock, TunableBlock):
+        type = "morphologyex"
 
         nin = 1
         nout = 1
 
-        def __init__(self, input, iterations=1, kernel=("ellipse", 3, 3), **kwargs):
-            super().__init__(inputs=[input], nin=1, nout=1, **kwargs)
+        pointwise = False
 
-            morphblock_kwargs = dict(
-                input=None,
-                kernel=self._param("kernel", KernelParam2D(kernel), ret_param=True),
-                iterations=self._param("iterations", iterations, ret_param=True),
-                bd=self.bd,
-                is_subblock=True,
-            )
+        def __init__(self, input, op, iterations, kernel, **kwargs):
+            super().__init__(inputs=[input], nin=1, nout=1, **kwargs)
 
-            # I would expect cv2.morphologyEx() to be faster than an cv2.erode -> cv2.dilate
-            # but preliminary benchmarks show this isn't the case.
-            self.dilate = Dilate(**morphblock_kwargs)
-            self.erode = Erode(**morphblock_kwargs)
+            self.op = op
+            self.kernel = self._param("kernel", KernelParam2D(kernel))
+            self.iterations = self._param("iterations", iterations, min=1, max=10, step=1)
+            self._dst = None
 
         def output(self, _t=None):
-            self.erode.inputs = self.inputs
-            eroded = self.erode.output()
-            self.dilate.inputs = eroded
-            return self.dilate.output()
+            [input] = self.inputs
+            output = self._dst = self._apply(input, self._dst)
+            return [_with_roi(output, input)]
 
-    
-    class CloseMask(SubsystemBlock, TunableBlock):
+        def _apply(self, input, dst):
+            return cv2.morphologyEx(input, self.op, self.kernel, dst=dst, iterations=self.iterations)
 
-        type = "closemask"
+    
+    class OpenMask(_MorphologyEx):
+        "Erodes then dilates, with a single `cv2.morphologyEx()`"
 
-        nin = 1
-        nout = 1
+        type = "openmask"
 
         def __init__(self, input, iterations=1, kernel=("ellipse", 3, 3), **kwargs):
-            # TODO Propagate name in some way to aid debugging
-            super().__init__(inputs=[input], nin=1, nout=1, **kwargs)
-            args = dict(
-                input=None,
-                tinker=kwargs["tinker"],
-                kernel=self._param("kernel", kernel),
-                iterations=self._param("iterations", iterations, min=1, max=10, step=1),
-                bd=self.bd,
-                is_subblock=True,
-            )
+            super().__init__(input, op=cv2.MORPH_OPEN, iterations=iterations, kernel=kernel, **kwargs)
 
-            self.dilate = Dilate(**args)
-            self.erode = Erode(**args)
+    
+    class CloseMask(_MorphologyEx):
+        "Dilates then erodes, with a single `cv2.morphologyEx()`"
 
-        def output(self, _t=None):
-            self.dilate.inputs = self.inputs
-            dilated = self.dilate.output()
-            self.erode.inputs = dilated
-            return self.erode.output()
+        type = "closemask"
+
+        def __init__(self, input, iterations=1, kernel=("ellipse", 3, 3), **kwargs):
+            super().__init__(input, op=cv2.MORPH_CLOSE, iterations=iterations, kernel=kernel, **kwargs)
 
     
     class Blobs(FunctionBlock, TunableBlock):
@@ -544,12 +842,160 @@ try:
 
             self.detector = cv2.SimpleBlobDetector_create(params)
 
+        pointwise = False
+
         def output(self, _t=None):
             [input] = self.inputs
+            return [self._apply(input, None)]
+
+        def _apply(self, input, dst):
             keypoints = self.detector.detect(input)
-            return [keypoints[: self.top_k] if self.top_k else keypoints]
+            keypoints = keypoints[: self.top_k] if self.top_k else keypoints
+            if isinstance(input, RoiFrame):
+                # detected in a region of the frame - map them back into the full frame
+                for keypoint in keypoints:
+                    keypoint.pt = input.to_frame(*keypoint.pt)
+                    keypoint.size *= input.scale
+            return keypoints
 
     
+    class _MjpegEncoder:
+        """JPEG-encodes a DISPLAY's frames for its MJPEG stream clients, on a pool of worker threads.
+
+        `submit()` returns straight away. It only copies the frame, into a reused buffer, if a client is due
+        a frame - nothing is encoded while nobody is watching. Each frame is encoded once per JPEG quality
+        that its clients asked for, and published to the clients of that quality through a `_FrameBroadcaster`,
+        so that they share the one encoded part. Frames arriving while every worker is busy are dropped, and
+        counted in `dropped`.
+
+        :param workers: number of encoder threads. `cv2.imencode()` releases the GIL, so they encode in parallel
+        """
+
+        BOUNDARY = MJPEG_BOUNDARY
+
+        def __init__(self, workers: int = 2):
+            assert workers >= 1, "workers must be at least 1"
+            self.workers = workers
+            self._pool: Optional[ThreadPoolExecutor] = None
+            self._lock = Lock()
+            self._broadcasters: Dict[int, _FrameBroadcaster] = {}  # by JPEG quality
+            self._free: List[np.ndarray] = []  # frame buffers not being encoded
+            self._in_flight = 0
+            self.encoded = 0
+            self.dropped = 0
+
+        @property
+        def viewers(self) -> List[_Subscriber]:
+            "The stream's clients, with their frame drop and latency counters"
+            return [viewer for broadcaster in self._broadcasters.values() for viewer in broadcaster.subscribers]
+
+        def stream(self, quality: int, fps: Optional[float] = None):
+            "Yields the multipart parts of an MJPEG stream of the submitted frames, for a `flask.Response`"
+            with self._lock:
+                if quality not in self._broadcasters:
+                    self._broadcasters[quality] = _FrameBroadcaster()
+                broadcaster = self._broadcasters[quality]
+            return mjpeg_stream(broadcaster, fps)
+
+        def submit(self, frame: np.ndarray):
+            now = time.monotonic()
+            with self._lock:
+                qualities = [quality for quality, broadcaster in self._broadcasters.items() if broadcaster.due(now)]
+                if not qualities:
+                    return
+                if self._in_flight >= self.workers:
+                    self.dropped += 1
+                    return
+                self._in_flight += 1
+                buffer = self._free.pop() if self._free else None
+
+            # the frame is only valid until the next tick, so copy it for the worker
+            if buffer is None or buffer.shape != frame.shape or buffer.dtype != frame.dtype:
+                buffer = np.empty_like(frame)
+            np.copyto(buffer, frame)
+
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="mjpeg-encoder")
+            self._pool.submit(self._encode, now, buffer, qualities)
+
+        def _encode(self, stamp: float, frame: np.ndarray, qualities: List[int]):
+            try:
+                for quality in qualities:
+                    success, jpg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+                    assert success
+                    # one immutable part per quality - joined from a view of the encoded buffer, and shared by every client
+                    part = b"".join((self.BOUNDARY, memoryview(jpg), b"\r\n"))
+                    self._broadcasters[quality].publish(part, stamp)  # ignored if a worker published a newer frame
+                with self._lock:
+                    self.encoded += 1
+            except Exception:
+                logging.exception("Failed to encode an MJPEG stream frame")
+            finally:
+                with self._lock:
+                    self._free.append(frame)
+                    self._in_flight -= 1
+
+        def close(self):
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+                self._pool = None
+            for broadcaster in self._broadcasters.values():
+                broadcaster.close()
+
+
+    class _TunerVideoEncoder:
+        """Encodes a DISPLAY's frames for a tuner's gui, which sends them over its own link (ie; `TcpClientTuner` to the webapp).
+
+        Frames are encoded in order on one worker thread, so that 'raw' frames can be sent as deltas. `submit()`
+        drops the frame, counting it in `dropped`, while the last one is still being encoded or waiting for
+        the link - so a slow link costs no encoding.
+
+        :param tuner: the tuner to send the frames with
+        :param name: name of the stream in the tuner's gui
+        :param format: see `bdsim_realtime.video`
+        :param quality: JPEG / WebP quality, 0-100
+        """
+
+        def __init__(self, tuner: Tuner, name: str, format: VideoFormat, quality: int):
+            self.tuner = tuner
+            self.id = tuner.register_video_stream(name, format)
+            self._frame_encoder = FrameEncoder(self.id, format, quality)
+            self._pool: Optional[ThreadPoolExecutor] = None
+            self._buffer: Optional[np.ndarray] = None
+            self._busy = False
+            self.encoded = 0
+            self.dropped = 0
+
+        def submit(self, frame: np.ndarray):
+            if self._busy or not self.tuner.video_stream_ready(self.id):
+                self.dropped += 1
+                return
+
+            # the frame is only valid until the next tick, so copy it for the worker
+            if self._buffer is None or self._buffer.shape != frame.shape or self._buffer.dtype != frame.dtype:
+                self._buffer = np.empty_like(frame)
+            np.copyto(self._buffer, frame)
+
+            self._busy = True
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(1, thread_name_prefix="video-encoder")
+            self._pool.submit(self._encode)
+
+        def _encode(self):
+            try:
+                self.tuner.send_video_frame(self.id, self._frame_encoder.encode(self._buffer))
+                self.encoded += 1
+            except Exception:
+                logging.exception("Failed to encode a video frame")
+            finally:
+                self._busy = False
+
+        def close(self):
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+                self._pool = None
+
+
     class Display(SinkBlock):
         """
         :blockname:`DISPLAY`
@@ -576,44 +1022,72 @@ try:
         FPS_COLOR = (0, 255, 255)  # yellow
 
         def __init__(
-            self, input, name="Display", show_fps=False, web_stream_host=None, **kwargs
+            self,
+            input,
+            name="Display",
+            show_fps=False,
+            web_stream_host=None,
+            stream_quality=80,
+            stream_fps=None,
+            encoder_threads=2,
+            stream_format: VideoFormat = "jpeg",
+            **kwargs
         ):
+            """
+            :param web_stream_host: if given, stream the frames instead of showing them in a window. A Tuner to
+                stream them to its gui (ie; served over HTTP by a `TcpClientTuner`, or over its link to the webapp
+                in `stream_format` if it has `link_video=True`).
+                Otherwise host an MJPEG stream over HTTP: True on the first free port from 7645, or a (host, port)
+                tuple. True streams to the current tuner instead if the block is made in a `with tuner:` block
+            :param stream_quality: default JPEG quality of the stream, 0-100. MJPEG clients may ask for another with
+                a `?quality=` query parameter
+            :param stream_fps: default maximum frame rate of the MJPEG stream, defaults to every frame.
+                Clients may ask for another with a `?fps=` query parameter
+            :param encoder_threads: number of threads to JPEG-encode the MJPEG stream's frames on, off the diagram's thread
+            :param stream_format: 'jpeg', 'webp' or 'raw' (lossless, sent as deltas) when streaming to a Tuner.
+                See `bdsim_realtime.video`
+            """
             super().__init__(inputs=[input], nin=1, name=name, **kwargs)
             self.show_fps = show_fps
+            if web_stream_host is True and _tuner.global_current_tuner:
+                # the tuner's gui shows the stream already, so don't probe for a port to host another
+                web_stream_host = _tuner.global_current_tuner
             self.web_stream_host = web_stream_host
+            self.stream_quality = stream_quality
+            self.stream_fps = stream_fps
+            self.stream_format = stream_format
+            assert stream_format == "jpeg" or isinstance(web_stream_host, Tuner), \
+                "MJPEG streams are JPEG only. Stream to a Tuner for other formats"
 
-            if web_stream_host:
-                self.new_frame = None
-                # maintain a lock for each mjpeg http stream. Can't think of a better way to do this
-                self.new_frame_locks = []
+            # created in start() for a tuner, once the block's name is final
+            self.encoder: Union[_MjpegEncoder, _TunerVideoEncoder, None] = None
+            if web_stream_host and not isinstance(web_stream_host, Tuner):
+                self.encoder = _MjpegEncoder(encoder_threads)
 
             if self.show_fps:
                 self.fps = 30  # seems a decent init value
                 self.prev_t = None
+                # the fps is drawn on a copy: the input is another block's output buffer, maybe read-only or shared
+                self._overlay: Optional[np.ndarray] = None
+
+        @property
+        def viewers(self) -> List[_Subscriber]:
+            "The MJPEG stream's clients, with per-client frame drop and latency counters to spot those falling behind"
+            return self.encoder.viewers if isinstance(self.encoder, _MjpegEncoder) else []
 
         def start(self, state):
             # TODO: web-stream via HTTP stream over raw sockets so it'll work in micropython
-            # OR/AND, do so over websockets without jpeg encoding
-            if self.web_stream_host is not None:
+            if isinstance(self.web_stream_host, Tuner):
+                if self.encoder is None:
+                    self.encoder = _TunerVideoEncoder(self.web_stream_host, self.name, self.stream_format, self.stream_quality)
 
-                def video_feed():
-                    def poll_frames():
-                        # maintain a lock for the lifetime of this generator - cleanup when client d/c's
-                        new_frame_lock = Lock()
-                        self.new_frame_locks.append(new_frame_lock)
-                        try:
-                            while True:
-                                new_frame_lock.acquire()
-                                yield (
-                                    b"--frame\r\nContent-Type: image/jpeg\r\n\r\n"
-                                    + bytearray(self.new_frame)
-                                    + b"\r\n"
-                                )
-                        except GeneratorExit:
-                            self.new_frame_locks.remove(new_frame_lock)
+            elif self.web_stream_host is not None:
 
+                def video_feed():
+                    quality = flask.request.args.get("quality", self.stream_quality, type=int)
+                    fps = flask.request.args.get("fps", self.stream_fps, type=float)
                     return flask.Response(
-                        poll_frames(),
+                        self.encoder.stream(min(max(quality, 0), 100), fps),
                         mimetype="multipart/x-mixed-replace; boundary=frame",
                     )
 
@@ -639,12 +1113,8 @@ try:
                         host, port = self.web_stream_host
                         app.run(host, port)
 
-                if isinstance(self.web_stream_host, Tuner):
-                    self.web_stream_host.register_video_stream(
-                        video_feed, name=self.name
-                    )
-                else:  # host it ourselves in another thread
-                    Thread(target=host_web_stream, daemon=True).start()
+                # host it ourselves in another thread
+                Thread(target=host_web_stream, daemon=True).start()
 
         def step(self):
             [input] = self.inputs
@@ -656,8 +1126,11 @@ try:
                 self.fps = (
                     self.FPS_AV_FACTOR * frequency + self.FPS_AV_FACTOR_INV * self.fps
                 )
+                if self._overlay is None or self._overlay.shape != input.shape or self._overlay.dtype != input.dtype:
+                    self._overlay = np.empty(input.shape, input.dtype)
+                np.copyto(self._overlay, input)
                 input = cv2.putText(
-                    input,
+                    self._overlay,
                     "%d FPS" % int(self.fps),
                     (0, 16),
                     cv2.FONT_HERSHEY_PLAIN,
@@ -666,23 +1139,19 @@ try:
                 )  # use white if it's grayscale
                 self.prev_t = self.bd.state.t
 
-            # just quick and dirty for now
             if self.web_stream_host:
-                success, jpg = cv2.imencode(".jpg", input)
-                assert success
-                self.new_frame = jpg
-
-                # let mjpeg stream clients know that a new frame is available
-                for lock in self.new_frame_locks:
-                    if lock.locked():
-                        lock.release()
+                # encoded off this thread, and only if a client is due a frame or the tuner's link is free
+                self.encoder.submit(input)
             else:
                 cv2.imshow(self.name, input)
                 # cv2 needs this to actually show. this blocking maybe matplotlib could do it instead.
                 cv2.waitKey(1)
 
         def done(self, block):
-            if not self.web_stream_host:
+            if self.web_stream_host:
+                if self.encoder is not None:
+                    self.encoder.close()
+            else:
                 # TODO: Check if overkill to ensure that self.name never changes?
                 cv2.destroyWindow(self.name)
 
@@ -697,17 +1166,164 @@ try:
         def __init__(self, image, keypoints, color=(0, 0, 255), **kwargs):
             super().__init__(inputs=[image, keypoints], nin=2, nout=1, **kwargs)
             self.color = color
+            self._dst = np.array([])
 
         def output(self, _t=None):
             [image, keypoints] = self.inputs
-            drawn = cv2.drawKeypoints(
+            if isinstance(image, RoiFrame):
+                # only draw on the region, so map the keypoints from full-frame coordinates into it
+                keypoints = [
+                    cv2.KeyPoint(*image.from_frame(*kp.pt), kp.size / image.scale, kp.angle, kp.response, kp.octave, kp.class_id)
+                    for kp in keypoints
+                ]
+            drawn = self._dst = cv2.drawKeypoints(
                 image,
                 keypoints,
-                np.array([]),
+                self._dst,
                 self.color,
                 cv2.DRAW_MATCHES_FLAGS_DRAW_RICH_KEYPOINTS,
             )
-            return [drawn]
+            return [_with_roi(drawn, image)]
+
+
+    class VisionPipeline(FunctionBlock):
+        """Runs a linear chain of single-input vision blocks as one block. Created by :func:`fuse_vision_chains`.
+
+        Each stage computes straight from the previous stage's output into a scratch buffer owned by the pipeline,
+        without going through the diagram's wires. Consecutive pointwise stages (ie; CVTCOLOR -> INRANGE) are
+        computed `TILE_ROWS` rows at a time, so that each band of rows is still in cache when the next stage
+        reads it. With several threads, each computes one contiguous run of the bands.
+
+        Only the last stage's output is updated - the intermediate stages' outputs aren't available.
+
+        :param stages: the blocks to run, in order. Each reads the output of the one before it
+        :param threads: number of threads to compute bands of pointwise stages on, defaults to 1.
+            OpenCV may also parallelise each call itself, see `cv2.setNumThreads()`
+        """
+
+        type = "visionpipeline"
+
+        nin = 1
+        nout = 1
+
+        TILE_ROWS = 32
+
+        def __init__(self, stages: Sequence[Block], threads: int = 1, **kwargs):
+            super().__init__(nin=1, nout=1, name=" -> ".join(str(b) for b in stages), **kwargs)
+            assert threads >= 1, "threads must be at least 1"
+            self.stages = list(stages)
+            self.threads = threads
+            self._buffers: List[Any] = [None] * len(self.stages)
+            self._segments = [
+                (pointwise, list(idxs))
+                for pointwise, idxs in itertools.groupby(range(len(self.stages)), key=lambda idx: self.stages[idx].pointwise)
+            ]
+            self._band_shapes: Dict[int, Tuple[int, ...]] = {}  # input shape of each pointwise segment, by first stage
+            self._pool: Optional[ThreadPoolExecutor] = None
+
+        def output(self, _t=None):
+            [x] = self.stages[0].inputs
+            input = x
+            for pointwise, idxs in self._segments:
+                # every stage's output covers the same region of interest as the input, if it's a RoiFrame
+                if pointwise:
+                    x = _with_roi(self._run_bands(x, idxs), input)
+                else:
+                    for idx in idxs:
+                        x = _with_roi(self._run_stage(idx, x), input)
+            self.stages[-1].output_values = [x]
+            return [x]
+
+        def done(self, **kwargs):
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+        def _run_stage(self, idx, x):
+            out = self.stages[idx]._apply(x, self._buffers[idx])
+            if out is not x:
+                self._buffers[idx] = out
+            return out
+
+        def _run_bands(self, x, idxs):
+            if self._band_shapes.get(idxs[0]) != x.shape:
+                # size the buffers with one full-frame pass
+                self._band_shapes[idxs[0]] = x.shape
+                for idx in idxs:
+                    x = self._run_stage(idx, x)
+                return x
+
+            def run_bands(starts):
+                for start in starts:
+                    y = x[start:start + self.TILE_ROWS]
+                    for idx in idxs:
+                        dst = self._buffers[idx][start:start + self.TILE_ROWS]
+                        out = self.stages[idx]._apply(y, dst)
+                        if out is not dst:
+                            dst[...] = out  # OpenCV didn't write in place, ie; a parameter changed the output type
+                        y = dst
+
+            starts = range(0, x.shape[0], self.TILE_ROWS)
+            if self.threads > 1:
+                if self._pool is None:
+                    # created on first use, in the process that runs this block's clock
+                    self._pool = ThreadPoolExecutor(self.threads - 1, thread_name_prefix="vision-pipeline")
+                # one contiguous run of bands per thread. The calling thread computes the first itself
+                n = len(starts)
+                runs = [starts[i * n // self.threads:(i + 1) * n // self.threads] for i in range(self.threads)]
+                others = [self._pool.submit(run_bands, run) for run in runs[1:]]
+                run_bands(runs[0])
+                for other in others:
+                    other.result()
+            else:
+                run_bands(starts)
+            return self._buffers[idxs[-1]]
+
+
+    _FUSABLE = (CvtColor, InRange, Threshold, _Morphological, _MorphologyEx, Blobs)
+
+
+    def fuse_vision_chains(plan: List[Block], threads: int = 1) -> List[Block]:
+        """Replaces each linear chain of single-input vision blocks in a clock's plan with a :class:`VisionPipeline`.
+
+        A chain continues from one block to the next while the next is its only consumer, so no other block
+        reads the intermediate outputs. The last block of a chain must only be read by blocks in the same plan.
+        Used by `run(fuse_vision=...)`.
+
+        :param plan: a clock's blocks in execution order, as planned by `run()`
+        :param threads: see :class:`VisionPipeline`
+        :return: the plan with each chain's blocks replaced by a pipeline, in the place of its last block
+        """
+        in_plan = set(plan)
+
+        def consumers(b: Block) -> List[Block]:
+            return [wire.end.block for wires in b.output_wires for wire in wires]
+
+        def fusable(b: Block) -> bool:
+            return isinstance(b, _FUSABLE) and b in in_plan
+
+        chained = set()
+        pipelines: Dict[Block, VisionPipeline] = {}  # by the last block of their chain
+        for b in plan:
+            if b in chained or not fusable(b):
+                continue
+
+            chain = [b]
+            while True:
+                next_blocks = consumers(chain[-1])
+                if len(next_blocks) != 1 or not fusable(next_blocks[0]):
+                    break
+                chain.append(next_blocks[0])
+            if any(consumer not in in_plan for consumer in consumers(chain[-1])):
+                chain.pop()  # its output is needed by another clock
+
+            if len(chain) >= 2:
+                chained.update(chain)
+                pipeline = pipelines[chain[-1]] = VisionPipeline(chain, threads=threads)
+                # it outputs the chain's output, to the blocks wired to its last block
+                pipeline.output_wires = chain[-1].output_wires
+
+        return [pipelines.get(b, b) for b in plan if b not in chained or b in pipelines]
 
 
 except ImportError:
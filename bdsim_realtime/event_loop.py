@@ -0,0 +1,296 @@
+import asyncio
+import contextvars
+import logging
+from time import perf_counter
+from typing import Any, Callable, List, Optional, Set, Tuple
+
+from bdsim import Block, BlockDiagram, BDSimState
+from bdsim.components import Clock, ClockedBlock
+
+from .tuning import Tuner
+from .scheduling import OverrunHandling, OverrunPolicy
+from .timing import ClockTimings, TickTimings
+from .run import SETUP_WAIT_BUFFER, CompiledPlan, _clocked_plans, _report_overruns, _unbind_inputs, exec_plan_scheduled
+
+
+def async_run(
+    bd: BlockDiagram,
+    max_time: Optional[float] = None,
+    tuner: Optional[Tuner] = None,
+    timings: Optional[TickTimings] = None,
+    overrun: OverrunPolicy = "catchup",
+    use_uvloop: bool = True
+):
+    """Execute a block-diagram in real-time on a new asyncio event loop. See :func:`arun`.
+
+    :param use_uvloop: run on a `uvloop` event loop if it is installed, defaults to True
+    """
+    loop = None
+    if use_uvloop:
+        try:
+            import uvloop
+            loop = uvloop.new_event_loop()
+        except ImportError:
+            logging.warning("uvloop is not installed. Falling back to the default asyncio event loop")
+    if loop is None:
+        loop = asyncio.new_event_loop()
+
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(arun(bd, max_time, tuner, timings, overrun))
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+async def arun(
+    bd: BlockDiagram,
+    max_time: Optional[float] = None,
+    tuner: Optional[Tuner] = None,
+    timings: Optional[TickTimings] = None,
+    overrun: OverrunPolicy = "catchup"
+):
+    """Execute a block-diagram in real-time on the running asyncio event loop.
+
+    Each tick is dispatched by `loop.call_at()` at its deadline. Blocks may define coroutine
+    `async_next()`, `async_output(t)` or (for SinkBlocks) `async_step()` methods, which are
+    awaited instead of `next()`, `output(t)` and `step()`. While a block awaits ie; a frame or packet,
+    the loop goes on to run other clocks' ticks and any other tasks, such as a web server.
+    Clocks whose plans don't await anything are run straight from the loop's timer callbacks.
+    Tick start times are only as precise as the loop's timers, typically around a millisecond.
+
+    Like `run(executor='thread')` clock periods needn't be multiples of eachother, but a clock's
+    blocks must not depend on another clock's blocks being mid-tick.
+
+    :param bd: the block-diagram to run
+    :param max_time: stop after this many seconds, defaults to running forever
+    :param tuner: tuner to update after each tick of the most frequent clock
+    :param timings: if given, record per-tick and per-block timing of every clock into it.
+        See :class:`~bdsim_realtime.timing.TickTimings`
+    :param overrun: what to do when a tick finishes after its next deadline, defaults to running the late ticks
+        back-to-back. See :class:`~bdsim_realtime.scheduling.OverrunHandling`
+    """
+    scheduler = _LoopScheduler(asyncio.get_running_loop(), overrun)
+
+    state = bd.state = _AsyncState()
+    state.T = max_time
+
+    if not bd.compiled:
+        bd.compile()
+        print("Compiled!\n")
+
+    clock2plan = _clocked_plans(bd, check_periods=False)
+
+    bd.start(state=state)
+
+    if timings:
+        timings.attach(clock2plan, tuner)
+
+    if tuner:
+        tuner.setup()
+
+    last_most_frequent_clock = sorted(bd.clocklist, key=lambda c: c.T + c.offset)[0]
+
+    start_time = scheduler.time() + SETUP_WAIT_BUFFER
+
+    print("Executing {} asynchronously:".format(max_time or "forever"))
+
+    for priority, (clock, plan) in enumerate(clock2plan.items()):
+        compiled = AsyncCompiledPlan(plan, timings=timings[clock] if timings else None, priority=priority)
+        scheduled_time = start_time + clock.offset
+        print("{} <SCHEDULED for {}>{}:{}".format(
+            clock, scheduled_time, ' (async)' if compiled.is_async else '',
+            ''.join('\n\t{}. {}{}'.format(idx, b, ' (clocked)' if isinstance(b, ClockedBlock) else '') for idx, b in enumerate(plan))))
+        scheduler.enterabs(
+            scheduled_time,
+            priority=priority,
+            action=exec_plan_async if compiled.is_async else exec_plan_scheduled,
+            argument=(
+                clock,
+                compiled,
+                state,
+                scheduler,
+                scheduled_time,
+                scheduled_time,
+                tuner if clock is last_most_frequent_clock else None))
+
+    try:
+        await scheduler.finished
+    finally:
+        state.stop = True
+        scheduler.cancel()
+        bd.done()
+        _unbind_inputs(bd.blocklist)
+
+    _report_overruns(scheduler)
+    if timings:
+        print(timings.summary())
+    print("Realtime Execution Stopped AS EXPECTED")
+
+
+class AsyncCompiledPlan(CompiledPlan):
+    """A :class:`~bdsim_realtime.run.CompiledPlan` that also resolves each block's coroutine variants.
+
+    Each of `async_steps` is a `(block, next, execute, is_sink, feeds, await_next, await_execute)` tuple,
+    where `next` and `execute` are `block.async_next` and `block.async_output` / `block.async_step`
+    where the block defines them (and the corresponding `await_` flag is True), otherwise as in `steps`.
+    """
+
+    __slots__ = ('async_steps', 'is_async')
+
+    def __init__(self, blocks: List[Block], **kwargs: Any):
+        super().__init__(blocks, **kwargs)
+        self.async_steps: List[Tuple[Block, Optional[Callable[[], Any]], Callable[..., Any], bool, Tuple, bool, bool]] = []
+        for b, next_, execute, is_sink, feeds in self.steps:
+            async_next = getattr(b, 'async_next', None) if next_ is not None else None
+            async_execute = getattr(b, 'async_step' if is_sink else 'async_output', None)
+            self.async_steps.append((
+                b,
+                async_next or next_,
+                async_execute or execute,
+                is_sink,
+                feeds,
+                async_next is not None,
+                async_execute is not None
+            ))
+        self.is_async = any(await_next or await_execute for *_, await_next, await_execute in self.async_steps)
+
+
+async def exec_plan_async(
+    clock: Clock,
+    plan: AsyncCompiledPlan,
+    state: BDSimState,
+    scheduler: '_LoopScheduler',
+    scheduled_time: float,
+    start_time: float,
+    tuner_to_update: Optional[Tuner]
+):
+    "Coroutine equivalent of :func:`~bdsim_realtime.run.exec_plan_scheduled`, run as a task for each tick of plans that await"
+    t = state.t = scheduled_time - start_time
+
+    timings: Optional[ClockTimings] = plan.timings
+    if timings is not None:
+        next_durations, exec_durations = timings.begin_tick(scheduled_time, scheduler.time())
+
+    for idx, (b, next_, execute, is_sink, feeds, await_next, await_execute) in enumerate(plan.async_steps):
+        if next_ is not None:
+            t0 = perf_counter()
+            b._x = (await next_()) if await_next else next_()
+            if timings is not None:
+                next_durations[idx] = perf_counter() - t0
+
+        t0 = perf_counter()
+        if is_sink:
+            if await_execute:
+                await execute()
+            else:
+                execute()
+        else:
+            out = b.output_values = (await execute(t)) if await_execute else execute(t)
+            for inputs, slot, port in feeds:
+                inputs[slot] = out[port]
+        if timings is not None:
+            exec_durations[idx] = perf_counter() - t0
+
+    if timings is not None:
+        timings.end_tick(scheduler.time(), t)
+
+    if not state.stop and (state.T is None or t < state.T):
+        next_scheduled_time: float = scheduler.next_time(scheduled_time, clock.T)
+        scheduler.enterabs(
+            next_scheduled_time,
+            priority=plan.priority,
+            action=exec_plan_async,
+            argument=(
+                clock,
+                plan,
+                state,
+                scheduler,
+                next_scheduled_time,
+                start_time,
+                tuner_to_update))
+
+    if tuner_to_update:
+        tuner_to_update.update()
+
+
+class _LoopScheduler(OverrunHandling):
+    """Hands events to an asyncio event loop's `call_at()` rather than queueing and waiting on them itself.
+    Ticks that overrun are handled by its `overrun` policy, as by a :class:`~bdsim_realtime.scheduling.RealtimeScheduler`.
+
+    Actions returning a coroutine are run as a task. `finished` completes once no events are left
+    queued or running, or with the exception of the first action to fail.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, overrun: OverrunPolicy = "catchup"):
+        super().__init__(overrun=overrun)
+        self.loop = loop
+        self.finished: 'asyncio.Future[None]' = loop.create_future()
+        self._pending = 0  # events queued or running
+        self._tasks: Set['asyncio.Task[Any]'] = set()
+        self._cancelled = False
+
+    def time(self) -> float:
+        return self.loop.time()
+
+    def enterabs(self, time: float, priority: int, action: Callable[..., Any], argument: Tuple[Any, ...] = ()):
+        # priority is ignored - the loop doesn't order timers that are due at the same time
+        self._pending += 1
+        self.loop.call_at(time, self._dispatch, action, argument)
+
+    def _dispatch(self, action: Callable[..., Any], argument: Tuple[Any, ...]):
+        if self._cancelled:
+            return
+        try:
+            result = action(*argument)
+        except BaseException as e:
+            self._fail(e)
+            return
+
+        if asyncio.iscoroutine(result):
+            task = self.loop.create_task(result)
+            self._tasks.add(task)
+            task.add_done_callback(self._task_done)
+        else:
+            self._retire()
+
+    def _task_done(self, task: 'asyncio.Task[Any]'):
+        self._tasks.discard(task)
+        if task.cancelled():
+            self._retire()
+        elif task.exception() is not None:
+            self._fail(task.exception())
+        else:
+            self._retire()
+
+    def _retire(self):
+        self._pending -= 1
+        if self._pending == 0 and not self.finished.done():
+            self.finished.set_result(None)
+
+    def _fail(self, error: BaseException):
+        self._pending -= 1
+        if not self.finished.done():
+            self.finished.set_exception(error)
+
+    def cancel(self):
+        "Drops every queued event and cancels the running tasks"
+        self._cancelled = True
+        for task in list(self._tasks):
+            task.cancel()
+
+
+class _AsyncState(BDSimState):
+    "BDSimState whose current time `t` is tracked separately by each clock's chain of ticks, through the asyncio context"
+
+    def __init__(self):
+        self._t: 'contextvars.ContextVar[Optional[float]]' = contextvars.ContextVar('t', default=None)
+        super().__init__()
+
+    @property
+    def t(self) -> Optional[float]:
+        return self._t.get()
+
+    @t.setter
+    def t(self, t: Optional[float]):
+        self._t.set(t)
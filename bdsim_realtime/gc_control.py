@@ -0,0 +1,74 @@
+import gc
+from time import perf_counter
+from typing import List
+
+from typing_extensions import Literal
+
+
+GcMode = Literal["auto", "idle"]
+
+
+class IdleCollector:
+    """Replaces Python's automatic garbage collection with collections scheduled into the idle time between ticks.
+
+    `freeze()` collects and then moves everything allocated during setup into the permanent generation
+    (`gc.freeze()`) so it is never traversed again, and disables automatic collection. It then times a
+    collection of each generation, as a first estimate of their pauses.
+    `collect_within()` is then called after each tick with the time left until the next deadline,
+    and runs the oldest generation that automatic collection would have run by now
+    whose worst pause seen so far fits within that budget.
+    `restore()` puts back the collector's state from before `freeze()`.
+
+    :param margin: fraction of the idle time that a collection may use, defaults to 0.5
+    """
+
+    def __init__(self, margin: float = 0.5):
+        self.margin = margin
+        # worst observed pause of each generation's collection, in seconds
+        self.worst_pauses: List[float] = [0.0, 0.0, 0.0]
+        self.collections: List[int] = [0, 0, 0]
+        self.deferred = 0  # times a due collection didn't fit in the idle time
+
+        # to restore afterwards
+        self.was_enabled = gc.isenabled()
+        self.was_frozen = gc.get_freeze_count() > 0
+
+    def freeze(self):
+        gc.collect()
+        gc.freeze()
+        gc.disable()
+
+        # so that no generation's first collection is assumed to be free, however long it would take
+        for gen in range(3):
+            start = perf_counter()
+            gc.collect(gen)
+            self.worst_pauses[gen] = max(self.worst_pauses[gen], perf_counter() - start)
+
+    def restore(self):
+        # objects frozen by someone else can't be told apart from ours, so leave them all frozen
+        if not self.was_frozen:
+            gc.unfreeze()
+        if self.was_enabled:
+            gc.enable()
+
+    def collect_within(self, budget: float) -> float:
+        "Runs a collection if one is due and fits within `budget` seconds. Returns the pause time"
+        counts = gc.get_count()
+        thresholds = gc.get_threshold()
+        due = [gen for gen in range(3) if counts[gen] > thresholds[gen]]
+        if not due or budget <= 0:
+            return 0.0
+
+        budget *= self.margin
+        for gen in reversed(range(due[-1] + 1)):
+            if self.worst_pauses[gen] <= budget:
+                start = perf_counter()
+                gc.collect(gen)
+                pause = perf_counter() - start
+
+                self.worst_pauses[gen] = max(self.worst_pauses[gen], pause)
+                self.collections[gen] += 1
+                return pause
+
+        self.deferred += 1
+        return 0.0
@@ -0,0 +1,80 @@
+import mmap
+import pickle
+import struct
+from typing import Any, List, Optional, Sequence
+
+import numpy as np
+
+
+class Mailbox:
+    """Lock-free, single-writer, latest-value slot shared between forked processes.
+
+    Values are pickled into an anonymous shared memory mapping guarded by a sequence lock:
+    the writer bumps the sequence number to odd before writing and back to even afterwards,
+    so it never waits on readers. Readers that catch a write in progress (or see no new value)
+    just keep the last value they successfully read. Intermediate values may be dropped.
+
+    Must be constructed before the processes sharing it are forked.
+
+    :param size: maximum size in bytes of a pickled value, defaults to 64KiB
+    """
+
+    # the sequence number, then the payload's length. The length is only written while the sequence number is odd,
+    # so that a reader that sees the same even sequence number before and after its read has a matching length
+    _SEQ = struct.Struct("<Q")
+    _LENGTH = struct.Struct("<Q")
+    _HEADER_SIZE = _SEQ.size + _LENGTH.size
+
+    def __init__(self, size: int = 1 << 16):
+        self.size = size
+        self.buf = mmap.mmap(-1, self._HEADER_SIZE + size)
+        self._seq = 0  # writer-side sequence number
+        self._seen = 0  # reader-side sequence number of self._value
+        self._value: Any = None
+
+    def put(self, value: Any):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        assert len(data) <= self.size, \
+            "Value of {} bytes is too large for Mailbox of size {}".format(len(data), self.size)
+        start = self._HEADER_SIZE
+
+        self._seq += 1  # odd: write in progress
+        self._SEQ.pack_into(self.buf, 0, self._seq)
+        self._LENGTH.pack_into(self.buf, self._SEQ.size, len(data))
+        self.buf[start:start + len(data)] = data
+        self._seq += 1  # even: consistent
+        self._SEQ.pack_into(self.buf, 0, self._seq)
+
+    def get(self, default: Any = None) -> Any:
+        "Returns the newest consistent value, or `default` if nothing has been put yet"
+        seq, = self._SEQ.unpack_from(self.buf, 0)
+        if seq != self._seen and seq % 2 == 0:
+            length, = self._LENGTH.unpack_from(self.buf, self._SEQ.size)
+            data = self.buf[self._HEADER_SIZE:self._HEADER_SIZE + length]
+            # discard the read if the writer started another put() while we were copying
+            if self._SEQ.unpack_from(self.buf, 0)[0] == seq:
+                self._value = pickle.loads(data)
+                self._seen = seq
+
+        return self._value if self._seen else default
+
+
+class LocalMailbox:
+    """Latest-value slot for a block's outputs, shared between the threads of one process.
+    Has the same interface as :class:`Mailbox`, which is used between processes instead.
+
+    `put()` snapshots the outputs - copying any arrays, which a block may overwrite on its next tick
+    (ie; the vision blocks' reused output buffers) - and publishes the snapshot with one reference
+    assignment, which is atomic. Neither side ever waits on the other.
+    """
+
+    def __init__(self):
+        self._value: Optional[List[Any]] = None
+
+    def put(self, value: Sequence[Any]):
+        self._value = [x.copy() if isinstance(x, np.ndarray) else x for x in value]
+
+    def get(self, default: Any = None) -> Any:
+        "Returns the newest value, or `default` if nothing has been put yet"
+        value = self._value
+        return default if value is None else value
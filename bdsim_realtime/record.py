@@ -22,7 +22,7 @@ bd = BDSim().blockdiagram()
 
 fileno = 0
 while True:
-    filepath = "bdsim-dataout-%d.csv" % fileno
+    filepath = "bdsim-dataout-%d.bdrec" % fileno
     if not os.path.exists(filepath):
         break
     fileno += 1
@@ -30,11 +30,14 @@ while True:
 CHANNELS = 6
 
 recv = bd.DATARECEIVER(
-    clientsocket.makefile('rwb'),
+    clientsocket,
     nout=CHANNELS,
-    # run at a much higher hz but block
-    clock=bd.clock(200, unit="Hz"))
+    # run at a much higher hz. Record every packet rather than only the latest
+    clock=bd.clock(200, unit="Hz"),
+    latest=False)
 
-bd.CSV(open(filepath, 'w'), recv[0:CHANNELS], nin=CHANNELS, time=False)
+# memory-mapped, so nothing is lost if this process crashes. Synced to disk every second.
+# Keeps the most recent day; load with bdsim_realtime.recording.RingRecording(filepath)
+bd.RECORDER(filepath, recv[0:CHANNELS], nin=CHANNELS, time=False, format='ring', capacity=200 * 60 * 60 * 24)
 
 bdsim_realtime.run(bd)
\ No newline at end of file
@@ -0,0 +1,491 @@
+import itertools
+import json
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+from abc import ABC, abstractmethod
+from io import IOBase
+from typing import Any, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import numpy.lib.recfunctions
+from typing_extensions import Literal
+
+
+RecordFormat = Literal["csv", "npy", "parquet", "arrow", "ring"]
+
+
+class _FormatWriter(ABC):
+    "Writes chunks of rows to a file in one format. Runs on the background writer thread"
+
+    def __init__(self, file: IOBase, columns: Sequence[str], dtype: np.dtype):
+        self.file = file
+        self.columns = list(columns)
+        self.dtype = dtype
+
+    @abstractmethod
+    def write(self, rows: np.ndarray):
+        pass
+
+    def flush(self, fsync: bool):
+        self.file.flush()
+        if fsync:
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+
+class _CsvWriter(_FormatWriter):
+
+    def __init__(self, file: IOBase, columns: Sequence[str], dtype: np.dtype):
+        super().__init__(file, columns, dtype)
+        self.file.write((",".join(self.columns) + "\n").encode())
+        # %r-like round-trippable floats; integers as integers
+        self.row_format = ",".join(["%.17g" if dtype.kind == "f" else "%d"] * len(self.columns)) + "\n"
+
+    def write(self, rows: np.ndarray):
+        row_format = self.row_format
+        self.file.write("".join([row_format % tuple(row) for row in rows.tolist()]).encode())
+
+
+class _NpyWriter(_FormatWriter):
+    """A 1D structured array with a field per column, which has the same memory layout as the 2D chunks.
+    The header is padded to fit any number of rows so that the final count can be written over it on close"""
+
+    def __init__(self, file: IOBase, columns: Sequence[str], dtype: np.dtype):
+        super().__init__(file, columns, dtype)
+        assert file.seekable(), "npy recordings must be written to a seekable file"
+        self.rows = 0
+        self.descr = [(name, dtype.str) for name in self.columns]
+        self.header_size = -(-(10 + len(self._header(2 ** 64)) + 1) // 64) * 64
+        self._write_header()
+
+    def _header(self, rows: int) -> str:
+        return "{{'descr': {!r}, 'fortran_order': False, 'shape': ({},), }}".format(self.descr, rows)
+
+    def _write_header(self):
+        preamble = b"\x93NUMPY\x01\x00" + struct.pack("<H", self.header_size - 10)
+        self.file.write(preamble + self._header(self.rows).ljust(self.header_size - 11).encode() + b"\n")
+
+    def write(self, rows: np.ndarray):
+        self.file.write(rows.data)
+        self.rows += len(rows)
+
+    def close(self):
+        self.file.seek(0)
+        self._write_header()
+        self.file.seek(0, os.SEEK_END)
+        super().close()
+
+
+class _ArrowWriter(_FormatWriter):
+    "Parquet (row group per chunk) or Arrow IPC stream (record batch per chunk) via pyarrow"
+
+    def __init__(self, file: IOBase, columns: Sequence[str], dtype: np.dtype, parquet: bool):
+        super().__init__(file, columns, dtype)
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("pyarrow is required for parquet and arrow recordings. "
+                              "Install it with `pip install bdsim_realtime[parquet]`")
+        self.pa = pyarrow
+        schema = pyarrow.schema([(name, pyarrow.from_numpy_dtype(dtype)) for name in self.columns])
+        self.writer = pyarrow.parquet.ParquetWriter(file, schema) if parquet \
+            else pyarrow.ipc.new_stream(file, schema)
+
+    def write(self, rows: np.ndarray):
+        # the column slices are strided views; pyarrow copies them into its own buffers
+        self.writer.write_table(self.pa.Table.from_arrays(
+            [self.pa.array(rows[:, col]) for col in range(len(self.columns))], names=self.columns))
+
+    def close(self):
+        self.writer.close()
+        super().close()
+
+
+class _WriterThread(threading.Thread):
+
+    def __init__(self, recorder: 'ChunkedRecorder'):
+        super().__init__(name="recorder {}".format(recorder.name), daemon=True)
+        self.recorder = recorder
+        self.error: Optional[BaseException] = None
+
+    def run(self):
+        recorder = self.recorder
+        while True:
+            item = recorder._handoffs.get()
+            if item is None:
+                break
+            chunk, start, stop, release, flush = item
+            try:
+                recorder._writer.write(chunk[start:stop])
+                if flush:
+                    recorder._writer.flush(recorder.fsync)
+            except BaseException as e:
+                self.error = e
+                break
+            if release:
+                recorder._free.put(chunk)
+
+
+class ChunkedRecorder:
+    """Appends rows of samples into preallocated NumPy chunks that a background thread writes out.
+
+    The only work done per `append()` is copying the row into the current chunk. Full chunks (and the rows
+    added since the last flush, if a durability policy is set) are handed to a writer thread through a queue,
+    then returned to a pool for reuse. If the writer falls behind and the pool runs dry,
+    a new chunk is allocated (and counted in `self.overflows`) rather than waiting on it.
+
+    The writer thread holds the GIL while formatting CSV; 'npy', 'parquet' and 'arrow' release it for most of their work
+    so interfere least with the real-time clocks.
+
+    :param file: path or binary file object to write to
+    :param columns: name of each column
+    :param format: 'csv' (with a header row), 'npy' (a structured array with a field per column),
+        'parquet' or 'arrow' (an Arrow IPC stream).
+        The last two need pyarrow. A parquet file can only be read once closed; an arrow stream can be read up to its
+        last flush, defaults to 'csv'
+    :param dtype: type of every column, defaults to float64
+    :param chunk_rows: rows per chunk, defaults to 1024
+    :param chunks: number of chunks to preallocate, defaults to 4
+    :param flush_rows: if given, flush written rows to the file after at most this many rows
+    :param flush_interval: if given, flush written rows to the file at least this often in seconds
+    :param fsync: also `os.fsync()` the file on each flush so that flushed rows survive power loss, defaults to False
+    """
+
+    def __init__(
+        self,
+        file: Union[str, IOBase],
+        columns: Sequence[str],
+        format: RecordFormat = "csv",
+        dtype=np.float64,
+        chunk_rows: int = 1024,
+        chunks: int = 4,
+        flush_rows: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+        fsync: bool = False
+    ):
+        assert format in ("csv", "npy", "parquet", "arrow"), \
+            "Unknown recording format {}. See RingRecorder for 'ring'".format(format)
+        self.name = file if isinstance(file, str) else getattr(file, "name", format)
+        self.columns = list(columns)
+        self.format = format
+        self.dtype = np.dtype(dtype)
+        self.chunk_rows = chunk_rows
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.overflows = 0
+        self.rows = 0
+
+        if isinstance(file, str):
+            file = open(file, "wb")
+        if format == "csv":
+            self._writer: _FormatWriter = _CsvWriter(file, self.columns, self.dtype)
+        elif format == "npy":
+            self._writer = _NpyWriter(file, self.columns, self.dtype)
+        else:
+            self._writer = _ArrowWriter(file, self.columns, self.dtype, parquet=format == "parquet")
+
+        self._free: 'queue.Queue[np.ndarray]' = queue.Queue()
+        for _ in range(chunks - 1):
+            self._free.put(self._new_chunk())
+        self._handoffs: 'queue.Queue[Optional[Tuple[np.ndarray, int, int, bool, bool]]]' = queue.Queue()
+        self._thread: Optional[_WriterThread] = None
+
+        self._chunk = self._new_chunk()
+        self._row = 0  # next row of self._chunk to fill
+        self._handed_off = 0  # rows of self._chunk already handed to the writer
+        self._durable = flush_rows is not None or flush_interval is not None
+        self._next_flush = time.monotonic() + flush_interval if flush_interval is not None else np.inf
+
+    def _new_chunk(self) -> np.ndarray:
+        return np.zeros((self.chunk_rows, len(self.columns)), dtype=self.dtype)
+
+    def append(self, row: Sequence[Any]):
+        self._chunk[self._row] = row
+        self._row += 1
+        self.rows += 1
+
+        if self._row == self.chunk_rows:
+            self._hand_off(release=True)
+        elif self._durable and (
+                (self.flush_rows is not None and self._row - self._handed_off >= self.flush_rows)
+                or time.monotonic() >= self._next_flush):
+            self._hand_off(release=False)
+
+    def _hand_off(self, release: bool):
+        # started lazily so that it runs in the process that records, ie; a forked clock process
+        if self._thread is None or not self._thread.is_alive():
+            if self._thread and self._thread.error:
+                raise self._thread.error
+            self._thread = _WriterThread(self)
+            self._thread.start()
+
+        self._handoffs.put((self._chunk, self._handed_off, self._row, release, self._durable))
+        if self.flush_interval is not None:
+            self._next_flush = time.monotonic() + self.flush_interval
+
+        if release:
+            try:
+                self._chunk = self._free.get_nowait()
+            except queue.Empty:
+                self.overflows += 1
+                self._chunk = self._new_chunk()
+            self._row = self._handed_off = 0
+        else:
+            self._handed_off = self._row
+
+    def close(self):
+        "Writes out the remaining rows, waits for the writer thread and closes the file"
+        if self._row > self._handed_off:
+            self._hand_off(release=True)
+        if self._thread is not None:
+            self._handoffs.put(None)
+            self._thread.join()
+            if self._thread.error:
+                raise self._thread.error
+        self._writer.close()
+
+
+class _SyncThread(threading.Thread):
+    # fdatasync() rather than mmap.flush() (msync), which holds the GIL while it waits on the disk.
+    # For a shared file mapping both write back the same dirty pages
+    def __init__(self, fd: int, interval: float):
+        super().__init__(name="ring sync", daemon=True)
+        self.fd = fd
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        sync = getattr(os, "fdatasync", os.fsync)
+        while not self.stopped.wait(self.interval):
+            sync(self.fd)
+
+
+class RingRecorder:
+    """Records rows into a memory-mapped, fixed-size ring of binary records. Crash-safe and instant to load.
+
+    The file is a header page, holding the channel schema and a rolling write index, followed by `capacity` records.
+    Each `append()` copies the row straight into the mapping and then bumps the write index, so every record counted
+    by the index is complete. Rows land in the OS page cache as they're written, so nothing is lost if the process
+    crashes; they are synced to disk every `sync_interval` seconds by a background thread so that at most that much
+    is lost on power failure. Once full, the oldest records are overwritten.
+
+    Read recordings back with :class:`RingRecording`, even while they are still being written.
+
+    :param path: file to record to (conventionally ending in '.bdrec'). Created sparse, at its full size
+    :param columns: name of each column
+    :param dtype: type of every column, defaults to float64
+    :param capacity: number of rows kept, defaults to 2**20
+    :param sync_interval: seconds between syncs to disk. None to leave it to the OS, defaults to 1
+    """
+
+    MAGIC = b"BDRTREC1"
+    # magic, header size, record itemsize, capacity, write index (number of records written), schema length
+    _HEADER = struct.Struct("<8sQQQQQ")
+    _INDEX_OFFSET = 32
+
+    def __init__(
+        self,
+        path: str,
+        columns: Sequence[str],
+        dtype=np.float64,
+        capacity: int = 1 << 20,
+        sync_interval: Optional[float] = 1.0
+    ):
+        self.path = path
+        self.columns = list(columns)
+        self.dtype = np.dtype(dtype)
+        self.capacity = capacity
+
+        schema = json.dumps({'columns': self.columns, 'dtype': self.dtype.str}).encode()
+        header_size = -(-(self._HEADER.size + len(schema)) // mmap.PAGESIZE) * mmap.PAGESIZE
+        row_size = self.dtype.itemsize * len(self.columns)
+
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        os.ftruncate(self._fd, header_size + row_size * capacity)
+        self._mmap = mmap.mmap(self._fd, header_size + row_size * capacity)
+        self._HEADER.pack_into(self._mmap, 0, self.MAGIC, header_size, row_size, capacity, 0, len(schema))
+        self._mmap[self._HEADER.size:self._HEADER.size + len(schema)] = schema
+
+        self._index = memoryview(self._mmap)[self._INDEX_OFFSET:self._INDEX_OFFSET + 8].cast('Q')
+        self._rows = np.ndarray((capacity, len(self.columns)), self.dtype, self._mmap, header_size)
+        self.rows = 0
+
+        self.sync_interval = sync_interval
+        # started on the first append() so that it runs in the process that records, ie; a forked clock process
+        self._sync_thread: Optional[_SyncThread] = None
+
+    def append(self, row: Sequence[Any]):
+        if self._sync_thread is None and self.sync_interval is not None:
+            self._sync_thread = _SyncThread(self._fd, self.sync_interval)
+            self._sync_thread.start()
+
+        n = self.rows
+        self._rows[n % self.capacity] = row
+        self.rows = n + 1
+        self._index[0] = n + 1  # after the record so that it's complete if counted
+
+    def close(self):
+        "Syncs the recording to disk and closes it"
+        if self._sync_thread is not None:
+            self._sync_thread.stopped.set()
+            self._sync_thread.join()
+        self._index.release()
+        del self._rows
+        self._mmap.flush()
+        self._mmap.close()
+        os.close(self._fd)
+
+
+class RingRecording:
+    """Read-only view of a :class:`RingRecorder` recording, mapped rather than loaded into memory.
+
+    Index or slice it in chronological order like a NumPy structured array with a field per column ie;
+
+        recording = RingRecording('bdsim-dataout-0.bdrec')
+        last_minute = recording[-200 * 60:]
+        plt.plot(last_minute['t'], last_minute['x'])
+
+    Slices are views of the file if the ring hasn't wrapped; otherwise only the rows selected are read into memory.
+    The length is re-read on each access so a recording can be followed while it's being written.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, header_size, row_size, self.capacity, _, schema_len = RingRecorder._HEADER.unpack_from(self._mmap, 0)
+        assert magic == RingRecorder.MAGIC, "{} is not a bdsim_realtime ring recording".format(path)
+        schema = json.loads(self._mmap[RingRecorder._HEADER.size:RingRecorder._HEADER.size + schema_len])
+        self.columns: List[str] = schema['columns']
+        self.dtype = np.dtype([(name, schema['dtype']) for name in self.columns])
+        assert self.dtype.itemsize == row_size
+
+        self._index = np.ndarray((), np.uint64, self._mmap, RingRecorder._INDEX_OFFSET)
+        self.records = np.ndarray((self.capacity,), self.dtype, self._mmap, header_size)
+
+    @property
+    def written(self) -> int:
+        "Total number of rows written, including those since overwritten"
+        return int(self._index)
+
+    def __len__(self) -> int:
+        return min(self.written, self.capacity)
+
+    def __getitem__(self, key: Union[int, slice]) -> np.ndarray:
+        written = self.written
+        if written <= self.capacity:
+            return self.records[:written][key]
+
+        # map chronological indices to ring slots, the oldest being the one the next record will overwrite
+        selected = range(self.capacity)[key]
+        if isinstance(selected, int):
+            return self.records[(written + selected) % self.capacity]
+        slots = (written + np.arange(selected.start, selected.stop, selected.step)) % self.capacity
+        return self.records[slots]
+
+    def close(self):
+        del self._index, self.records
+        self._mmap.close()
+
+
+def read_recording(file: Union[str, IOBase], format: Optional[RecordFormat] = None) -> Tuple[List[str], np.ndarray]:
+    """Reads a recording written by :class:`ChunkedRecorder` back into memory.
+
+    :param format: defaults to guessing from the file extension. '.bdrec' files are 'ring' recordings
+    :return: the column names and a (rows, columns) array. For 'npy' and unwrapped 'ring' recordings this is
+        a view of the memory-mapped file rather than loaded into memory
+    """
+    if format is None:
+        format = _guess_format(file)
+    if format == "ring":
+        recording = RingRecording(file)  # type: ignore
+        rows = recording[:]
+        return recording.columns, rows.view(recording.dtype[0]).reshape(len(rows), len(recording.columns))
+    elif format == "npy":
+        records = np.load(file, mmap_mode="r")
+        return list(records.dtype.names), np.lib.recfunctions.structured_to_unstructured(records)
+    elif format == "csv":
+        with (open(file, "rb") if isinstance(file, str) else file) as f:
+            columns = f.readline().decode().strip().split(",")
+            return columns, np.loadtxt(f, delimiter=",", ndmin=2)
+    else:
+        import pyarrow
+        import pyarrow.parquet
+        table = pyarrow.parquet.read_table(file) if format == "parquet" else pyarrow.ipc.open_stream(file).read_all()
+        return table.column_names, np.column_stack([col.to_numpy() for col in table.columns])
+
+
+# the CSV block writes 1-element array signals as ie; "[0.5]"
+_STRIP_BRACKETS = str.maketrans("", "", "[]")
+
+
+def _guess_format(file: Union[str, IOBase]) -> RecordFormat:
+    assert isinstance(file, str), "Can only guess the format of a path"
+    extension = os.path.splitext(file)[1][1:]
+    return "ring" if extension == "bdrec" else extension  # type: ignore
+
+
+def iter_recording(
+    file: Union[str, IOBase],
+    format: Optional[RecordFormat] = None,
+    chunk_rows: int = 4096,
+    columns: Optional[Sequence[str]] = None
+) -> Tuple[List[str], Iterator[np.ndarray]]:
+    """Streams a recording in chunks of rows, so that recordings of any length can be replayed in constant memory.
+
+    Reads files written by :class:`ChunkedRecorder`, :class:`RingRecorder` and the `CSV` block.
+
+    :param format: defaults to guessing from the file extension. '.bdrec' files are 'ring' recordings
+    :param chunk_rows: rows per chunk (arrow streams are chunked as they were written), defaults to 4096
+    :param columns: names for the columns of a CSV file without a header row (ie; written by the `CSV` block),
+        defaults to 'c0', 'c1', ...
+    :return: the column names, and an iterator of (rows, columns) arrays
+    """
+    if format is None:
+        format = _guess_format(file)
+
+    if format == "csv":
+        f = open(file, "r") if isinstance(file, str) else file
+        first = f.readline()
+        try:
+            # no header row: put the line back into the first chunk
+            n_columns = len(np.array(first.translate(_STRIP_BRACKETS).split(","), dtype=float))
+            lines: Iterator[str] = itertools.chain([first], f)
+            names = list(columns) if columns is not None else ["c{}".format(i) for i in range(n_columns)]
+        except ValueError:
+            lines = iter(f)
+            names = first.strip().split(",")
+
+        def csv_chunks():
+            with f:
+                while True:
+                    chunk = [line.translate(_STRIP_BRACKETS) for line in itertools.islice(lines, chunk_rows)]
+                    if not chunk:
+                        return
+                    yield np.loadtxt(chunk, delimiter=",", ndmin=2)
+
+        return names, csv_chunks()
+
+    elif format in ("npy", "ring"):
+        names, rows = read_recording(file, format)  # memory-mapped
+        return names, (rows[start:start + chunk_rows] for start in range(0, len(rows), chunk_rows))
+
+    else:
+        import pyarrow
+        import pyarrow.parquet
+        if format == "parquet":
+            parquet = pyarrow.parquet.ParquetFile(file)
+            names, batches = parquet.schema_arrow.names, parquet.iter_batches(batch_size=chunk_rows)
+        else:
+            reader = pyarrow.ipc.open_stream(file)
+            names, batches = reader.schema.names, iter(reader)
+        return names, (np.column_stack([col.to_numpy() for col in batch.columns]) for batch in batches)
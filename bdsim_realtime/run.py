@@ -1,15 +1,27 @@
 
-from typing import Callable, Dict, Iterator, List, Optional, Set
-import time
-import sched
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
+from time import perf_counter
+import multiprocessing
+import threading
 
+from typing_extensions import Literal
 from bdsim import Block, BlockDiagram, BDSimState
 from bdsim.components import Clock, ClockedBlock, SinkBlock
 
 from .tuning import Tuner
+from .scheduling import OverrunHandling, Scheduler, RealtimeScheduler, VirtualScheduler
+from .mailbox import LocalMailbox, Mailbox
+from .timing import ClockTimings, TickTimings
+from .gc_control import GcMode, IdleCollector
 
 
-def _clocked_plans(bd: BlockDiagram) -> Dict[Clock, List[Block]]:
+Executor = Literal["serial", "thread", "process"]
+
+SETUP_WAIT_BUFFER = 1 # in seconds, to give time for the planning and scheduling
+_PROCESS_STOP_TIMEOUT = 1 # in seconds, for a clock process to finish its tick once stopped before it's terminated
+
+
+def _clocked_plans(bd: BlockDiagram, check_periods: bool = True) -> Dict[Clock, List[Block]]:
     plans: Dict[Clock, List[Block]] = {}
 
     prev_clock_period = 0
@@ -20,73 +32,66 @@ def _clocked_plans(bd: BlockDiagram) -> Dict[Clock, List[Block]]:
 
     bd.reset()
 
+    # precompute the connectivity once, so that planning is linear in the number of blocks + wires.
+    # pending[b] counts b's input connections from blocks that haven't been planned yet (Kahn's algorithm)
+    consumers: Dict[Block, List[Block]] = {b: [] for b in bd.blocklist}
+    producers: Dict[Block, List[Block]] = {b: [] for b in bd.blocklist}
+    pending: Dict[Block, int] = {b: 0 for b in bd.blocklist}
+    for b in bd.blocklist:
+        for outwires in b.output_wires:
+            for outwire in outwires:
+                block_next: Block = outwire.end.block
+                consumers[b].append(block_next)
+                producers[block_next].append(b)
+                pending[block_next] += 1
+
+    planned: Set[Block] = set()
+
     for clock in sorted(bd.clocklist, key=lambda clock: clock.offset):
 
         # assert that all clocks' periods are integer multiples of eachother so that they don't overlap.
         # Should really be done at clock definition time.
-        # May be avoided with some multiprocess magic - but only on multicore systems.
-        assert (prev_clock_period % clock.T == 0) or (
-            clock.T % prev_clock_period == 0)
-        prev_clock_period = clock.T
-
-        # Need to find all the blocks that require execution on this Clock's tick.
-        connected_blocks: Set[Block] = set()
+        # Not required when each clock runs on its own thread or process (see run(executor=...))
+        if check_periods:
+            assert (prev_clock_period % clock.T == 0) or (
+                clock.T % prev_clock_period == 0)
+            prev_clock_period = clock.T
 
         def should_exec(b: Block) -> bool:
-            is_planned = any(
-                block
-                for plan in plans.values()
-                for block in plan
-                if block is b
-            )
-            return not is_planned \
+            return b not in planned \
                 and (not isinstance(b, ClockedBlock) or b.clock is clock)
 
-        # Recurse backwards and forwards to collect these
-        for block in clock.blocklist:
-            connected_blocks.update(set(  # Backwards
-                _collect_connected(block, forward=False, predicate=should_exec)
-            ))
-            connected_blocks.update(set( # Forwards
-                _collect_connected(block, forward=True, predicate=should_exec)
-            ))
+        # Need to find all the blocks that require execution on this Clock's tick.
+        # Collect these backwards and forwards from the clock's blocks
+        connected_blocks = _collect_connected(clock.blocklist, producers, should_exec) \
+            | _collect_connected(clock.blocklist, consumers, should_exec)
 
         # plan out an order of block .output() execution and propagation. From sources -> sinks
-        # collect sources and ClockedBlocks with inputs ready (at this clock tick offset)
-        plan = []
-        for b in connected_blocks:
-            if b.nin == 0 or (isinstance(b, ClockedBlock) and all(b.inputs)):
-                plan.append(b)
+        # start with the blocks whose inputs are all ready (at this clock tick offset).
+        # iterate bd.blocklist rather than the set to keep plans deterministic
+        plan = [b for b in bd.blocklist if b in connected_blocks and pending[b] == 0]
+        in_plan = set(plan)
 
         # then propagate, updating plan as we go
         idx = 0
         while idx < len(plan):
             block: Block = plan[idx]
-            block.output_values = [True] * block.nout
+            planned.add(block)
 
-            for outwires in block.output_wires:
-                for outwire in outwires:
-                    block_next: Block = outwire.end.block
-
-                    if all(inp is not None for inp in block_next.inputs) \
-                    and (block_next.clock is clock if isinstance(block_next, ClockedBlock) else True) \
-                    and block_next not in plan:
-                        plan.append(block_next)
-                        # reset output values to prevent this from getting added to plan again
-                        block_next.output_values = [None] * block.nout
+            for block_next in consumers[block]:
+                pending[block_next] -= 1
+                if pending[block_next] == 0 \
+                and block_next not in in_plan \
+                and should_exec(block_next):
+                    plan.append(block_next)
+                    in_plan.add(block_next)
 
             idx += 1
 
         plans[clock] = plan
 
 
-    set_planned = set(
-        plan
-        # flatmap clockplan values
-        for clockplan in plans.values()
-        for plan in clockplan
-    )
-    not_planned = set(bd.blocklist) - set_planned
+    not_planned = set(bd.blocklist) - planned
     assert not any(not_planned), """Blocks {} do not depend on or are a dependency of any ClockedBlocks.
 This is required for its real-time execution.""" \
     .format(not_planned)
@@ -95,17 +100,187 @@ This is required for its real-time execution.""" \
 
     return plans
 
-def run(bd: BlockDiagram, max_time: Optional[float]=None, tuner: Optional[Tuner] = None):
-    state = bd.state = BDSimState()
+
+class _PlannedInputs:
+    "Mixin for blocks in a compiled plan. Their inputs are written into `_T_inputs` by the blocks feeding them"
+
+    @property
+    def inputs(self) -> list:
+        return self._T_inputs
+
+    def input(self, port: int):
+        return self._T_inputs[port]
+
+
+_planned_classes: Dict[type, type] = {}
+
+
+def _bind_inputs(b: Block) -> list:
+    """Has the block's `inputs` return a list that its producers write into, rather than being looked up
+    through its wires each time. Returns the list, holding the block's current inputs"""
+    if not isinstance(b, _PlannedInputs):
+        cls = type(b)
+        planned = _planned_classes.get(cls)
+        if planned is None:
+            planned = _planned_classes[cls] = type(cls.__name__, (_PlannedInputs, cls), {
+                '__module__': cls.__module__, '__qualname__': cls.__qualname__})
+        b._T_inputs = b.inputs  # through its wires, while it still can
+        object.__setattr__(b, '__class__', planned)  # bdsim's Block.__setattr__ would only set an attribute
+    return b._T_inputs
+
+
+def _unbind_inputs(blocks: Iterable[Block]):
+    "Undoes `_bind_inputs()`, so the blocks read their inputs through their wires again"
+    for b in blocks:
+        if isinstance(b, _PlannedInputs):
+            object.__setattr__(b, '__class__', type(b).__bases__[1])
+
+
+class CompiledPlan:
+    """A clock's execution plan with each block's dispatch resolved ahead of time,
+    so that `exec_plan_scheduled()` doesn't need to inspect block types on every tick.
+
+    Each step is a `(block, next, execute, is_sink, feeds)` tuple, where `next` is the bound `block.next`
+    for ClockedBlocks (otherwise `None`) and `execute` is the bound `block.step` for SinkBlocks
+    or `block.output` for everything else.
+
+    Each block's outputs are written to `block.output_values`, and straight into the input lists of the
+    blocks it feeds: `feeds` holds an `(inputs, slot, port)` for each of its outgoing wires, and the fed
+    blocks' `inputs` return those lists (see `_bind_inputs()`) - so no block looks its inputs up through
+    the wires while running.
+
+    :param blocks: the blocks to execute, in order (as produced by `_clocked_plans()`)
+    :param imports: blocks run by other clocks' threads or processes whose latest outputs are fetched from a
+        mailbox before each tick
+    :param exports: blocks whose outputs are put to a mailbox after each tick, for the other clocks
+    :param timings: if given, record each tick's timing into it
+    :param collector: if given, run garbage collections with it in the idle time after each tick
+    :param priority: scheduler priority of this plan's ticks. Of the ticks due at the same time, those with
+        the lowest priority run first
+    :param peers: schedulers of the clocks running on other threads. A collection pauses them too,
+        so must also fit before their next ticks
+    :param fed: the blocks whose inputs this plan writes, ie; those on the same clock when other clocks
+        are fed through mailboxes. Defaults to every block the plan's blocks are wired to
+    """
+
+    __slots__ = ('blocks', 'steps', 'imports', 'exports', 'timings', 'collector', 'priority', 'peers')
+
+    def __init__(
+        self,
+        blocks: List[Block],
+        imports: Sequence[Tuple[Block, '_AnyMailbox']] = (),
+        exports: Sequence[Tuple[Block, '_AnyMailbox']] = (),
+        timings: Optional[ClockTimings] = None,
+        collector: Optional[IdleCollector] = None,
+        priority: int = 1,
+        peers: Sequence[Scheduler] = (),
+        fed: Optional[Set[Block]] = None
+    ):
+        def feeds(b: Block) -> Tuple[Tuple[list, int, int], ...]:
+            return tuple(
+                (_bind_inputs(wire.end.block), wire.end.port, port)
+                for port, wires in enumerate(b.output_wires)
+                for wire in wires
+                if fed is None or wire.end.block in fed
+            )
+
+        self.blocks = blocks
+        self.steps: List[Tuple[Block, Optional[Callable[[], Any]], Callable[..., Any], bool, Tuple]] = [
+            (
+                b,
+                b.next if isinstance(b, ClockedBlock) else None,
+                b.step if isinstance(b, SinkBlock) else b.output,
+                isinstance(b, SinkBlock),
+                feeds(b)
+            )
+            for b in blocks
+        ]
+        self.imports = tuple((b, mailbox, feeds(b)) for b, mailbox in imports)
+        self.exports = tuple(exports)
+        self.timings = timings
+        self.collector = collector
+        self.priority = priority
+        self.peers = tuple(peers)
+
+
+def run(
+    bd: BlockDiagram,
+    max_time: Optional[float]=None,
+    tuner: Optional[Tuner] = None,
+    scheduler: Optional[Scheduler] = None,
+    executor: Executor = "serial",
+    timings: Optional[TickTimings] = None,
+    gc_mode: GcMode = "auto",
+    fuse_vision: Union[bool, int] = False
+):
+    """Execute a block-diagram in real-time.
+
+    :param bd: the block-diagram to run
+    :param max_time: stop after this many seconds, defaults to running forever
+    :param tuner: tuner to update after each tick of the most frequent clock. Use `TcpClientTuner(io_thread=True)`
+        to keep its network I/O off that clock
+    :param scheduler: the engine that waits for and dispatches clock ticks.
+        Defaults to a :class:`~bdsim_realtime.scheduling.RealtimeScheduler`, which runs overrun ticks back-to-back
+        to catch up - pass one with `overrun='skip'` to drop them instead.
+        Pass a :class:`~bdsim_realtime.scheduling.VirtualScheduler` to run in simulated time instead, as fast as possible
+        and deterministically - ie; to soak-test a diagram for hours of simulated time in seconds
+    :param executor: how clock plans are executed:
+        'serial' runs every clock on the calling thread (all clock periods must be integer multiples of eachother),
+        'thread' runs each clock on its own thread - best when the slow clocks are dominated by GIL-releasing (ie OpenCV) blocks.
+        Values crossing clocks are snapshotted at the end of their producer's tick, into
+        :class:`~bdsim_realtime.mailbox.LocalMailbox` es,
+        'process' forks a process for each clock - best for pure-Python blocks. Values crossing clocks are passed through
+        :class:`~bdsim_realtime.mailbox.Mailbox` es. Linux/macOS only
+    :param timings: if given, record per-tick and per-block timing of every clock into it.
+        See :class:`~bdsim_realtime.timing.TickTimings`
+    :param gc_mode: 'auto' leaves Python's garbage collection as is. 'idle' freezes the heap after setup,
+        disables automatic collection and instead collects in each clock's idle time between ticks,
+        recording the pauses in `timings`. See :class:`~bdsim_realtime.gc_control.IdleCollector`
+    :param fuse_vision: if truthy, run each chain of single-input vision blocks (ie; CVTCOLOR -> INRANGE -> OPENMASK -> BLOBS)
+        as one block, skipping wire propagation and computing pointwise stages in cache-sized bands of rows.
+        Pass a number > 1 to compute the bands on that many threads.
+        The chained blocks' intermediate outputs aren't updated. See :func:`~bdsim_realtime.blocks.vision.fuse_vision_chains`
+    """
+    assert executor in ("serial", "thread", "process"), \
+        "Unknown executor {}".format(executor)
+    assert gc_mode in ("auto", "idle"), \
+        "Unknown gc_mode {}".format(gc_mode)
+    assert not (tuner and executor == "process"), \
+        "Tuners are not supported with executor='process' (yet). Use executor='thread' instead"
+    assert not (isinstance(scheduler, VirtualScheduler) and executor != "serial"), \
+        "VirtualScheduler only supports executor='serial'"
+    assert not (fuse_vision and executor == "process"), \
+        "fuse_vision isn't supported with executor='process' (yet)"
+
+    if scheduler is None:
+        scheduler = RealtimeScheduler()
+
+    if executor == "thread":
+        state = bd.state = _ThreadedState()
+    elif executor == "process":
+        state = bd.state = _ProcessState()
+    else:
+        state = bd.state = BDSimState()
     state.T = max_time
 
     if not bd.compiled:
         bd.compile()
         print("Compiled!\n")
 
-    clock2plan = _clocked_plans(bd)
+    clock2plan = _clocked_plans(bd, check_periods=executor == "serial")
+    clock2blocks = {clock: set(plan) for clock, plan in clock2plan.items()}  # including any fused into pipelines
+    pipelines: List[Block] = []
+    if fuse_vision:
+        from .blocks.vision import VisionPipeline, fuse_vision_chains
+        clock2plan = {clock: fuse_vision_chains(plan, threads=int(fuse_vision)) for clock, plan in clock2plan.items()}
+        # not in the diagram's blocklist, so not done() by bd.done()
+        pipelines = [b for plan in clock2plan.values() for b in plan if isinstance(b, VisionPipeline)]
 
     bd.start(state=state)
+
+    if timings:
+        # before tuner.setup() so that any timing scopes are registered with the tuner
+        timings.attach(clock2plan, tuner)
     
     if tuner:
         # needs to happen after self.start() because the autogen'd block-names
@@ -114,50 +289,274 @@ def run(bd: BlockDiagram, max_time: Optional[float]=None, tuner: Optional[Tuner]
     
     last_most_frequent_clock = sorted(bd.clocklist, key=lambda c: c.T + c.offset)[0]
 
-    SETUP_WAIT_BUFFER = 1 # in seconds, to give time for the planning and scheduling
-    now = time.monotonic()
+    # simulated time doesn't pass while setting up
+    start_time = scheduler.time() + (0 if isinstance(scheduler, VirtualScheduler) else SETUP_WAIT_BUFFER)
 
-    # use python's stdlib scheduler
-    scheduler = sched.scheduler()
+    print("Executing {} with executor={}:".format(max_time or "forever", executor))
 
-    print("Executing {}:".format(max_time or "forever"))
+    collector = IdleCollector() if gc_mode == "idle" else None
+    if collector:
+        # everything allocated up to here lives for the whole run - stop the gc from traversing it
+        collector.freeze()
+    try:
+        _run_plans(bd, clock2plan, clock2blocks, state, scheduler, executor, start_time,
+                   tuner, last_most_frequent_clock, timings, collector)
+    finally:
+        if collector:
+            collector.restore()
+        for pipeline in pipelines:
+            pipeline.done()
+        _unbind_inputs(bd.blocklist)
+
+    if timings:
+        print(timings.summary())
+    print("Realtime Execution Stopped AS EXPECTED")
 
-    for clock, plan in clock2plan.items():
-        scheduled_time: float = now + clock.offset + SETUP_WAIT_BUFFER
-        print("{} <SCHEDULED for {}>:{}".format(
-            clock, scheduled_time,
-            ''.join('\n\t{}. {}{}'.format(idx, b, ' (clocked)' if isinstance(b, ClockedBlock) else '') for idx, b in enumerate(plan))))
-        scheduler.enterabs(
-            scheduled_time,
-            priority=1,
-            action=exec_plan_scheduled,
-            argument=(
-                clock,
+
+def _run_plans(
+    bd: BlockDiagram,
+    clock2plan: Dict[Clock, List[Block]],
+    clock2blocks: Dict[Clock, Set[Block]],
+    state: BDSimState,
+    scheduler: Scheduler,
+    executor: Executor,
+    start_time: float,
+    tuner: Optional[Tuner],
+    last_most_frequent_clock: Clock,
+    timings: Optional[TickTimings],
+    collector: Optional[IdleCollector]
+):
+
+    if executor == "serial":
+        scheduler.setup()
+        # clocks ticking at the same time run in planning order (by offset), so values a clock's blocks
+        # read from another's are the same from tick to tick, rather than depending on the scheduling history
+        for priority, (clock, plan) in enumerate(clock2plan.items()):
+            compiled = CompiledPlan(plan, timings=timings[clock] if timings else None,
+                                    collector=collector, priority=priority)
+            _schedule_clock(scheduler, clock, compiled, state, start_time,
+                            tuner if clock is last_most_frequent_clock else None)
+
+        print("System time is now {}. Running scheduler.run()!".format(scheduler.time()))
+        try:
+            scheduler.run()
+        finally:
+            bd.done()
+        _report_overruns(scheduler)
+
+    elif executor == "thread":
+        # snapshotted at the end of their producer's tick, so never read while they're being written
+        mailboxes, clock2imports = _cross_clock_mailboxes(clock2blocks, LocalMailbox)
+
+        workers = []
+        clock2scheduler = {clock: scheduler.spawn() for clock in clock2plan}
+        for clock, plan in clock2plan.items():
+            worker_scheduler = clock2scheduler[clock]
+            compiled = CompiledPlan(
                 plan,
-                state,
-                scheduler,
-                scheduled_time,
-                scheduled_time,
-                tuner if clock is last_most_frequent_clock else None))
+                imports=[(b, mailboxes[b]) for b in clock2imports[clock]],
+                exports=[(b, mailboxes[b]) for b in plan if b in mailboxes],
+                timings=timings[clock] if timings else None,
+                collector=collector,
+                peers=[s for c, s in clock2scheduler.items() if c is not clock],
+                fed=clock2blocks[clock])
+            _schedule_clock(worker_scheduler, clock, compiled, state, start_time,
+                            tuner if clock is last_most_frequent_clock else None)
+            workers.append(_ThreadWorker(worker_scheduler, state, name=clock.name))
+
+        print("System time is now {}. Starting {} clock threads!".format(scheduler.time(), len(workers)))
+        try:
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        finally:
+            if not state.stop:
+                state.stop = True
+            bd.done()
+
+        for worker in workers:
+            _report_overruns(worker.scheduler)
+        for worker in workers:
+            if worker.error:
+                raise worker.error
+
+    else:
+        mailboxes, clock2imports = _cross_clock_mailboxes(clock2blocks, Mailbox)
+
+        ctx = multiprocessing.get_context("fork")
+        processes = []
+        for clock, plan in clock2plan.items():
+            worker_scheduler = scheduler.spawn()
+            compiled = CompiledPlan(
+                plan,
+                imports=[(b, mailboxes[b]) for b in clock2imports[clock]],
+                exports=[(b, mailboxes[b]) for b in plan if b in mailboxes],
+                timings=timings[clock] if timings else None,
+                collector=collector,
+                fed=clock2blocks[clock])
+            _schedule_clock(worker_scheduler, clock, compiled, state, start_time, None)
+            processes.append(ctx.Process(
+                target=_process_worker, args=(worker_scheduler, state, plan), name=clock.name, daemon=True))
+
+        print("System time is now {}. Forking {} clock processes!".format(scheduler.time(), len(processes)))
+        try:
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+        finally:
+            # let any still running finish their tick and clean up, ie; if interrupted
+            state.stop = True
+            for process in processes:
+                process.join(_PROCESS_STOP_TIMEOUT)
+                if process.is_alive():
+                    process.terminate()
+            # the blocks were started before forking - release the parent's copies of their resources
+            bd.done()
+
+        failed = [process.name for process in processes if process.exitcode]
+        if failed:
+            raise RuntimeError("Clock processes {} exited with errors".format(failed))
+
+
+
+_AnyMailbox = Union[Mailbox, LocalMailbox]
+
+
+def _cross_clock_mailboxes(
+    clock2blocks: Dict[Clock, Set[Block]],
+    mailbox_type: Callable[[], _AnyMailbox]
+) -> Tuple[Dict[Block, _AnyMailbox], Dict[Clock, List[Block]]]:
+    "Makes a mailbox for each block whose outputs are consumed on another clock. Returns them, and the blocks each clock imports"
+    block2clock = {b: clock for clock, blocks in clock2blocks.items() for b in blocks}
+    mailboxes: Dict[Block, _AnyMailbox] = {}
+    clock2imports: Dict[Clock, List[Block]] = {clock: [] for clock in clock2blocks}
+    for b, clock in block2clock.items():
+        consumer_clocks = {block2clock[wire.end.block] for wires in b.output_wires for wire in wires}
+        consumer_clocks.discard(clock)
+        if consumer_clocks:
+            mailboxes[b] = mailbox_type()
+            for consumer_clock in consumer_clocks:
+                clock2imports[consumer_clock].append(b)
+    return mailboxes, clock2imports
+
+
+def _schedule_clock(
+    scheduler: Scheduler,
+    clock: Clock,
+    plan: 'CompiledPlan',
+    state: BDSimState,
+    start_time: float,
+    tuner: Optional[Tuner]
+):
+    scheduled_time: float = start_time + clock.offset
+    print("{} <SCHEDULED for {}>:{}".format(
+        clock, scheduled_time,
+        ''.join('\n\t{}. {}{}'.format(idx, b, ' (clocked)' if isinstance(b, ClockedBlock) else '') for idx, b in enumerate(plan.blocks))))
+    scheduler.enterabs(
+        scheduled_time,
+        priority=plan.priority,
+        action=exec_plan_scheduled,
+        argument=(
+            clock,
+            plan,
+            state,
+            scheduler,
+            scheduled_time,
+            scheduled_time,
+            tuner))
+
+
+def _report_overruns(scheduler: Union[Scheduler, OverrunHandling]):
+    if isinstance(scheduler, OverrunHandling) and scheduler.overruns:
+        print("{} tick overruns ({} ticks skipped)".format(scheduler.overruns, scheduler.skipped_ticks))
+
+
+class _ThreadedState(BDSimState):
+    "BDSimState whose current time `t` is tracked separately by each clock's worker thread"
+
+    def __init__(self):
+        self._local = threading.local()
+        super().__init__()
+
+    @property
+    def t(self) -> Optional[float]:
+        return getattr(self._local, 't', None)
+
+    @t.setter
+    def t(self, t: Optional[float]):
+        self._local.t = t
 
-    print("System time (time.monotonic()) is now {}. Running scheduler.run()!".format(time.monotonic()))
+
+class _ProcessState(BDSimState):
+    """BDSimState whose `stop` flag is shared by every clock's forked process, so that stopping one stops them all.
+    Must be created before forking"""
+
+    def __init__(self):
+        self._stop = multiprocessing.get_context("fork").Event()
+        super().__init__()
+
+    @property
+    def stop(self) -> Optional[bool]:
+        return self._stop.is_set() or None
+
+    @stop.setter
+    def stop(self, stop):
+        if stop:
+            self._stop.set()
+        else:
+            self._stop.clear()
+
+
+class _ThreadWorker(threading.Thread):
+
+    def __init__(self, scheduler: Scheduler, state: BDSimState, name: str):
+        super().__init__(name=name, daemon=True)
+        self.scheduler = scheduler
+        self.state = state
+        self.error: Optional[BaseException] = None
+
+    def run(self):
+        try:
+            self.scheduler.setup()
+            self.scheduler.run()
+        except BaseException as e:
+            self.error = e
+            # bring down the other clocks too
+            if not self.state.stop:
+                self.state.stop = True
+
+
+def _process_worker(scheduler: Scheduler, state: BDSimState, plan: List[Block]):
     try:
+        scheduler.setup()
         scheduler.run()
+    except BaseException:
+        # bring down the other clocks too
+        state.stop = True
+        raise
     finally:
-        bd.done()
-    print("Realtime Execution Stopped AS EXPECTED")
+        for b in plan:
+            b.done(block=False)
 
 
 def exec_plan_scheduled(
     clock: Clock,
-    plan: List[Block],
+    plan: 'CompiledPlan',
     state: BDSimState,
-    scheduler: sched.scheduler,
+    scheduler: Scheduler,
     scheduled_time: float,
     start_time: float,
     tuner_to_update: Optional[Tuner]
 ):
-    state.t = scheduled_time - start_time
+    t = state.t = scheduled_time - start_time
+
+    # pick up the latest outputs of blocks executed by other clocks' threads or processes
+    for b, mailbox, feeds in plan.imports:
+        out = b.output_values = mailbox.get(b.output_values)
+        for inputs, slot, port in feeds:
+            inputs[slot] = out[port]
     
     # execute the 'ontick' steps for each clock, ie read ADC's output PWM's, send/receive datas
     # for b in clock.blocklist:
@@ -168,26 +567,47 @@ def exec_plan_scheduled(
     #     b._x = b.next()
     
     # now execute the given plan
-    for b in plan:
-        if isinstance(b, ClockedBlock):
-            b._x = b.next()
-
-        if isinstance(b, SinkBlock):
-            b.step()  # step sink blocks
-        else:
-            # propagate all other blocks
-            b.output_values = b.output(state.t)
-
-    # forcibly collect garbage to assist in fps constancy
-    # gc.collect()
-
-    # print('after collect()', time.monotonic() - scheduled_time)
+    if plan.timings is None:
+        for b, next_, execute, is_sink, feeds in plan.steps:
+            if next_ is not None:
+                b._x = next_()
+
+            if is_sink:
+                execute()  # step sink blocks
+            else:
+                # propagate all other blocks
+                out = b.output_values = execute(t)
+                for inputs, slot, port in feeds:
+                    inputs[slot] = out[port]
+    else:
+        # same as above, but timed
+        next_durations, exec_durations = plan.timings.begin_tick(scheduled_time, scheduler.time())
+        for idx, (b, next_, execute, is_sink, feeds) in enumerate(plan.steps):
+            if next_ is not None:
+                t0 = perf_counter()
+                b._x = next_()
+                next_durations[idx] = perf_counter() - t0
+
+            t0 = perf_counter()
+            if is_sink:
+                execute()
+            else:
+                out = b.output_values = execute(t)
+                for inputs, slot, port in feeds:
+                    inputs[slot] = out[port]
+            exec_durations[idx] = perf_counter() - t0
+
+    for b, mailbox in plan.exports:
+        mailbox.put(b.output_values)
+
+    if plan.timings is not None:
+        plan.timings.end_tick(scheduler.time(), t)
 
     if not state.stop and (state.T is None or state.t < state.T):
-        next_scheduled_time: float = scheduled_time + clock.T
+        next_scheduled_time: float = scheduler.next_time(scheduled_time, clock.T)
         scheduler.enterabs(
             next_scheduled_time,
-            priority=1,
+            priority=plan.priority,
             action=exec_plan_scheduled,
             argument=(
                 clock,
@@ -201,23 +621,34 @@ def exec_plan_scheduled(
     if tuner_to_update:
         tuner_to_update.update()
 
+    # collect garbage in the idle time before the next tick (of any clock on this scheduler, or on
+    # another thread - which it would hold up too) to assist in fps constancy
+    if plan.collector is not None:
+        now = scheduler.time()
+        # a clock mid-tick has nothing queued - it's busy now
+        deadline = min([scheduler.next_deadline()] + [peer.next_deadline(now) for peer in plan.peers])
+        pause = plan.collector.collect_within(deadline - now)
+        if pause and plan.timings is not None:
+            plan.timings.record_gc(pause)
+
 
 def _collect_connected(
-    block: Block,
-    forward: bool,
+    blocks: Iterable[Block],
+    adjacency: Dict[Block, List[Block]],
     predicate: Callable[[Block], bool]
 ) -> Set[Block]:
-    """Recurses connections in the block diagram, either forward or backward from a given block.
-    Collects the blocks into the provided "collected" set.
-    if forward=True, will recurse through outputs, otherwise will recurse through inputs
+    """Collects the given blocks and every block reachable from them through `adjacency`,
+    only traversing into blocks for which `predicate` holds.
+    Pass a map of block -> consumers to search forward through outputs, or block -> producers to search backward through inputs.
     """
+    collected: Set[Block] = set(blocks)
+    stack = list(collected)
 
-    yield block
-    
-    wires = block.output_wires if forward else block.input_wires
+    while stack:
+        block = stack.pop()
+        for next_block in adjacency[block]:
+            if next_block not in collected and predicate(next_block):
+                collected.add(next_block)
+                stack.append(next_block)
 
-    for ws in wires:
-        for wire in ws:
-            next_block = wire.end.block if forward else wire.start.block
-            if predicate(next_block):
-                yield from _collect_connected(next_block, forward, predicate)
+    return collected
@@ -0,0 +1,222 @@
+import copy
+import heapq
+import itertools
+import logging
+import math
+import os
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+from typing_extensions import Literal
+
+
+OverrunPolicy = Literal["catchup", "skip", "fail"]
+
+
+class DeadlineMissed(RuntimeError):
+    "Raised by a scheduler with overrun='fail' when a tick finishes after its next deadline"
+
+
+class Scheduler(ABC):
+    """Base class for the engines that drive `bdsim_realtime.run()`.
+
+    Mirrors the parts of the stdlib `sched.scheduler` interface used by `run()`
+    (`enterabs()` and `run()`), but leaves waiting and overrun handling to subclasses.
+    """
+
+    def __init__(self):
+        self._queue: List[Tuple[float, int, int, Callable[..., Any], Tuple[Any, ...]]] = []
+        self._seq = itertools.count()  # tie-breaker to keep equal-time events in FIFO order
+
+    def enterabs(self, time: float, priority: int, action: Callable[..., Any], argument: Tuple[Any, ...] = ()):
+        heapq.heappush(self._queue, (time, priority, next(self._seq), action, argument))
+
+    def empty(self) -> bool:
+        return not self._queue
+
+    def next_deadline(self, default: float = math.inf) -> float:
+        """Time of the next queued event, or `default` if there is none (ie; while one is running).
+        Waited-for events stay queued until they are due, so may be called from other threads"""
+        try:
+            return self._queue[0][0]
+        except IndexError:
+            return default
+
+    def setup(self):
+        "Called once by `run()` before the first tick, on the thread that will call `run()`. Use for OS-level configuration"
+        pass
+
+    def spawn(self) -> 'Scheduler':
+        "Returns a new scheduler with the same configuration and an empty queue. Used to give each clock worker its own"
+        spawned = copy.copy(self)
+        spawned._queue = []
+        spawned._seq = itertools.count()
+        return spawned
+
+    @abstractmethod
+    def time(self) -> float:
+        pass
+
+    @abstractmethod
+    def wait_until(self, deadline: float):
+        pass
+
+    def next_time(self, scheduled_time: float, period: float) -> float:
+        "Returns the time at which a periodic event scheduled for `scheduled_time` should next run"
+        return scheduled_time + period
+
+    def run(self):
+        queue = self._queue
+        while queue:
+            self.wait_until(queue[0][0])
+            scheduled_time, _, _, action, argument = heapq.heappop(queue)
+            action(*argument)
+
+
+class OverrunHandling(ABC):
+    """Mixin for schedulers in real time, which can fall behind: its `next_time()` applies an overrun policy
+    to ticks that finish after their next deadline. Counts them in `overruns`, and the ticks dropped in `skipped_ticks`.
+
+    :param overrun: what to do when a tick finishes after its next deadline:
+        'catchup' runs the late ticks back-to-back until the clock is back in phase, as `run()` always has (default),
+        'skip' drops the missed ticks and resumes at the next deadline still in the future,
+        'fail' raises :class:`DeadlineMissed`
+    """
+
+    def __init__(self, overrun: OverrunPolicy = "catchup"):
+        super().__init__()
+        assert overrun in ("catchup", "skip", "fail"), \
+            "Unknown overrun policy {}".format(overrun)
+        self.overrun = overrun
+        self.overruns = 0
+        self.skipped_ticks = 0
+
+    @abstractmethod
+    def time(self) -> float:
+        pass
+
+    def next_time(self, scheduled_time: float, period: float) -> float:
+        next_time = scheduled_time + period
+        now = self.time()
+        if now <= next_time:
+            return next_time
+
+        self.overruns += 1
+        if self.overrun == "fail":
+            raise DeadlineMissed(
+                "Tick scheduled for {:.6f} finished at {:.6f}, {:.6f}s after its next deadline"
+                .format(scheduled_time, now, now - next_time))
+        elif self.overrun == "skip":
+            missed = math.ceil((now - next_time) / period)
+            self.skipped_ticks += missed
+            next_time += missed * period
+
+        return next_time
+
+
+class RealtimeScheduler(OverrunHandling, Scheduler):
+    """Wall-clock scheduler with a hybrid sleep/spin wait and selectable overrun policies (see :class:`OverrunHandling`).
+
+    :param spin: how long before each deadline (in seconds) to stop sleeping and busy-wait instead.
+        OS sleeps routinely overshoot by a millisecond or more; spinning trades CPU for accuracy, defaults to 1ms
+    :param overrun: what to do when a tick finishes after its next deadline, defaults to 'catchup'
+    :param priority: if given, switch this process to the SCHED_FIFO real-time policy with this priority (1-99).
+        Usually requires root or CAP_SYS_NICE
+    :param cpus: if given, pin this process to these CPU cores via `os.sched_setaffinity`
+    """
+
+    def __init__(
+        self,
+        spin: float = 1e-3,
+        overrun: OverrunPolicy = "catchup",
+        priority: Optional[int] = None,
+        cpus: Optional[Iterable[int]] = None,
+    ):
+        super().__init__(overrun)
+        self.spin = spin
+        self.priority = priority
+        self.cpus = set(cpus) if cpus is not None else None
+
+    def setup(self):
+        if self.cpus is not None:
+            if hasattr(os, "sched_setaffinity"):
+                os.sched_setaffinity(0, self.cpus)
+            else:
+                logging.warning("CPU affinity is not supported on this platform. Ignoring cpus=%s", self.cpus)
+
+        if self.priority is not None:
+            if hasattr(os, "sched_setscheduler"):
+                try:
+                    os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(self.priority))
+                except PermissionError:
+                    logging.warning("Insufficient permissions to set SCHED_FIFO priority %d. "
+                                    "Run as root or grant CAP_SYS_NICE. Continuing with the default policy",
+                                    self.priority)
+            else:
+                logging.warning("SCHED_FIFO is not supported on this platform. Ignoring priority=%d", self.priority)
+
+    def spawn(self) -> 'RealtimeScheduler':
+        spawned = super().spawn()
+        spawned.overruns = 0
+        spawned.skipped_ticks = 0
+        return spawned
+
+    def time(self) -> float:
+        return time.monotonic()
+
+    def wait_until(self, deadline: float):
+        remaining = deadline - time.monotonic()
+        if remaining > self.spin:
+            time.sleep(remaining - self.spin)
+        while time.monotonic() < deadline:
+            pass
+
+
+class VirtualScheduler(Scheduler):
+    """Scheduler in simulated time: rather than waiting for each deadline, `time()` jumps straight to it.
+
+    Ticks run back-to-back as fast as the CPU allows, or paced at a multiple of real time, ie; to replay
+    a recording (see the `REPLAY` block) faster than it was recorded. Only supports `run(executor='serial')`.
+
+    Deadlines are quantised to whole multiples of `resolution` and periodic events advance by whole multiples
+    of it too, so tick times don't drift as they are accumulated and the ticks of clocks whose periods are
+    multiples of eachother coincide exactly. A run is therefore deterministic: the same diagram ticks
+    at the same times, in the same order, every time.
+
+    :param speed: None to run as fast as possible (default), otherwise how many seconds of simulated time
+        to run per second of real time
+    :param resolution: the simulated clock's resolution in seconds, rounded to a whole fraction of a second. Defaults to 1ns
+    """
+
+    def __init__(self, speed: Optional[float] = None, resolution: float = 1e-9):
+        super().__init__()
+        assert speed is None or speed > 0, "speed must be positive"
+        assert 0 < resolution <= 1, "resolution must be within (0, 1] seconds"
+        self.speed = speed
+        self.resolution = resolution
+        self._per_second = round(1 / resolution)
+        self.now = 0.0
+        self._wall_origin: Optional[float] = None  # wall-clock time of simulated time 0, when paced
+
+    def _ticks(self, time: float) -> int:
+        return round(time * self._per_second)
+
+    def enterabs(self, time: float, priority: int, action: Callable[..., Any], argument: Tuple[Any, ...] = ()):
+        super().enterabs(self._ticks(time) / self._per_second, priority, action, argument)
+
+    def time(self) -> float:
+        return self.now
+
+    def wait_until(self, deadline: float):
+        if self.speed is not None:
+            if self._wall_origin is None:
+                self._wall_origin = time.monotonic() - self.now / self.speed
+            remaining = self._wall_origin + deadline / self.speed - time.monotonic()
+            if remaining > 0:
+                time.sleep(remaining)
+        self.now = max(self.now, deadline)
+
+    def next_time(self, scheduled_time: float, period: float) -> float:
+        # in integer multiples of the resolution, so that ie; 3 x 0.1s lands exactly on 1 x 0.3s
+        return (self._ticks(scheduled_time) + self._ticks(period)) / self._per_second
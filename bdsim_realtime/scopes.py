@@ -0,0 +1,177 @@
+"""Signal scope samples batched over the node <-> webapp TCP link.
+
+Each scope's samples are accumulated into preallocated buffers by `ScopeBuffer.append()` - called once
+per tick, on the scope's clock - and sent once per tuner update as a single msgpack extension type
+`SCOPE_DATA_EXT`. Its data is a fixed little-endian header (`SCOPE_HEADER`: scope index, number of samples)
+followed by the columns as little-endian float64s: the samples' times, then each signal's values.
+
+A scope given a display `rate` is decimated before sending: its samples are grouped into buckets of 1 / rate
+seconds, and each bucket sends only its min and max sample of each signal - so a kHz signal's envelope (and any
+spikes in it) still shows, at a rate the link and the browser can keep up with.
+
+Browsers that don't announce support for `SCOPE_DATA_EXT` when choosing a node (ie; the prebuilt frontend_dist)
+are sent each batch by the webapp as a plain msgpack list instead - see `legacy_scope_message()`.
+"""
+import math
+import struct
+from collections import deque
+from typing import Deque, Optional, Sequence, Tuple
+
+import msgpack
+import numpy as np
+
+
+SCOPE_DATA_EXT = 3
+
+SCOPE_HEADER = struct.Struct("<HI")
+
+DTYPE = np.dtype("<f8")
+
+
+def pack_scope_data(index: int, columns: np.ndarray) -> msgpack.ExtType:
+    "Frames a scope's (n_signals + 1, n_samples) columns as a SCOPE_DATA_EXT message"
+    header = SCOPE_HEADER.pack(index, columns.shape[1])
+    return msgpack.ExtType(SCOPE_DATA_EXT, b"".join((header, columns.astype(DTYPE, copy=False).tobytes())))
+
+
+def unpack_scope_data(data: bytes) -> Tuple[int, np.ndarray]:
+    "Reads a SCOPE_DATA_EXT message's data. Returns the scope's index and its (n_signals + 1, n_samples) columns"
+    index, n_samples = SCOPE_HEADER.unpack_from(data)
+    columns = np.frombuffer(data, DTYPE, offset=SCOPE_HEADER.size)
+    return index, columns.reshape(-1, n_samples) if n_samples else columns.reshape(0, 0)
+
+
+def legacy_scope_message(data: bytes) -> list:
+    "Converts a SCOPE_DATA_EXT message's data to the [index, times, *signals] list older frontends append from"
+    index, columns = unpack_scope_data(data)
+    return [index, *columns.tolist()]
+
+
+def decimate(columns: np.ndarray, rate: float) -> np.ndarray:
+    """Reduces each 1 / rate second bucket of samples to its min and max value of each signal.
+
+    The pair are sent at the bucket's first and last sample times, in the order they occurred in, so that
+    a ramp stays a ramp. Returns the columns as they are if no bucket holds more than one sample.
+    """
+    t = columns[0]
+    buckets = np.floor(t * rate)
+    ends = np.flatnonzero(np.diff(buckets)) + 1
+    if len(ends) + 1 == len(t):
+        return columns
+    starts = np.concatenate(([0], ends))
+    lasts = np.concatenate((ends, [len(t)])) - 1
+
+    signals = columns[1:]
+    mins = np.minimum.reduceat(signals, starts, axis=1)
+    maxs = np.maximum.reduceat(signals, starts, axis=1)
+    falling = signals[:, starts] > signals[:, lasts]
+
+    decimated = np.empty((len(columns), 2 * len(starts)), columns.dtype)
+    decimated[0, 0::2] = t[starts]
+    decimated[0, 1::2] = t[lasts]
+    decimated[1:, 0::2] = np.where(falling, maxs, mins)
+    decimated[1:, 1::2] = np.where(falling, mins, maxs)
+
+    single = starts == lasts  # buckets of one sample send it once
+    if single.any():
+        keep = np.ones(decimated.shape[1], bool)
+        keep[1::2] = ~single
+        decimated = decimated[:, keep]
+    return decimated
+
+
+class _Batch:
+    "A preallocated buffer of samples, a row each: its time, then each signal's value"
+
+    def __init__(self, capacity: int, width: int):
+        self.samples = np.empty((capacity, width))
+        # written through a flat memoryview, which is several times faster than indexing the array for each sample
+        self.view = memoryview(self.samples).cast("B").cast("d")
+        self.count = 0  # rows written. Only advanced by the writer, once a row's complete
+        self.flushed = 0  # rows flushed. Only advanced by the flusher
+
+
+class ScopeBuffer:
+    """Accumulates a scope's samples between tuner updates.
+
+    Samples are written into preallocated batches without taking a lock, so that the scope's tick never
+    waits on `flush()` - which may run on the tuner's I/O thread. A full batch is handed to flush() through
+    a deque and the writer moves on to a new one. flush() also reads the batch being written, up to its count,
+    which the writer only advances once a row's complete. Each batch counts the rows flushed from it, so none
+    are sent twice however the two interleave. Deque appends and pops, and attribute assignments, are atomic:
+    so this is safe for one writer at a time (a scope only ticks on its own clock) and one flusher.
+
+    A decimated scope's samples are held until they span more than one bucket, so that each batch is worth
+    decimating - delaying them by at most a display period.
+
+    :param index: the scope's index, as sent in its SCOPE_DATA_EXT messages
+    :param n_signals: number of signals plotted by the scope
+    :param rate: display rate to decimate to, in samples per second. None sends every sample
+    :param capacity: number of samples each batch holds
+    """
+
+    def __init__(self, index: int, n_signals: int, rate: Optional[float] = None, capacity: int = 256):
+        assert rate is None or rate > 0, "scope rate must be positive"
+        self.index = index
+        self.n_signals = n_signals
+        self.rate = rate
+
+        self._capacity = capacity
+        self._batch = _Batch(capacity, n_signals + 1)  # being written
+        self._filled: Deque[_Batch] = deque()  # full batches, oldest first, handed from append() to flush()
+        self._held: Optional[np.ndarray] = None  # samples taken by flush() but not yet sent
+
+    def append(self, t: float, data: Sequence):
+        "Records a sample of each signal at time t. Signals may be numbers or 1-element arrays"
+        batch = self._batch
+        count = batch.count
+        if count == self._capacity:
+            batch, count = self._next_batch(), 0
+        view = batch.view
+        i = count * (self.n_signals + 1)
+        view[i] = float(t)
+        for x in data:
+            i += 1
+            try:
+                view[i] = x
+            except TypeError:  # not a float - ie; an int or a 1-element array
+                view[i] = np.asarray(x, float).item()
+        batch.count = count + 1
+
+    def _next_batch(self) -> _Batch:
+        # handed off before the next is published, so that flush() finds it once it can see the next
+        self._filled.append(self._batch)
+        self._batch = _Batch(self._capacity, self.n_signals + 1)
+        return self._batch
+
+    def _take(self) -> Optional[np.ndarray]:
+        # copies out the rows appended since the last call, after any held ones. The batch being written is
+        # looked up first: every batch before it is in the deque by then, so is read before it
+        writing = self._batch
+        batches = []
+        while self._filled:
+            batches.append(self._filled.popleft())
+        batches.append(writing)  # may have been handed off meanwhile: its flushed count skips any rows read already
+
+        rows = [] if self._held is None else [self._held]
+        for batch in batches:
+            count = batch.count
+            rows.append(batch.samples[batch.flushed:count])
+            batch.flushed = count
+        rows = np.concatenate(rows)
+        return rows if len(rows) else None
+
+    def flush(self) -> Optional[msgpack.ExtType]:
+        "Returns the samples appended since the last flush as a SCOPE_DATA_EXT message, or None if there are none"
+        rows = self._take()
+        self._held = None
+        if rows is None:
+            return None
+        if self.rate and len(rows) > 1 and math.floor(rows[0, 0] * self.rate) == math.floor(rows[-1, 0] * self.rate):
+            self._held = rows  # the bucket's still filling
+            return None
+
+        columns = rows.T
+        if self.rate:
+            columns = decimate(columns, self.rate)
+        return pack_scope_data(self.index, columns)
@@ -0,0 +1,194 @@
+import mmap
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from bdsim.components import Block, Clock
+
+if TYPE_CHECKING:
+    from .tuning import Tuner
+
+
+def _shared_zeros(shape: Tuple[int, ...], dtype=np.float64) -> np.ndarray:
+    # backed by anonymous shared memory so that ticks recorded by forked
+    # clock processes (run(executor='process')) are visible to the parent
+    nbytes = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+    return np.frombuffer(mmap.mmap(-1, nbytes), dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+
+
+class ClockTimings:
+    """Timing of the most recent `capacity` ticks of one clock, recorded into preallocated ring buffers.
+
+    Times are in seconds. `scheduled`, `started` and `finished` use the scheduler's clock,
+    block durations are measured with `time.perf_counter()`.
+    """
+
+    def __init__(self, clock: Clock, blocks: Sequence[Block], capacity: int):
+        self.clock = clock
+        self.blocks = list(blocks)
+        self.capacity = capacity
+
+        self._scheduled = _shared_zeros((capacity,))
+        self._started = _shared_zeros((capacity,))
+        self._finished = _shared_zeros((capacity,))
+        # duration of each block's next() (ClockedBlocks only) and output() / step()
+        self._next_durations = _shared_zeros((capacity, len(self.blocks)))
+        self._exec_durations = _shared_zeros((capacity, len(self.blocks)))
+        # garbage collection pauses run after each tick (run(gc_mode='idle') only)
+        self._gc_pauses = _shared_zeros((capacity,))
+        self._count = _shared_zeros((1,), dtype=np.int64)
+
+        self.tuner: Optional['Tuner'] = None
+        self.scope_id: Optional[int] = None
+
+    def begin_tick(self, scheduled_time: float, started: float) -> Tuple[np.ndarray, np.ndarray]:
+        "Records the start of a tick. Returns the rows to write block next() and output()/step() durations into"
+        row = self._count[0] % self.capacity
+        self._scheduled[row] = scheduled_time
+        self._started[row] = started
+        self._gc_pauses[row] = 0.0
+        return self._next_durations[row], self._exec_durations[row]
+
+    def end_tick(self, finished: float, t: float):
+        count = self._count[0]
+        row = count % self.capacity
+        self._finished[row] = finished
+        self._count[0] = count + 1
+
+        if self.tuner:
+            scheduled = self._scheduled[row]
+            started = self._started[row]
+            self.tuner.queue_signal_update(self.scope_id, t, [
+                (started - scheduled) * 1e3,
+                (finished - started) * 1e3,
+                (scheduled + self.clock.T - finished) * 1e3
+            ])
+
+    def record_gc(self, pause: float):
+        "Records a garbage collection pause run after the most recently ended tick"
+        self._gc_pauses[(self._count[0] - 1) % self.capacity] = pause
+
+    @property
+    def ticks(self) -> int:
+        "Total number of ticks recorded, including those overwritten in the ring buffers"
+        return int(self._count[0])
+
+    def _ordered(self, buf: np.ndarray) -> np.ndarray:
+        # the recorded rows of a ring buffer, oldest first
+        count = self.ticks
+        if count <= self.capacity:
+            return buf[:count]
+        row = count % self.capacity
+        return np.concatenate((buf[row:], buf[:row]))
+
+    @property
+    def scheduled(self) -> np.ndarray:
+        return self._ordered(self._scheduled)
+
+    @property
+    def started(self) -> np.ndarray:
+        return self._ordered(self._started)
+
+    @property
+    def finished(self) -> np.ndarray:
+        return self._ordered(self._finished)
+
+    @property
+    def next_durations(self) -> np.ndarray:
+        "(ticks, blocks) array of the time spent in each block's next(). Zero for blocks that aren't clocked"
+        return self._ordered(self._next_durations)
+
+    @property
+    def exec_durations(self) -> np.ndarray:
+        "(ticks, blocks) array of the time spent in each block's output() or step()"
+        return self._ordered(self._exec_durations)
+
+    @property
+    def gc_pauses(self) -> np.ndarray:
+        "Duration of the garbage collection run after each tick. Zero where none was run"
+        return self._ordered(self._gc_pauses)
+
+    @property
+    def jitter(self) -> np.ndarray:
+        "How late each tick started"
+        return self.started - self.scheduled
+
+    @property
+    def duration(self) -> np.ndarray:
+        return self.finished - self.started
+
+    @property
+    def slack(self) -> np.ndarray:
+        "Time left between the end of each tick and the next deadline. Negative on overruns"
+        return self.scheduled + self.clock.T - self.finished
+
+    def percentiles(self, q: Sequence[float] = (50, 90, 99, 99.9)) -> Dict[str, np.ndarray]:
+        "Percentiles `q` of jitter, duration and slack"
+        return {
+            name: np.percentile(values, q) if len(values) else np.full(len(q), np.nan)
+            for name, values in (('jitter', self.jitter), ('duration', self.duration), ('slack', self.slack))
+        }
+
+    def histogram(self, bins=50) -> Tuple[np.ndarray, np.ndarray]:
+        "Histogram of tick start jitter, as returned by `np.histogram`"
+        return np.histogram(self.jitter, bins=bins)
+
+    def summary(self, q: Sequence[float] = (50, 90, 99, 99.9)) -> str:
+        lines = ["{} ({} ticks)".format(self.clock.name, self.ticks)]
+        lines.append("  {:<10}".format("ms") + "".join("{:>10}".format("p{:g}".format(p)) for p in q))
+        for name, values in self.percentiles(q).items():
+            lines.append("  {:<10}".format(name) + "".join("{:>10.3f}".format(v * 1e3) for v in values))
+
+        gc_pauses = self.gc_pauses
+        gc_pauses = gc_pauses[gc_pauses > 0]
+        if len(gc_pauses):
+            lines.append("  {:<10}".format("gc") + "".join("{:>10.3f}".format(v * 1e3) for v in np.percentile(gc_pauses, q))
+                         + "  ({} collections)".format(len(gc_pauses)))
+
+        if self.ticks:
+            block_durations = self.next_durations + self.exec_durations
+            lines.append("  {:<30}{:>10}{:>10}".format("block (ms)", "mean", "max"))
+            for block, mean, maximum in zip(self.blocks, block_durations.mean(axis=0), block_durations.max(axis=0)):
+                lines.append("  {:<30}{:>10.3f}{:>10.3f}".format(str(block), mean * 1e3, maximum * 1e3))
+
+        return "\n".join(lines)
+
+
+class TickTimings:
+    """Per-clock, per-tick timing instrumentation for `bdsim_realtime.run()`.
+
+    Pass an instance as `run(bd, timings=...)` and inspect it once `run()` returns ie;
+
+        timings = TickTimings()
+        bdsim_realtime.run(bd, max_time=10, timings=timings)
+        print(timings.summary())
+        counts, edges = timings[clock].histogram()
+
+    :param capacity: number of most recent ticks to keep for each clock, defaults to 10000
+    :param stream: if True and `run()` is given a tuner, stream each tick's jitter, duration
+        and slack (in ms) to a signal scope per clock, defaults to False
+    """
+
+    def __init__(self, capacity: int = 10000, stream: bool = False):
+        self.capacity = capacity
+        self.stream = stream
+        self.clocks: Dict[Clock, ClockTimings] = {}
+
+    def attach(self, clock2plan: Dict[Clock, List[Block]], tuner: Optional['Tuner'] = None):
+        "Allocates buffers for each clock's plan. Called by `run()` before `tuner.setup()`"
+        self.clocks = {
+            clock: ClockTimings(clock, plan, self.capacity)
+            for clock, plan in clock2plan.items()
+        }
+
+        if self.stream and tuner:
+            for clock_timings in self.clocks.values():
+                clock_timings.tuner = tuner
+                clock_timings.scope_id = tuner.register_signal_scope(
+                    "{} timing".format(clock_timings.clock.name), 3,
+                    labels=['jitter (ms)', 'duration (ms)', 'slack (ms)'])
+
+    def __getitem__(self, clock: Clock) -> ClockTimings:
+        return self.clocks[clock]
+
+    def summary(self, q: Sequence[float] = (50, 90, 99, 99.9)) -> str:
+        return "\n".join(clock_timings.summary(q) for clock_timings in self.clocks.values())
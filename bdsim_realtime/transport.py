@@ -0,0 +1,501 @@
+import secrets
+import select
+import socket
+import struct
+import time
+from abc import ABC, abstractmethod
+from io import IOBase
+from multiprocessing import shared_memory
+from typing import Any, List, Optional, Sequence, Union
+
+import msgpack
+import numpy as np
+from typing_extensions import Literal
+
+
+PROTOCOL_VERSION = '0.3.0'
+
+Role = Literal["sender", "receiver"]
+
+# msgpack extension type carrying a NumPy array: a packed [dtype.str, shape] header followed by the raw C-ordered data
+NDARRAY_EXT = 1
+
+
+def _pack_default(obj: Any) -> Any:
+    # called by msgpack for types it doesn't know. Arrays that can't be referenced in place
+    # (ie; nested inside other containers) are copied into an ExtType
+    if isinstance(obj, np.ndarray):
+        obj = np.ascontiguousarray(obj)
+        return msgpack.ExtType(NDARRAY_EXT, msgpack.packb([obj.dtype.str, obj.shape]) + obj.tobytes())
+    elif isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError("Cannot serialize {!r}".format(obj))
+
+
+def _ext_hook(code: int, data: bytes) -> Any:
+    if code != NDARRAY_EXT:
+        return msgpack.ExtType(code, data)
+    unpacker = msgpack.Unpacker()
+    unpacker.feed(data)
+    dtype, shape = unpacker.unpack()
+    # a read-only view of the received bytes; no further copies
+    return np.frombuffer(data, dtype, offset=unpacker.tell()).reshape(shape)
+
+
+def _ext_header(length: int) -> bytes:
+    if length < 1 << 8:
+        return struct.pack(">BBb", 0xc7, length, NDARRAY_EXT)
+    elif length < 1 << 16:
+        return struct.pack(">BHb", 0xc8, length, NDARRAY_EXT)
+    return struct.pack(">BIb", 0xc9, length, NDARRAY_EXT)
+
+
+def record_dtype(schema: Union[int, Any]) -> np.dtype:
+    """The layout of each packet sent once a schema has been negotiated: a sequence number, the sender's
+    simulation time and the channels' values
+
+    :param schema: the channels. An int for that many float64 channels, or anything `np.dtype()` accepts
+        for a structured dtype ie; `[('x', 'f4'), ('image', 'u1', (48, 64))]`
+    """
+    channels = np.dtype([('c{}'.format(i), '<f8') for i in range(schema)]) if isinstance(schema, int) \
+        else np.dtype(schema)
+    assert channels.names, "A schema needs named channels, not {}".format(channels)
+    return np.dtype([('seq', '<u8'), ('t', '<f8'), ('values', channels)])
+
+
+def _descr_from_wire(descr: Any) -> Any:
+    # msgpack turns the tuples of a dtype's descr into lists
+    if isinstance(descr, str):
+        return descr
+    return [(field[0], _descr_from_wire(field[1])) + tuple(tuple(x) for x in field[2:]) for field in descr]
+
+
+def _pack_frames(packer: msgpack.Packer, obj: Any) -> List[Any]:
+    """Packs `obj` into a list of buffers to be written back-to-back.
+
+    Contiguous arrays in a top-level list or tuple (ie; a block's inputs) are framed as NDARRAY_EXT
+    by hand so that their data can be passed on as a memoryview of the array itself rather than copied.
+    """
+    if not (isinstance(obj, (list, tuple)) and any(isinstance(x, np.ndarray) for x in obj)):
+        return [packer.pack(obj)]
+
+    frames = []
+    pending = [packer.pack_array_header(len(obj))]
+    for x in obj:
+        if isinstance(x, np.ndarray) and x.flags.c_contiguous and not x.dtype.hasobject:
+            meta = packer.pack([x.dtype.str, x.shape])
+            pending += [_ext_header(len(meta) + x.nbytes), meta]
+            frames.append(b"".join(pending))
+            frames.append(x.reshape(-1).view(np.uint8).data)
+            pending = []
+        else:
+            pending.append(packer.pack(x))
+    if pending:
+        frames.append(b"".join(pending))
+    return frames
+
+
+class Transport(ABC):
+    """A bidirectional message transport for DataSender / DataReceiver blocks.
+
+    If a schema is negotiated by `handshake()`, packets are then exchanged as fixed-size records of
+    `record_dtype(schema)` with `send_record()` and `poll_records()` instead of as msgpack messages.
+    Receivers count gaps in the sequence numbers in `self.lost` and discard (and count in `self.reordered`)
+    records older than one already received.
+    """
+
+    schema: Optional[np.dtype] = None  # the negotiated record layout
+    lost = 0
+    reordered = 0
+
+    @abstractmethod
+    def send(self, obj: Any):
+        "Sends `obj` without blocking (where the underlying medium allows)"
+        pass
+
+    @abstractmethod
+    def poll(self) -> List[Any]:
+        "Returns all messages received since the last call, without blocking (where the underlying medium allows)"
+        pass
+
+    @abstractmethod
+    def recv(self, timeout: Optional[float] = None) -> Any:
+        "Blocks until the next message is received. Used for handshakes"
+        pass
+
+    def send_record(self, t: float, values: Sequence[Any]):
+        "Sends one record of the negotiated schema"
+        raise NotImplementedError("{} doesn't support schemas".format(type(self).__name__))
+
+    def poll_records(self) -> np.ndarray:
+        "Returns the records received since the last call, in order"
+        raise NotImplementedError("{} doesn't support schemas".format(type(self).__name__))
+
+    def handshake(self, role: Role, schema: Optional[Union[int, Any]] = None):
+        """Blocks until the other end is connected and speaks the same protocol version.
+
+        :param schema: senders only. If given, proposes to send fixed-size records with these channels
+            (see :func:`record_dtype`) rather than msgpack messages. The receiver adopts the sender's schema
+        """
+        hello = {'version': PROTOCOL_VERSION, 'role': role, 'schema': None}
+        # SYN -> server(receiver):SYN-ACK -> ACK (copy TCP scheme)
+        if role == "sender":
+            if schema is not None:
+                hello['schema'] = record_dtype(schema).descr
+            self.send(hello)
+            syn_ack = self.recv()
+            assert syn_ack['version'] == PROTOCOL_VERSION
+            # the receiver echoes the schema back to accept it
+            accepted = syn_ack.get('schema')
+            self.send(hello)
+        else:
+            syn = self.recv()
+            assert syn['version'] == PROTOCOL_VERSION
+            hello['schema'] = accepted = syn.get('schema')
+            self.send(hello)
+            ack = self.recv()
+            assert ack['version'] == PROTOCOL_VERSION
+
+        if hello['schema'] is not None:
+            assert accepted is not None, "The receiver didn't accept the schema"
+            self._use_schema(np.lib.format.descr_to_dtype(_descr_from_wire(accepted)))
+
+    def _use_schema(self, schema: np.dtype):
+        self.schema = schema
+        self._seq = 0  # sender side
+        self._record = np.zeros(1, schema)
+        self._record_bytes = self._record.view(np.uint8).data
+        self._last_seq = -1  # receiver side
+        self._pending = bytearray()  # received bytes not yet making up a whole record
+
+    def _pack_record(self, t: float, values: Sequence[Any]) -> memoryview:
+        # fills the preallocated record. The returned view is only valid until the next call
+        self._record[0] = (self._seq, t, tuple(values))
+        self._seq += 1
+        return self._record_bytes
+
+    def _unpack_records(self) -> np.ndarray:
+        # takes all whole records out of self._pending
+        n_bytes = len(self._pending) - len(self._pending) % self.schema.itemsize
+        # copied once, as bytes - far cheaper than copying a structured array. The view is released so that
+        # self._pending can be resized
+        with memoryview(self._pending) as pending:
+            records = np.frombuffer(bytes(pending[:n_bytes]), self.schema)
+        del self._pending[:n_bytes]
+        if not len(records):
+            return records
+
+        seqs = records['seq'].tolist()
+        first = seqs[0]
+        if first > self._last_seq and seqs == list(range(first, first + len(seqs))):
+            # the usual case: in order with no gaps within the batch
+            self.lost += first - self._last_seq - 1
+            self._last_seq = seqs[-1]
+            return records
+
+        seqs = np.array(seqs, dtype=np.int64)
+        newest_before = np.maximum.accumulate(np.concatenate(([self._last_seq], seqs[:-1])))
+        in_order = seqs > newest_before
+        self.reordered += len(records) - int(in_order.sum())
+        records, seqs, newest_before = records[in_order], seqs[in_order], newest_before[in_order]
+        self.lost += int((seqs - newest_before - 1).sum())
+        if len(seqs):
+            self._last_seq = int(seqs[-1])
+        return records
+
+
+class SocketTransport(Transport):
+    """Non-blocking msgpack stream over a connected socket.
+
+    Messages are packed and written with a single vectored `sendmsg()` call; arrays among the values sent
+    are referenced in place rather than copied (see :data:`NDARRAY_EXT`).
+    If the socket can't take all of it (ie; the link hiccups), the remainder is kept in a backlog
+    which is sent ahead of the next message - vectored into the same `sendmsg()` call.
+    New messages are dropped (and counted in `self.dropped`) while the backlog exceeds `max_backlog` bytes
+    so that a stalled receiver can't grow it without bound.
+
+    Received bytes are read into a preallocated buffer and fed into a streaming `msgpack.Unpacker`.
+
+    :param sock: a connected stream socket. Will be switched to non-blocking mode
+    :param recv_size: size of the receive buffer, defaults to 64KiB
+    :param max_backlog: maximum number of unsent bytes to hold, defaults to 1MiB
+    """
+
+    def __init__(self, sock: socket.socket, recv_size: int = 1 << 16, max_backlog: int = 1 << 20):
+        self.sock = sock
+        sock.setblocking(False)
+        self.max_backlog = max_backlog
+        self.dropped = 0
+
+        self._packer = msgpack.Packer(default=_pack_default)
+        self._backlog = bytearray()
+        self._recv_buf = bytearray(recv_size)
+        self._unpacker = msgpack.Unpacker(ext_hook=_ext_hook)
+
+    def send(self, obj: Any):
+        if len(self._backlog) > self.max_backlog:
+            # only try to catch up on the backlog
+            self.dropped += 1
+            self._flush([self._backlog])
+            return
+
+        frames = _pack_frames(self._packer, obj)
+        self._flush([self._backlog] + frames if self._backlog else frames)
+
+    def send_record(self, t: float, values: Sequence[Any]):
+        if len(self._backlog) > self.max_backlog:
+            self.dropped += 1
+            self._seq += 1  # so the receiver sees the gap
+            self._flush([self._backlog])
+            return
+
+        record = self._pack_record(t, values)
+        self._flush([self._backlog, record] if self._backlog else [record])
+
+    def _flush(self, buffers: List[Any]):
+        try:
+            sent = self.sock.sendmsg(buffers)
+        except BlockingIOError:
+            sent = 0
+
+        # keep whatever didn't make it
+        total = sum(len(buf) for buf in buffers)
+        if sent < total:
+            unsent = bytearray()
+            for buf in buffers:
+                if sent >= len(buf):
+                    sent -= len(buf)
+                else:
+                    unsent += buf[sent:]
+                    sent = 0
+            self._backlog = unsent
+        else:
+            self._backlog.clear()
+
+    def poll(self) -> List[Any]:
+        self._receive(self._unpacker.feed)
+        return list(self._unpacker)
+
+    def poll_records(self) -> np.ndarray:
+        self._receive(self._pending.extend)
+        return self._unpack_records()
+
+    def _receive(self, feed):
+        # passes everything available to feed() without blocking
+        if self._backlog:
+            self._flush([self._backlog])
+
+        while True:
+            try:
+                n_bytes = self.sock.recv_into(self._recv_buf)
+            except BlockingIOError:
+                break
+            if n_bytes == 0:
+                raise ConnectionError("Remote end closed the connection")
+            feed(memoryview(self._recv_buf)[:n_bytes])
+
+    def _use_schema(self, schema: np.dtype):
+        super()._use_schema(schema)
+        # the handshake may have already read the start of the first records into the unpacker
+        self._pending += self._unpacker.read_bytes(1 << 62)
+
+    def recv(self, timeout: Optional[float] = None) -> Any:
+        while True:
+            try:
+                return next(self._unpacker)
+            except StopIteration:
+                pass
+            readable, _, _ = select.select([self.sock], [], [], timeout)
+            if not readable:
+                raise TimeoutError("No message received within {}s".format(timeout))
+            n_bytes = self.sock.recv_into(self._recv_buf)
+            if n_bytes == 0:
+                raise ConnectionError("Remote end closed the connection")
+            self._unpacker.feed(memoryview(self._recv_buf)[:n_bytes])
+
+
+class StreamTransport(Transport):
+    """Blocking msgpack stream over a file-like object, such as `socket.makefile('rwb')` or a serial port.
+
+    File-like objects can't be read without blocking, so `poll()` waits for one message.
+    Prefer :class:`SocketTransport` where possible.
+    """
+
+    def __init__(self, stream: IOBase, read_size: int = 1 << 16):
+        self.stream = stream
+        self.read_size = read_size
+        # read1() returns whatever is buffered/available rather than waiting for read_size bytes
+        self._read = getattr(stream, 'read1', stream.read)
+        self._packer = msgpack.Packer(default=_pack_default)
+        self._unpacker = msgpack.Unpacker(ext_hook=_ext_hook)
+
+    def send(self, obj: Any):
+        for frame in _pack_frames(self._packer, obj):
+            self.stream.write(frame)
+        self.stream.flush()  # required
+
+    def send_record(self, t: float, values: Sequence[Any]):
+        self.stream.write(self._pack_record(t, values))
+        self.stream.flush()
+
+    def poll(self) -> List[Any]:
+        return [self.recv()]
+
+    def poll_records(self) -> np.ndarray:
+        while len(self._pending) < self.schema.itemsize:
+            data = self._read(self.read_size)
+            if not data:
+                raise ConnectionError("Stream closed")
+            self._pending += data
+        return self._unpack_records()
+
+    def _use_schema(self, schema: np.dtype):
+        super()._use_schema(schema)
+        # the handshake may have already read the start of the first records into the unpacker
+        self._pending += self._unpacker.read_bytes(1 << 62)
+
+    def recv(self, timeout: Optional[float] = None) -> Any:
+        while True:
+            try:
+                return next(self._unpacker)
+            except StopIteration:
+                pass
+            data = self._read(self.read_size)
+            if not data:
+                raise ConnectionError("Stream closed")
+            self._unpacker.feed(data)
+
+
+class SharedMemoryTransport(Transport):
+    """One-way ring buffer of fixed-layout NumPy records in `multiprocessing.shared_memory`, for senders and receivers on the same host.
+
+    Each `send()` writes one record straight into the next slot of the ring - no serialization or syscalls.
+    Every slot has its own sequence lock: the writer marks it odd while writing and even afterwards,
+    and a reader only accepts a copy if the slot held the record it expected both before and after copying.
+    The writer never waits; a receiver that falls more than `capacity` records behind skips ahead to the oldest one
+    still in the ring, counting the rest in `self.dropped`.
+
+    Create it once (`name=None`) and hand the same object to both blocks if they share a process or are forked from it
+    (ie; `run(executor='process')`), otherwise attach to it from another process by name ie;
+
+        # sender process
+        transport = SharedMemoryTransport(3)
+        bd.DATASENDER(transport, a, b, c, nin=3, clock=clock)
+        # receiver process
+        bd.DATARECEIVER(SharedMemoryTransport(3, name=transport.name), nout=3, clock=clock)
+
+    :param dtype: layout of each record. Pass a NumPy (structured) dtype, or an int for that many float64 channels
+    :param capacity: number of records the ring holds, defaults to 1024
+    :param name: name of an existing ring to attach to, defaults to None: create a new one
+    """
+
+    _HEADER = struct.Struct("<4s12sQQQ")  # magic, protocol version, record itemsize, capacity, number of records written
+    _COUNT_OFFSET = 32
+
+    def __init__(self, dtype: Union[np.dtype, int], capacity: int = 1024, name: Optional[str] = None):
+        self.dtype = np.dtype((np.float64, (dtype,))) if isinstance(dtype, int) else np.dtype(dtype)
+        self.capacity = capacity
+        self.dropped = 0
+        self.owner = name is None
+
+        size = self._HEADER.size + 8 * capacity + self.dtype.itemsize * capacity
+        if self.owner:
+            self.shm = shared_memory.SharedMemory("bdrt_" + secrets.token_hex(8), create=True, size=size)
+            self._HEADER.pack_into(self.shm.buf, 0, b"BDRT", PROTOCOL_VERSION.encode(), self.dtype.itemsize, capacity, 0)
+        else:
+            self.shm = shared_memory.SharedMemory(name)
+        self.name = self.shm.name
+
+        buf = self.shm.buf
+        # counters go through memoryviews: indexing them is far cheaper than NumPy scalar access
+        self._count = buf[self._COUNT_OFFSET:self._HEADER.size].cast('Q')
+        self._seqs = buf[self._HEADER.size:self._HEADER.size + 8 * capacity].cast('Q')
+        self._records = np.frombuffer(buf, self.dtype, capacity, self._HEADER.size + 8 * capacity)
+
+        self._written = self._count[0]  # writer side
+        self._next = self._written  # reader side: index of the next record to read
+
+        # shape of each channel: a block's signals are often 1-element arrays, which must be reshaped to fit
+        self._shapes = [self.dtype[name].shape for name in self.dtype.names] if self.dtype.names \
+            else [self.dtype.shape[1:]] * self.dtype.shape[0] if self.dtype.shape else None
+
+    def handshake(self, role: Role, schema: Optional[Union[int, Any]] = None):
+        "Checks that the ring was created with the same protocol version and record layout. Doesn't block. The ring's dtype is its schema"
+        magic, version, itemsize, capacity, _ = self._HEADER.unpack_from(self.shm.buf, 0)
+        assert magic == b"BDRT" and version.rstrip(b"\0") == PROTOCOL_VERSION.encode(), \
+            "Shared memory {} is not a bdsim_realtime {} ring".format(self.name, PROTOCOL_VERSION)
+        assert (itemsize, capacity) == (self.dtype.itemsize, self.capacity), \
+            "Ring {} holds {} records of {} bytes, expected {} of {} bytes".format(
+                self.name, capacity, itemsize, self.capacity, self.dtype.itemsize)
+
+    def send(self, obj: Any):
+        n = self._written
+        slot = n % self.capacity
+        self._seqs[slot] = 2 * n + 1  # odd: write in progress
+        if self._shapes is None:
+            self._records[slot] = obj
+        else:
+            values = [np.reshape(value, shape) for value, shape in zip(obj, self._shapes)]
+            self._records[slot] = tuple(values) if self.dtype.names else values
+        self._seqs[slot] = 2 * n + 2  # even: holds record n
+        self._written = n + 1
+        self._count[0] = n + 1
+
+    def poll(self) -> List[Any]:
+        return self._read(None)
+
+    def recv(self, timeout: Optional[float] = None) -> Any:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            received = self._read(1)
+            if received:
+                return received[0]
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError("No record received within {}s".format(timeout))
+            time.sleep(1e-4)
+
+    def _read(self, limit: Optional[int]) -> List[Any]:
+        # reads up to `limit` of the unread records, oldest first
+        written = self._count[0]
+        if written - self._next > self.capacity:
+            # lapped by the writer: skip to the oldest record still in the ring
+            self.dropped += written - self.capacity - self._next
+            self._next = written - self.capacity
+        stop = written if limit is None else min(written, self._next + limit)
+
+        seqs, records, capacity = self._seqs, self._records, self.capacity
+        received = []
+        for n in range(self._next, stop):
+            slot = n % capacity
+            expected = 2 * n + 2
+            if seqs[slot] == expected:
+                record = records[slot].copy()
+                # discard the copy if the writer lapped us and started overwriting the slot while copying
+                if seqs[slot] == expected:
+                    received.append(record)
+                    continue
+            self.dropped += 1
+
+        self._next = stop
+        return received
+
+    def close(self):
+        # views into the buffer must be released before it can be closed
+        self._count.release()
+        self._seqs.release()
+        del self._records
+        self.shm.close()
+
+    def unlink(self):
+        "Destroys the ring. Call from the process that created it once all users have closed it"
+        self.shm.unlink()
+
+
+def as_transport(transport: Union[Transport, socket.socket, IOBase]) -> Transport:
+    "Wraps sockets and file-like objects in the appropriate Transport"
+    if isinstance(transport, Transport):
+        return transport
+    elif isinstance(transport, socket.socket):
+        return SocketTransport(transport)
+    else:
+        return StreamTransport(transport)
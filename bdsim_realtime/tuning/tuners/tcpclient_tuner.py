@@ -1,15 +1,17 @@
 import socket
-from select import poll, POLLIN
-from typing import Dict, List
+import threading
+from collections import deque
+from select import poll, POLLERR, POLLHUP, POLLIN, POLLOUT
+from typing import Any, Deque, Dict, List, Optional, Tuple
 import time
-from threading import Thread
 
-import flask
 import numpy as np
 import msgpack
 
 from bdsim_realtime.tuning.parameter import HyperParam, VecParam, Param
 from bdsim_realtime.tuning.tuners.tuner import Tuner
+from bdsim_realtime.scopes import ScopeBuffer
+from bdsim_realtime.video import FORMATS, FRAME_HEADER, MJPEG_BOUNDARY, _FrameBroadcaster, mjpeg_stream
 
 # TODO: review this timeout value
 TIMEOUT = 1e-6
@@ -24,11 +26,62 @@ def _get_local_ip():
     except OSError: # if not on any network
         return "localhost"
 
-class TcpClientTuner(Tuner):
-    "client for a tuning server such as bdsim-webtuner"
+def _to_builtin(x):
+    # called by msgpack only for values it can't pack. The webapp frontend only understands the extension
+    # types made for it (see `bdsim_realtime.video` and `bdsim_realtime.scopes`), not the DataSender's
+    # ndarray extension, so send plain numbers and lists
+    if isinstance(x, np.ndarray):
+        return x.item() if x.size == 1 else x.tolist()
+    elif isinstance(x, np.generic):
+        return x.item()
+    raise TypeError("Cannot serialize {!r}".format(x))
 
-    def __init__(self, hostname="localhost", port=31337):
+class TcpClientTuner(Tuner):
+    """client for a tuning server such as bdsim-webtuner
+
+    By default the socket is read and written by `update()`, which `run()` calls after each tick of the most
+    frequent clock - so that clock's ticks also wait on the network. Scope samples are only flushed from their
+    buffers, decimated and packed every `telemetry_interval` seconds, rather than by each update. With
+    `io_thread=True` a background thread owns the socket instead, and `update()` only applies the parameter
+    changes it has received:
+
+    - parameter changes are received and decoded by the I/O thread, and handed to `update()` (so applied
+      at a tick boundary) through a deque
+    - parameter changes made by the diagram are handed back through another deque
+    - scope samples are flushed from their buffers, decimated and packed by the I/O thread every
+      `telemetry_interval` seconds, along with any video frames the link has room for
+
+    Deque appends and pops are atomic, so neither side ever waits on the other or on the socket. If the I/O
+    thread stops - ie; the webapp disconnects - its error is kept in `self.error` and raised by the next
+    `update()`, and scope samples are no longer recorded.
+
+    Scope messages are dropped (and counted in `self.dropped`) while more than `max_backlog` bytes are waiting
+    to be sent, so that a stalled webapp can't grow the backlog without bound. Parameter messages are never dropped.
+
+    Video streams are served as MJPEG over HTTP, from a Flask server on `stream_port`, and shown by the webapp
+    from their URLs. With `link_video=True` their frames are sent over the link to the webapp instead, in any of
+    `bdsim_realtime.video`'s formats - which needs a webapp frontend built from the current `frontend/` sources.
+
+    :param scope_rate: display rate, in samples per second, to decimate signal scopes to before sending them
+        (see `bdsim_realtime.scopes`). None sends every sample. Scopes may override it when registered
+    :param io_thread: run the network I/O on a background thread, started by `setup()`, defaults to False
+    :param telemetry_interval: seconds between scope messages, defaults to 1/60
+    :param max_backlog: maximum number of unsent bytes before scope messages are dropped, defaults to 1MiB
+    :param link_video: send video frames over the link to the webapp rather than serving them over HTTP, defaults to False
+    :param stream_port: port to serve the video streams on over HTTP, defaults to 7646
+    """
+
+    def __init__(self, hostname="localhost", port=31337, scope_rate: Optional[float] = None,
+                 io_thread: bool = False, telemetry_interval: float = 1 / 60, max_backlog: int = 1 << 20,
+                 link_video: bool = False, stream_port: int = 7646):
         super().__init__()
+        self.link_video = link_video
+        self.stream_port = stream_port
+        self.scope_rate = scope_rate
+        self.io_thread = io_thread
+        self.telemetry_interval = telemetry_interval
+        self.max_backlog = max_backlog
+        self.dropped = 0
         self.id2param: Dict[int, Param] = {}  # id -> param
         self.param2id: Dict[Param, int] = {} # param -> id
 
@@ -46,51 +99,91 @@ class TcpClientTuner(Tuner):
         self.poll = poll()
         self.poll.register(sock, POLLIN)
 
-        self.stream_app = flask.Flask('flask_webstreams')
         self.ip = _get_local_ip()
-        self.stream_port = 7646
         self.video_streams = []
         self.signal_scopes = []
-        self.signal_queue = []
+        self._scope_buffers: List[ScopeBuffer] = []
+
+        # messages packed but not yet sent. Sent without blocking, as the socket accepts them
+        self._outbox = bytearray()
+        # the newest encoded frame of each video stream not yet sent, by stream id. Set by the streams' encoder threads
+        self._video_frames: Dict[int, msgpack.ExtType] = {}
+        # the MJPEG parts of each video stream served over HTTP, by stream id
+        self._mjpeg_streams: List[_FrameBroadcaster] = []
+        # received parameter changes not yet applied, and parameter definitions to send
+        self._param_updates: Deque[Tuple[Param, Any]] = deque()
+        self._param_defs: Deque[list] = deque()
+
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self.error: Optional[BaseException] = None  # what stopped the I/O thread, if anything
+        self._next_telemetry = time.monotonic()
 
         # unpack the data from msgpack into JSON for easy fast deserialization
         # self.unpacker = msgpack.Unpacker(use_list=False, raw=False)
         self.unpacker = msgpack.Unpacker()
+        self.packer = msgpack.Packer(default=_to_builtin)
 
 
-    def register_video_stream(self, feed_fn, name: str):
-        # eventually the socket will be used directly for the video stream.
-        # until then we'll host the stream using flask here.
-        name = name.replace(' ', '-')
-
-        # flask wants each endpoint to have separate '__name__'s...
-        named_feed = lambda: feed_fn()
-        named_feed.__name__ = name
+    def register_video_stream(self, name: str, format: str = "jpeg") -> int:
+        assert format in FORMATS, "Unknown video format {}. Choose from {}".format(format, FORMATS)
+        id = len(self.video_streams)
+        if self.link_video:
+            # frames are multiplexed over the socket to the webapp, which forwards them to its websocket clients
+            self.video_streams.append({'id': id, 'name': name, 'format': format})
+            return id
 
-        self.stream_app.route('/' + name)(named_feed)
+        # served over HTTP, from setup(). The webapp only knows their URLs
+        assert format == "jpeg", "Video streams served over HTTP are MJPEG. Use TcpClientTuner(link_video=True) for " + format
+        name = name.replace(' ', '-')
+        self._mjpeg_streams.append(_FrameBroadcaster())
         self.video_streams.append("http://%s:%d/%s" % (self.ip, self.stream_port, name))
+        return id
 
-    def register_signal_scope(self, name, n_signals, styles=None, labels=None):
+    def video_stream_ready(self, id: int) -> bool:
+        if self.link_video:
+            return id not in self._video_frames
+        return self._mjpeg_streams[id].due(time.monotonic())  # only encode frames that a client is due
+
+    def send_video_frame(self, id: int, frame: msgpack.ExtType):
+        if self.link_video:
+            self._video_frames[id] = frame
+        else:
+            payload = memoryview(frame.data)[FRAME_HEADER.size:]
+            self._mjpeg_streams[id].publish(b"".join((MJPEG_BOUNDARY, payload, b"\r\n")), time.monotonic())
+
+    def _video_app(self):
+        "A Flask app serving each video stream's MJPEG parts at the path of its URL"
+        import flask
+
+        app = flask.Flask('flask_webstreams')
+        for url, broadcaster in zip(self.video_streams, self._mjpeg_streams):
+            def video_feed(broadcaster=broadcaster):
+                fps = flask.request.args.get("fps", None, type=float)
+                return flask.Response(mjpeg_stream(broadcaster, fps), mimetype="multipart/x-mixed-replace; boundary=frame")
+
+            name = url.rsplit('/', 1)[-1]
+            app.add_url_rule('/' + name, name, video_feed)
+        return app
+
+    def register_signal_scope(self, name, n_signals, styles=None, labels=None, rate=None):
         id = len(self.signal_scopes) + 1 # avoid 0 to use truthyness
         self.signal_scopes.append({'name': name, 'n': n_signals, 'styles': styles, 'labels': labels})
+        self._scope_buffers.append(ScopeBuffer(id - 1, n_signals, rate=rate or self.scope_rate))
         return id
 
     def queue_signal_update(self, id, t, data):
-        self.signal_queue.append([
-            id - 1, # convert to index
-            t
-        ] + data)
+        # may be called from any clock's thread. Sent in a batch with the scope's other samples by update().
+        # Nothing will flush the scope once the I/O thread has stopped, so its samples are no longer kept
+        if self.error is None:
+            self._scope_buffers[id - 1].append(t, data)
 
     def setup(self):
         self.setup_param_map(self.gui_params)
 
-        # host the flask videostrema app in a separate thread (for now)
-        if any(self.video_streams):
-            Thread(
-                target=self.stream_app.run,
-                args=((self.ip, self.stream_port)),
-                daemon=True
-            ).start()
+        # host the flask video stream app in a separate thread
+        if self._mjpeg_streams:
+            threading.Thread(target=self._video_app().run, args=(self.ip, self.stream_port), daemon=True).start()
 
         msgpack.pack({
             'start_time': time.time() * 1000,
@@ -101,6 +194,10 @@ class TcpClientTuner(Tuner):
         }, self.stream)
         self.stream.flush()
 
+        if self.io_thread:
+            self._thread = threading.Thread(target=self._io_loop, name="tuner I/O", daemon=True)
+            self._thread.start()
+
     def get_param_defs(self, params, subparams=True):
         # recursively produce parameter definitions to be serialized by msgpack
         param_defs = []
@@ -136,8 +233,8 @@ class TcpClientTuner(Tuner):
             self.param2id[param] = id
 
             def gui_reconstructor(param):
-                msgpack.pack(self.get_param_defs([param], subparams=False), self.stream)
-                self.stream.flush()
+                # sent after any message already part-sent
+                self._param_defs.append(self.get_param_defs([param], subparams=False))
 
             param.register_gui_reconstructor(gui_reconstructor)
             if isinstance(param, HyperParam):
@@ -147,25 +244,94 @@ class TcpClientTuner(Tuner):
     def update(self):
         super().update()
 
-        # Anything new on the line?
-        if self.poll.poll(TIMEOUT):
-            # read all available streamed bytes and process any complete param val changes.
-            # all param updates should be a JSON-like tuple of [id, val]
-
-            # TODO: review this buffer size
-            self.unpacker.feed(self.sock.recv(2048))
-
-            for param_id, val in self.unpacker:
-                param = self.id2param[param_id]
-
-                # decode vectors into np arrays
-                param.val = np.array(val) if isinstance(param, VecParam) else val
-
-        # submit any queued signal updates
-        for update in self.signal_queue:
-            for idx, u in enumerate(update):
-                while isinstance(u, np.ndarray) and len(u) == 1:
-                    update[idx] = u = u[0]
-            msgpack.pack(update, self.stream)
-        self.stream.flush()
-        self.signal_queue = []
+        if self.error is not None:
+            raise self.error  # the I/O thread stopped: nothing more can be sent or received
+
+        if self._thread is None:
+            if self.poll.poll(TIMEOUT):
+                self._receive()
+            self._pack_messages(scopes=self._telemetry_due())
+            self._send_outbox()
+
+        # apply the parameter changes received, at this tick boundary
+        while self._param_updates:
+            param, val = self._param_updates.popleft()
+            param.val = val
+
+    def close(self):
+        "Stops the I/O thread, if any, and closes the connection"
+        if self._thread is not None:
+            self._stopped.set()
+            self._thread.join()
+        for broadcaster in self._mjpeg_streams:
+            broadcaster.close()
+        self.stream.close()
+        self.sock.close()
+
+    def _telemetry_due(self) -> bool:
+        # whether to send the scopes' samples. Once per telemetry_interval, skipping any intervals missed
+        now = time.monotonic()
+        if now < self._next_telemetry:
+            return False
+        self._next_telemetry = max(self._next_telemetry + self.telemetry_interval, now)
+        return True
+
+    def _io_loop(self):
+        try:
+            while not self._stopped.is_set():
+                # wake for parameter changes, for room in the socket's buffer, or for the next telemetry
+                self.poll.modify(self.sock, POLLIN | POLLOUT if self._outbox else POLLIN)
+                for _, events in self.poll.poll(max(self._next_telemetry - time.monotonic(), 0) * 1e3):
+                    if events & POLLIN and not self._receive() or events & (POLLHUP | POLLERR):
+                        raise ConnectionError("The webapp closed the connection")
+
+                self._pack_messages(scopes=self._telemetry_due())
+                self._send_outbox()
+        except BaseException as e:
+            self.error = e
+            print("Tuner I/O stopped: {!r}".format(e))
+
+    def _receive(self) -> bool:
+        # read all available streamed bytes and queue any complete param val changes.
+        # all param updates should be a JSON-like tuple of [id, val]. Returns False once the webapp has disconnected
+
+        # TODO: review this buffer size
+        data = self.sock.recv(2048)
+        self.unpacker.feed(data)
+
+        for param_id, val in self.unpacker:
+            param = self.id2param[param_id]
+
+            # decode vectors into np arrays
+            self._param_updates.append((param, np.array(val) if isinstance(param, VecParam) else val))
+        return bool(data)
+
+    def _pack_messages(self, scopes=True):
+        # video frames only get the link once everything else has been sent, so that they never hold up
+        # parameter and scope messages. Until then each stream's newest frame replaces the last
+        link_idle = not self._outbox
+
+        while self._param_defs:
+            self._outbox += self.packer.pack(self._param_defs.popleft())
+
+        # each scope's samples since it was last sent, as one message
+        for scope in self._scope_buffers if scopes else ():
+            batch = scope.flush()
+            if not batch:
+                continue
+            if len(self._outbox) > self.max_backlog:
+                self.dropped += 1
+            else:
+                self._outbox += self.packer.pack(batch)
+
+        if link_idle:
+            for id in list(self._video_frames):
+                self._outbox += self.packer.pack(self._video_frames.pop(id))
+
+    def _send_outbox(self):
+        while self._outbox:
+            try:
+                sent = self.sock.send(self._outbox)
+            except (BlockingIOError, socket.timeout):
+                return  # the socket's buffer is full - send the rest later
+            del self._outbox[:sent]
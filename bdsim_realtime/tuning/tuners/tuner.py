@@ -36,16 +36,32 @@ class Tuner(ABC):
         self.queued_updates.append(update_fn)
 
     @abstractmethod
-    def register_video_stream(self, feed_fn, name):
+    def register_video_stream(self, name, format="jpeg"):
+        """Registers a video stream to be shown by the tuner's gui. Returns its id, for `send_video_frame()`.
+        See `bdsim_realtime.video` for the formats"""
+        pass
+
+    @abstractmethod
+    def video_stream_ready(self, id):
+        "Whether the stream's last frame has been sent, ie; whether it's worth encoding another"
+        pass
+
+    @abstractmethod
+    def send_video_frame(self, id, frame):
+        """Sends a video frame, encoded by a `bdsim_realtime.video.FrameEncoder`. May be called from any thread.
+        Replaces the stream's frame not yet sent, if any"""
         pass
 
 
     @abstractmethod
-    def register_signal_scope(self, feed_fn, name):
+    def register_signal_scope(self, name, n_signals, styles=None, labels=None, rate=None):
+        """Registers a scope plotting n_signals against time. Returns its id, for `queue_signal_update()`.
+        rate is the display rate to decimate its samples to, if the tuner supports it"""
         pass
 
     @abstractmethod
     def queue_signal_update(self, id, t, data):
+        "Records a sample of each of the scope's signals at time t. May be called from any clock's thread"
         pass
 
     # TODO: save_params() and load_params()
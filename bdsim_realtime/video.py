@@ -0,0 +1,234 @@
+"""Video frames multiplexed over the node <-> webapp TCP link, alongside the parameter and scope messages.
+
+Each frame is a msgpack extension type `VIDEO_FRAME_EXT` whose data is a fixed little-endian header
+(`FRAME_HEADER`: stream id, format, flags, width, height, channels) followed by the encoded image. The webapp
+forwards them to its websocket clients as they are, only reading the header to drop frames for slow clients.
+
+Formats:
+
+- 'jpeg' / 'webp': each frame compressed on its own with `cv2.imencode()`
+- 'raw': lossless. Keyframes are the zlib-compressed pixels, every other frame is the zlib-compressed XOR with
+  the frame before it - mostly zeros, and so small, wherever the image didn't change. A client that misses a
+  frame must wait for the next keyframe
+
+Also the `_FrameBroadcaster` that shares MJPEG-over-HTTP streams' parts between their clients.
+"""
+import struct
+import time
+import zlib
+from threading import Condition
+from typing import Any, Iterator, List, NamedTuple, Optional
+
+import msgpack
+import numpy as np
+from typing_extensions import Literal
+
+
+VIDEO_FRAME_EXT = 2
+
+VideoFormat = Literal["jpeg", "webp", "raw"]
+FORMATS = ("jpeg", "webp", "raw")  # by their index in a frame's header
+
+KEYFRAME = 0x1  # flag: the frame can be decoded without the frame before it
+
+FRAME_HEADER = struct.Struct("<HBBHHB")
+
+MJPEG_BOUNDARY = b"--frame\r\nContent-Type: image/jpeg\r\n\r\n"  # starts each part of an MJPEG stream
+
+
+class FrameHeader(NamedTuple):
+    stream_id: int
+    format: str
+    keyframe: bool
+    width: int
+    height: int
+    channels: int
+
+
+def pack_frame(stream_id: int, format: str, keyframe: bool, shape, payload) -> msgpack.ExtType:
+    "Frames an encoded image as a VIDEO_FRAME_EXT message"
+    height, width = shape[:2]
+    channels = shape[2] if len(shape) > 2 else 1
+    header = FRAME_HEADER.pack(stream_id, FORMATS.index(format), KEYFRAME if keyframe else 0, width, height, channels)
+    return msgpack.ExtType(VIDEO_FRAME_EXT, b"".join((header, payload)))
+
+
+def unpack_header(data: bytes) -> FrameHeader:
+    "Reads the header of a VIDEO_FRAME_EXT message's data. The encoded image follows it, from `FRAME_HEADER.size`"
+    stream_id, format, flags, width, height, channels = FRAME_HEADER.unpack_from(data)
+    return FrameHeader(stream_id, FORMATS[format], bool(flags & KEYFRAME), width, height, channels)
+
+
+class FrameEncoder:
+    """Encodes a video stream's frames into VIDEO_FRAME_EXT messages.
+
+    :param stream_id: the stream's id, as returned by `Tuner.register_video_stream()`
+    :param format: see the module docstring
+    :param quality: JPEG / WebP quality, 0-100
+    :param keyframe_interval: 'raw' sends every this many frames as a keyframe, so that clients that
+        missed a frame (or just connected) can resume
+    """
+
+    def __init__(self, stream_id: int, format: VideoFormat = "jpeg", quality: int = 80, keyframe_interval: int = 30):
+        assert format in FORMATS, "Unknown video format {}. Choose from {}".format(format, FORMATS)
+        self.stream_id = stream_id
+        self.format = format
+        self.quality = quality
+        self.keyframe_interval = keyframe_interval
+
+        self._frames = 0
+        self._prev: Optional[np.ndarray] = None  # the last 'raw' frame, which the next is a delta from
+        self._delta: Optional[np.ndarray] = None
+
+    def encode(self, frame: np.ndarray) -> msgpack.ExtType:
+        if self.format == "raw":
+            return self._encode_raw(frame)
+
+        import cv2
+        param = cv2.IMWRITE_JPEG_QUALITY if self.format == "jpeg" else cv2.IMWRITE_WEBP_QUALITY
+        success, encoded = cv2.imencode("." + self.format, frame, [param, self.quality])
+        assert success, "Failed to encode a video frame as " + self.format
+        return pack_frame(self.stream_id, self.format, True, frame.shape, memoryview(encoded))
+
+    def _encode_raw(self, frame: np.ndarray) -> msgpack.ExtType:
+        assert frame.dtype == np.uint8, "raw video frames must be uint8, not " + str(frame.dtype)
+        keyframe = self._prev is None or self._prev.shape != frame.shape \
+            or self._frames % self.keyframe_interval == 0
+        self._frames += 1
+
+        if keyframe:
+            self._prev = np.array(frame, order="C")
+            self._delta = np.empty_like(self._prev)
+            pixels = self._prev
+        else:
+            np.bitwise_xor(frame, self._prev, out=self._delta)
+            np.copyto(self._prev, frame)
+            pixels = self._delta
+        return pack_frame(self.stream_id, "raw", keyframe, frame.shape, zlib.compress(pixels.data, 1))
+
+
+def decode_raw(header: FrameHeader, payload: bytes, prev: Optional[np.ndarray] = None) -> np.ndarray:
+    "Decodes a 'raw' frame, given the frame before it unless it's a keyframe"
+    shape = (header.height, header.width, header.channels) if header.channels > 1 else (header.height, header.width)
+    pixels = np.frombuffer(zlib.decompress(payload), np.uint8).reshape(shape)
+    if header.keyframe:
+        return pixels.copy()
+    assert prev is not None and prev.shape == shape, "a delta frame needs the frame before it"
+    return np.bitwise_xor(pixels, prev)
+
+
+class _Subscriber:
+    """A subscriber to a `_FrameBroadcaster`, ie; a viewer of a stream.
+
+    Its counters show whether it's keeping up:
+
+    - `received`: frames taken
+    - `dropped`: frames it was due, but that were replaced by a newer frame before it took them
+    - `latency`: seconds from the last frame taken being published (by its stamp) to it being taken.
+      `max_latency` is the worst so far
+
+    :param fps: the most frames per second to take, defaults to every frame
+    """
+
+    def __init__(self, broadcaster: "_FrameBroadcaster", fps: Optional[float] = None):
+        self.broadcaster = broadcaster
+        self.period = 1 / fps if fps else 0.0
+        self.last_seen = broadcaster.version
+        self._next_due = 0.0
+
+        self.received = 0
+        self.dropped = 0
+        self.latency = 0.0
+        self.max_latency = 0.0
+
+    @property
+    def not_before(self) -> float:
+        # frames are due a little early, so that jitter in when they're captured doesn't skip them
+        return self._next_due - self.period / 10
+
+    def due(self, stamp: float) -> bool:
+        return stamp >= self.not_before
+
+    def next(self) -> Any:
+        "Waits for a newer frame than the last taken, and that it's due. Returns it, or None once the broadcaster is closed"
+        broadcaster = self.broadcaster
+        with broadcaster._cond:
+            broadcaster._cond.wait_for(
+                lambda: broadcaster.closed or (broadcaster.version > self.last_seen and self.due(broadcaster.stamp))
+            )
+            if broadcaster.closed:
+                return None
+            self.last_seen, value, stamp = broadcaster.version, broadcaster.value, broadcaster.stamp
+
+        # keep to the fps on average, but start over rather than catch up after falling a period behind
+        if stamp - self._next_due < self.period:
+            self._next_due += self.period
+        else:
+            self._next_due = stamp + self.period
+        self.received += 1
+        self.latency = time.monotonic() - stamp
+        self.max_latency = max(self.max_latency, self.latency)
+        return value
+
+
+class _FrameBroadcaster:
+    """Shares the newest of a stream of frames with any number of subscribers, through one versioned slot.
+
+    `publish()` replaces the frame in the slot and wakes the subscribers waiting on the slot's
+    `threading.Condition`. Each subscriber takes the newest frame when it's ready for one, so slow subscribers
+    skip frames rather than queueing them, and never hold up the publisher or each other.
+    """
+
+    def __init__(self):
+        self._cond = Condition()
+        self.version = 0  # of the frame in the slot, counting up from 1
+        self.value: Any = None
+        self.stamp = 0.0  # when the frame in the slot was captured, by time.monotonic()
+        self.closed = False
+        self.subscribers: List[_Subscriber] = []
+
+    def subscribe(self, fps: Optional[float] = None) -> _Subscriber:
+        with self._cond:
+            subscriber = _Subscriber(self, fps)
+            self.subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: _Subscriber):
+        with self._cond:
+            self.subscribers.remove(subscriber)
+
+    def due(self, stamp: float) -> bool:
+        "Whether any subscriber is due a frame captured at `stamp`"
+        return any(subscriber.due(stamp) for subscriber in self.subscribers)
+
+    def publish(self, value: Any, stamp: float) -> bool:
+        "Replaces the frame in the slot, unless it holds a newer one. Returns whether it was replaced"
+        with self._cond:
+            if stamp < self.stamp:
+                return False  # published out of order
+            for subscriber in self.subscribers:
+                if self.version > subscriber.last_seen and subscriber.due(self.stamp):
+                    subscriber.dropped += 1  # it was due the frame being replaced, but hasn't taken it
+            self.version += 1
+            self.value, self.stamp = value, stamp
+            self._cond.notify_all()
+        return True
+
+    def close(self):
+        "Wakes the subscribers, whose `next()` returns None from then on"
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+def mjpeg_stream(broadcaster: _FrameBroadcaster, fps: Optional[float] = None) -> Iterator[bytes]:
+    "Yields the multipart parts published to the broadcaster as an MJPEG stream's client, for a `flask.Response`"
+    viewer = broadcaster.subscribe(fps)
+    try:
+        while True:
+            part = viewer.next()
+            if part is None:
+                return
+            yield part
+    finally:  # ie; GeneratorExit when the client disconnects
+        broadcaster.unsubscribe(viewer)
@@ -4,9 +4,12 @@ import msgpack
 from sanic import Sanic, response, Websocket
 from pathlib import Path
 import argparse
-from typing import Set, Optional
+from typing import Dict, Set, Optional, Tuple
 import uvloop
 
+from bdsim_realtime.scopes import SCOPE_DATA_EXT, legacy_scope_message
+from bdsim_realtime.video import VIDEO_FRAME_EXT, unpack_header
+
 
 app = Sanic('bdsim-webapp-server')
 
@@ -22,6 +25,52 @@ class RemoteBDSimNode:
         self.ws_subs = ws_subs
         self.node_def = node_def
 
+        # the msgpack extension types each websocket announced it can decode when it chose this node
+        self.ext_types: Dict[Websocket, Set[int]] = {}
+
+        # websockets still sending a video frame. They skip frames until it's sent rather than queue them
+        self.video_busy: Set[Websocket] = set()
+        # (websocket, stream id)s that were sent the stream's last frame, so can decode a delta from it
+        self.video_synced: Set[Tuple[Websocket, int]] = set()
+
+    def send_video_frame(self, frame: msgpack.ExtType):
+        """Fans a video frame out to the subscribed websockets, without waiting for it to be sent.
+
+        Websockets still sending an earlier frame skip this one. Having missed a frame, they can't decode
+        the deltas that follow (see `bdsim_realtime.video`), so skip those until the next keyframe.
+        """
+        header = unpack_header(frame.data)
+        raw = None
+        for ws in self.ws_subs:
+            key = (ws, header.stream_id)
+            if VIDEO_FRAME_EXT not in self.ext_types.get(ws, ()):
+                continue
+            if ws in self.video_busy or not (header.keyframe or key in self.video_synced):
+                self.video_synced.discard(key)
+                continue
+
+            raw = raw or msgpack.packb(frame)
+            self.video_synced.add(key)
+            self.video_busy.add(ws)
+            asyncio.ensure_future(self._send_video(ws, raw))
+
+    async def send_scope_data(self, batch: msgpack.ExtType):
+        "Sends a batch of scope samples to the subscribed websockets, as a plain list to those that can't decode it"
+        supported = [ws for ws in self.ws_subs if SCOPE_DATA_EXT in self.ext_types.get(ws, ())]
+        legacy = [ws for ws in self.ws_subs if ws not in supported]
+        if supported:
+            await send_all_ws(supported, msgpack.packb(batch))
+        if legacy:
+            await send_all_ws(legacy, msgpack.packb(legacy_scope_message(batch.data)))
+
+    async def _send_video(self, ws: Websocket, raw: bytes):
+        try:
+            await ws.send(raw)
+        except Exception:
+            ws_disconnect(ws)
+        finally:
+            self.video_busy.discard(ws)
+
     # def get_node_def(self):
     #     self.writer.write()
 
@@ -63,6 +112,7 @@ async def ws(req, ws: Websocket):
                     ws_clients[ws] = chosen_node
                     if chosen_node:
                         ws_clients[ws].ws_subs.add(ws)
+                        chosen_node.ext_types[ws] = set(msg.get("extTypes", ()))
 
                         # send the current param definitions
                         # TODO: query the node for these param definitions on connect
@@ -97,9 +147,12 @@ app.static('/', CLIENT_PATH)
 
 
 def ws_disconnect(ws: Websocket):
-    if ws_clients[ws]:
+    node = ws_clients.get(ws)
+    if node:
         print('disconnecting', ws)
-        ws_clients[ws].ws_subs.remove(ws)
+        node.ws_subs.discard(ws)
+        node.ext_types.pop(ws, None)
+        node.video_synced = {key for key in node.video_synced if key[0] is not ws}
         del ws_clients[ws]
 
 
@@ -142,11 +195,21 @@ async def handle_tcp_conn(reader: StreamReader, writer: StreamWriter):
     await broadcast_available_nodes()
 
     try:
+        node = tcp_clients[peername]
         while True:
-            msgs.feed(await reader.read(1024))
+            # large enough for a few video frames at a time
+            data = await reader.read(1 << 16)
+            if not data:
+                break  # closed by the node
+            msgs.feed(data)
             for msg in msgs:
                 # print('got tcp message', msg)
-                await send_all_ws(ws_subs, msgpack.packb(msg))
+                if isinstance(msg, msgpack.ExtType) and msg.code == VIDEO_FRAME_EXT:
+                    node.send_video_frame(msg)
+                elif isinstance(msg, msgpack.ExtType) and msg.code == SCOPE_DATA_EXT:
+                    await node.send_scope_data(msg)
+                else:
+                    await send_all_ws(ws_subs, msgpack.packb(msg))
 
     # surely this is overkill. copied from example
     except asyncio.CancelledError:
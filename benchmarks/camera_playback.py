@@ -0,0 +1,69 @@
+"""Benchmark of CAMERA video-file playback: sequential decode vs the previous seek on every tick.
+
+Writes a 10s, 30fps 640x360 mp4v video to a temporary directory, then plays it through a CAMERA at 30Hz:
+
+    python benchmarks/camera_playback.py
+"""
+import os
+import tempfile
+import time
+
+import cv2
+import numpy as np
+from bdsim import BDSim, BDSimState
+
+from bdsim_realtime.blocks.vision import Camera
+
+FPS = 30
+N_FRAMES = 300
+SHAPE = (360, 640)
+
+
+def write_video(path: str):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), FPS, SHAPE[::-1])
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, (*SHAPE, 3), dtype=np.uint8)
+    for n in range(N_FRAMES):
+        writer.write(np.roll(frame, n * 4, axis=1))
+    writer.release()
+
+
+def read_seeking(video_capture: cv2.VideoCapture, t: float):
+    # the per-tick path CAMERA used before decoding sequentially
+    fps = video_capture.get(cv2.CAP_PROP_FPS)
+    video_capture.set(cv2.CAP_PROP_POS_FRAMES, int(round(t * fps)))
+    _, frame = video_capture.read()
+    return frame
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "video.mp4")
+        write_video(path)
+
+        bd = BDSim(graphics=False).blockdiagram()
+        camera = Camera(path, clock=bd.clock(FPS, 'Hz'))
+        bd.add_block(camera)
+        state = bd.state = BDSimState()
+        ticks = [n / FPS for n in range(N_FRAMES)]
+
+        camera.start(state)
+        start = time.perf_counter()
+        for t in ticks:
+            read_seeking(camera.video_capture, t)
+        seeking_s = time.perf_counter() - start
+
+        camera.start(state)
+        start = time.perf_counter()
+        for t in ticks:
+            state.t = t
+            camera.next()
+        sequential_s = time.perf_counter() - start
+
+    print("{} frames of {}x{} mp4v".format(N_FRAMES, *SHAPE[::-1]))
+    print("seeking:    {:.0f} fps".format(N_FRAMES / seeking_s))
+    print("sequential: {:.0f} fps ({:.1f}x)".format(N_FRAMES / sequential_s, seeking_s / sequential_s))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Benchmark of `_clocked_plans()` startup cost as diagrams grow from 10 to 10,000 blocks.
+
+Each diagram is a random DAG hanging off a single ZOH: half GAIN blocks and half 2-input SUM
+blocks fed from random earlier blocks, so there is plenty of shared fan-in.
+
+    python benchmarks/planning.py
+"""
+import random
+import time
+
+from bdsim import BDSim
+
+from bdsim_realtime.run import _clocked_plans
+
+SIZES = (10, 100, 1000, 10000)
+
+
+def build_diagram(n_blocks: int, seed: int = 0):
+    rng = random.Random(seed)
+    bd = BDSim(graphics=False).blockdiagram()
+    clock = bd.clock(100, 'Hz')
+
+    wave = bd.WAVEFORM('sine')
+    zoh = bd.ZOH(clock)
+    bd.connect(wave, zoh)
+
+    blocks = [zoh]
+    for i in range(n_blocks - 2):
+        if i % 2:
+            block = bd.GAIN(0.5)
+            bd.connect(rng.choice(blocks), block)
+        else:
+            block = bd.SUM('++')
+            bd.connect(rng.choice(blocks), block[0])
+            bd.connect(rng.choice(blocks), block[1])
+        blocks.append(block)
+
+    bd.compile(verbose=False)
+    return bd
+
+
+def main():
+    print("{:>8} {:>12}".format("blocks", "planning (s)"))
+    for n_blocks in SIZES:
+        bd = build_diagram(n_blocks)
+        start = time.perf_counter()
+        plans = _clocked_plans(bd)
+        elapsed = time.perf_counter() - start
+        assert sum(len(plan) for plan in plans.values()) == n_blocks
+        print("{:>8} {:>12.4f}".format(n_blocks, elapsed))
+
+
+if __name__ == "__main__":
+    main()
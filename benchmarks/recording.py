@@ -0,0 +1,66 @@
+"""Benchmark of the per-tick cost of recording 6 channels: the CSV block (a write per channel and a flush every tick)
+vs the RECORDER block's buffered writer in each format.
+
+Records to a temporary directory, or the directory given (ie; a mounted SD card):
+
+    python benchmarks/recording.py [directory]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from bdsim import BDSim, BDSimState
+
+from bdsim_realtime.blocks.data import CSV, Recorder
+from bdsim_realtime.recording import read_recording
+
+N_CHANNELS = 6
+N_TICKS = 20000
+
+
+def record(name: str, block, bd, samples: np.ndarray):
+    # prints the mean per-tick cost including closing the file (and so waiting for any writer thread),
+    # and percentiles of the time spent in step() itself - what a real-time clock actually waits on
+    durations = np.empty(len(samples))
+    start = time.perf_counter()
+    for t, sample in enumerate(samples):
+        bd.state.t = t * 5e-3
+        block._T_inputs = list(sample)
+        step_start = time.perf_counter()
+        block.step()
+        durations[t] = time.perf_counter() - step_start
+    block.done()
+    mean = (time.perf_counter() - start) / len(samples)
+
+    p50, p99, p999 = np.percentile(durations, (50, 99, 99.9)) * 1e6
+    print("{:<20}{:>10.2f}{:>10.2f}{:>10.2f}{:>10.2f}".format(name, mean * 1e6, p50, p99, p999))
+
+
+def main():
+    directory = sys.argv[1] if len(sys.argv) > 1 else tempfile.mkdtemp()
+    bd = BDSim(graphics=False).blockdiagram()
+    bd.state = BDSimState()
+    samples = np.random.rand(N_TICKS, N_CHANNELS)
+
+    # the block's inputs aren't connected so are read from _T_inputs instead
+    path = os.path.join(directory, "bench-csv-block.csv")
+    csv = CSV(open(path, "w"), nin=N_CHANNELS, bd=bd)
+    csv.done = csv.file.close
+    print("{:<20}{:>10}{:>10}{:>10}{:>10}".format("us/tick", "mean", "step p50", "p99", "p99.9"))
+    record("CSV block", csv, bd, samples)
+
+    for format in ("csv", "npy", "parquet", "arrow"):
+        path = os.path.join(directory, "bench-recorder." + format)
+        try:
+            recorder = Recorder(path, nin=N_CHANNELS, format=format, flush_interval=0.1, bd=bd)
+        except ImportError as e:
+            print("{:<20}  skipped: {}".format("RECORDER " + format, e))
+            continue
+        record("RECORDER " + format, recorder, bd, samples)
+        assert read_recording(path)[1].shape == (N_TICKS, N_CHANNELS + 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Benchmark of the per-sample cost of sending a 4-signal scope at 1kHz, as `run()` drives a TcpClientTuner:
+the scope queues a sample each tick, then the tuner is updated. Compares packing each sample as its own
+msgpack list at each update (as TcpClientTuner did before scopes were batched) with batching them into a
+SCOPE_DATA_EXT message every `telemetry_interval` (1/60s) - with and without decimation to a 60Hz display rate.
+
+The cost is split between the scope's tick and the flush of its samples. Without an I/O thread both are paid
+by the control thread; with `io_thread=True` the flush is paid by the I/O thread instead. Also prints the bytes
+sent per second of signal. Each time is the best of several runs.
+
+    python benchmarks/scope_telemetry.py
+"""
+import time
+
+import msgpack
+import numpy as np
+
+from bdsim_realtime.scopes import ScopeBuffer
+from bdsim_realtime.tuning.tuners.tcpclient_tuner import _to_builtin
+
+N_SIGNALS = 4
+N_SAMPLES = 20000
+RATE = 1000
+SAMPLES_PER_TELEMETRY = RATE // 60
+REPEATS = 5
+
+
+def per_sample(samples):
+    # as TcpClientTuner sent scope updates before they were batched: queued by the scope, packed by each update
+    packer = msgpack.Packer(default=_to_builtin)
+    queue, sent, flushing = [], 0, 0.0
+    for t, data in samples:
+        queue.append([0, t] + data)
+        start = time.perf_counter()
+        for update in queue:
+            sent += len(packer.pack(update))
+        queue = []
+        flushing += time.perf_counter() - start
+    return sent, flushing
+
+
+def batched(samples, rate=None):
+    packer = msgpack.Packer()
+    buffer = ScopeBuffer(0, N_SIGNALS, rate=rate)
+    sent, flushing = 0, 0.0
+    for n, (t, data) in enumerate(samples):
+        buffer.append(t, data)
+        if n % SAMPLES_PER_TELEMETRY == SAMPLES_PER_TELEMETRY - 1:
+            start = time.perf_counter()
+            batch = buffer.flush()
+            if batch:
+                sent += len(packer.pack(batch))
+            flushing += time.perf_counter() - start
+    return sent, flushing
+
+
+def main():
+    t = np.arange(N_SAMPLES) / RATE
+    signals = np.sin(np.outer(np.arange(1, N_SIGNALS + 1), t))
+    # like a TunerScope's inputs: a mix of numbers and 1-element arrays
+    samples = [(t[n], [signals[0, n], signals[1, n:n + 1], signals[2, n], signals[3, n:n + 1]])
+               for n in range(N_SAMPLES)]
+
+    print("{:<24}{:>14}{:>14}{:>14}{:>12}".format("", "tick", "flush", "total", "bytes/sec"))
+    print("{:<24}{:>14}{:>14}{:>14}".format("", "us/sample", "us/sample", "us/sample"))
+    for name, send in (
+        ("per-sample msgpack", per_sample),
+        ("batched", batched),
+        ("batched, 60Hz display", lambda samples: batched(samples, rate=60)),
+    ):
+        runs = []
+        for _ in range(REPEATS):
+            start = time.perf_counter()
+            sent, flushing = send(samples)
+            runs.append((time.perf_counter() - start, flushing))
+        total = min(duration for duration, _ in runs)
+        flushing = min(flushing for _, flushing in runs)
+        print("{:<24}{:>14.2f}{:>14.2f}{:>14.2f}{:>12.0f}".format(
+            name, (total - flushing) / N_SAMPLES * 1e6, flushing / N_SAMPLES * 1e6, total / N_SAMPLES * 1e6,
+            sent / (N_SAMPLES / RATE)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Benchmark of the vision blocks' reused output buffers vs allocating new frames every tick.
+
+Runs CVTCOLOR -> INRANGE -> ERODE -> DILATE -> MASK over a 1080p frame, either reusing each block's
+output buffer (the default) or dropping it before every tick, as the blocks did before:
+
+    python benchmarks/vision_buffers.py
+"""
+import resource
+import time
+
+import cv2
+import numpy as np
+from bdsim import BDSim
+
+from bdsim_realtime.blocks.vision import CvtColor, Dilate, Erode, InRange, Mask
+
+N_TICKS = 200
+SHAPE = (1080, 1920, 3)
+
+
+def build_pipeline():
+    bd = BDSim(graphics=False).blockdiagram()
+    src = bd.CONSTANT(0)
+    return [
+        CvtColor(src, cv2.COLOR_BGR2HSV, bd=bd),
+        InRange(src, lower=(0, 0, 0), upper=(90, 255, 255), bd=bd),
+        Erode(src, enable=True, bd=bd),
+        Dilate(src, enable=True, bd=bd),
+        Mask(src, bd=bd),
+    ]
+
+
+def tick(blocks, frame: np.ndarray, reuse: bool) -> int:
+    "Runs the pipeline once. Returns the number of bytes of new output frames allocated"
+    cvt, in_range, erode, dilate, mask = blocks
+    previous = [b._dst for b in blocks]
+    if not reuse:
+        for b in blocks:
+            b._dst = None
+
+    def output(b, *inputs):
+        # feed the block its inputs directly, as bdsim's unit tests do
+        b._T_inputs = inputs
+        [out] = b.output()
+        return out
+
+    hsv = output(cvt, frame)
+    output(mask, frame, output(dilate, output(erode, output(in_range, hsv))))
+    return sum(b._dst.nbytes for b, prev in zip(blocks, previous) if b._dst is not prev)
+
+
+def measure(blocks, frame: np.ndarray, reuse: bool):
+    tick(blocks, frame, reuse)  # size the buffers
+    allocated = 0
+    faults = resource.getrusage(resource.RUSAGE_SELF).ru_minflt
+    start = time.perf_counter()
+    for _ in range(N_TICKS):
+        allocated += tick(blocks, frame, reuse)
+    elapsed = time.perf_counter() - start
+    faults = resource.getrusage(resource.RUSAGE_SELF).ru_minflt - faults
+    return elapsed / N_TICKS, allocated / N_TICKS, faults / N_TICKS
+
+
+def main():
+    frame = np.random.default_rng(0).integers(0, 256, SHAPE, dtype=np.uint8)
+    blocks = build_pipeline()
+
+    print("{} ticks of {}x{}".format(N_TICKS, SHAPE[1], SHAPE[0]))
+    for name, reuse in (("new frames", False), ("reused buffers", True)):
+        seconds, allocated, faults = measure(blocks, frame, reuse)
+        print("{:<15} {:.2f} ms/tick, {:.1f} MB allocated/tick, {:.0f} page faults/tick".format(
+            name + ":", seconds * 1e3, allocated / 1e6, faults))
+
+
+if __name__ == "__main__":
+    main()
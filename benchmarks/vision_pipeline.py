@@ -0,0 +1,129 @@
+"""Benchmark of a fused VISIONPIPELINE vs running its vision blocks one after another.
+
+Runs CVTCOLOR -> INRANGE -> OPENMASK -> BLOBS over a 1080p frame, unfused, then fused with 1, 2 and 4 threads.
+First the blocks alone, then a whole diagram through `run(fuse_vision=...)`, as fast as it can tick. Each time is
+the best of several rounds, as a thread gain is only seen with as many free cores as threads:
+
+    python benchmarks/vision_pipeline.py
+"""
+import contextlib
+import io
+import os
+import time
+
+import cv2
+import numpy as np
+from bdsim import BDSim
+from bdsim.components import ClockedBlock
+
+from bdsim_realtime.blocks.vision import Blobs, CvtColor, InRange, OpenMask, VisionPipeline
+from bdsim_realtime.run import run
+from bdsim_realtime.scheduling import VirtualScheduler
+
+N_TICKS = 100
+ROUNDS = 5
+THREADS = (1, 2, 4)
+SHAPE = (1080, 1920, 3)
+
+
+def build_stages():
+    bd = BDSim(graphics=False).blockdiagram()
+    src = bd.CONSTANT(0)
+    stages = [
+        CvtColor(src, cv2.COLOR_BGR2HSV, bd=bd),
+        InRange(src, lower=(0, 100, 100), upper=(10, 255, 255), bd=bd),
+        OpenMask(src, bd=bd),
+        Blobs(src, bd=bd),
+    ]
+    return bd, stages
+
+
+def run_unfused(stages, frame: np.ndarray):
+    x = frame
+    for b in stages:
+        # feed the block its inputs directly, as bdsim's unit tests do
+        b._T_inputs = (x,)
+        [x] = b.output()
+
+
+class Frames(ClockedBlock):
+    "Outputs the same frame on every tick of its clock"
+    nin = 0
+    nout = 1
+
+    def __init__(self, frame, clock, **blockargs):
+        super().__init__(nin=0, nout=1, clock=clock, **blockargs)
+        self.frame = frame
+        self._x0 = [0]
+        self.ndstates = 1
+
+    def next(self):
+        return self._x
+
+    def output(self, t=None):
+        return [self.frame]
+
+
+def run_diagram(frame: np.ndarray, fuse_vision) -> float:
+    """Runs the stages as a diagram on a 30Hz clock for N_TICKS ticks, in simulated time.
+    Returns the best seconds per tick of ROUNDS runs"""
+    best = float("inf")
+    for _ in range(ROUNDS):
+        bd = BDSim(graphics=False).blockdiagram()
+        frames = Frames(frame, bd.clock(30, 'Hz'), bd=bd)
+        hsv = CvtColor(frames, cv2.COLOR_BGR2HSV, bd=bd)
+        mask = InRange(hsv, lower=(0, 100, 100), upper=(10, 255, 255), bd=bd)
+        blobs = Blobs(OpenMask(mask, bd=bd), bd=bd)
+        bd.connect(blobs, bd.NULL(1))
+
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            run(bd, max_time=(N_TICKS - 1) / 30, scheduler=VirtualScheduler(), fuse_vision=fuse_vision)
+        best = min(best, (time.perf_counter() - start) / N_TICKS)
+    return best
+
+
+def report(label: str, tick_s: float, unfused_s: float):
+    print("{:<18} {:6.2f} ms/tick {:7.1f} fps ({:.2f}x)".format(label, tick_s * 1e3, 1 / tick_s, unfused_s / tick_s))
+
+
+def measure(tick) -> float:
+    "Returns the best seconds per tick of ROUNDS rounds of N_TICKS ticks"
+    tick()  # size the buffers
+    best = float("inf")
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        for _ in range(N_TICKS):
+            tick()
+        best = min(best, (time.perf_counter() - start) / N_TICKS)
+    return best
+
+
+def main():
+    cv2.setNumThreads(1)  # so only the pipeline's own threads are compared
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, SHAPE, dtype=np.uint8)
+
+    print("best of {} x {} ticks of {}x{} on {} cores, blocks alone:".format(
+        ROUNDS, N_TICKS, SHAPE[1], SHAPE[0], os.cpu_count()))
+    bd, stages = build_stages()
+    unfused_s = measure(lambda: run_unfused(stages, frame))
+    report("unfused:", unfused_s, unfused_s)
+
+    for threads in THREADS:
+        bd, stages = build_stages()
+        pipeline = VisionPipeline(stages, threads=threads, bd=bd)
+        stages[0]._T_inputs = (frame,)
+        fused_s = measure(pipeline.output)
+        pipeline.done()
+        report("fused, {} thread{}:".format(threads, "s" if threads > 1 else ""), fused_s, unfused_s)
+
+    print("\nthrough run(), including the diagram's wire propagation:")
+    unfused_s = run_diagram(frame, fuse_vision=False)
+    report("unfused:", unfused_s, unfused_s)
+    for threads in THREADS:
+        report("fused, {} thread{}:".format(threads, "s" if threads > 1 else ""),
+               run_diagram(frame, fuse_vision=threads), unfused_s)
+
+if __name__ == "__main__":
+    main()
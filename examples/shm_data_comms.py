@@ -0,0 +1,26 @@
+"Passes 1kHz data between two clocks through a shared-memory ring, with each clock in its own process"
+
+from bdsim import BDSim
+import bdsim_realtime
+from bdsim_realtime.transport import SharedMemoryTransport
+
+bd = BDSim().blockdiagram()
+
+sine = bd.WAVEFORM('sine')
+sine_neg_2 = bd.GAIN(-2, sine)
+sine3 = bd.GAIN(3, sine)
+
+# one float64 channel per signal. Created before run() forks the clock processes so both ends share it
+transport = SharedMemoryTransport(3)
+
+# the handshake only checks the ring's layout, so neither block waits for the other
+bd.DATASENDER(transport, sine, sine_neg_2, sine3, nin=3, clock=bd.clock(1000, 'Hz'))
+receiver = bd.DATARECEIVER(transport, nout=3, clock=bd.clock(1000, 'Hz', offset=0.0005))
+
+csv_writer = bd.CSV(open('bdsim-dataout.csv', 'w'), receiver[0:3], nin=3)
+
+try:
+    bdsim_realtime.run(bd, max_time=10, executor='process')
+finally:
+    transport.close()
+    transport.unlink()
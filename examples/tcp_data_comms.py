@@ -18,7 +18,7 @@ send_socket, recv_socket = socket.socketpair()
 # initialize the DATASENDER in another thread because it blocks until the handshake
 thread = threading.Thread(
     target=bd.DATASENDER,
-    args=(send_socket.makefile('rwb'), sine, sine_neg_2, sine3),
+    args=(send_socket, sine, sine_neg_2, sine3),
     kwargs=dict(
         nin=3,
         clock=bd.clock(50, 'Hz') 
@@ -28,7 +28,7 @@ thread.start()
 
 # this should wait for the handshake triggered by the previous thread
 receiver = bd.DATARECEIVER(
-    recv_socket.makefile('rwb'),
+    recv_socket,
     nout=3,
     # offset it by 30ms from sender's clock; so the sender executes at least once and this executes 10ms afterwards
     clock=bd.clock(50, 'Hz', offset=0.03)
@@ -1,5 +1,89 @@
 import * as React from "react";
+import { useEffect, useRef } from "react";
 
-export default function VideoStream({ url }: { url: string }) {
-  return <img className="stream-viewer" src={url} />;
+import { VideoFrame, VideoStream as VideoStreamType } from "./api";
+
+const MIME_TYPES = { jpeg: "image/jpeg", webp: "image/webp" };
+
+// zlib-inflates a 'raw' frame's pixels
+async function inflate(data: Uint8Array): Promise<Uint8Array> {
+  const stream = new Blob([data])
+    .stream()
+    .pipeThrough(new DecompressionStream("deflate"));
+  return new Uint8Array(await new Response(stream).arrayBuffer());
+}
+
+// converts BGR / grayscale / BGRA pixels into RGBA ImageData
+function toImageData(pixels: Uint8Array, frame: VideoFrame): ImageData {
+  const image = new ImageData(frame.width, frame.height);
+  const rgba = image.data;
+  const c = frame.channels;
+  for (let src = 0, dst = 0; dst < rgba.length; src += c, dst += 4) {
+    if (c >= 3) {
+      rgba[dst] = pixels[src + 2];
+      rgba[dst + 1] = pixels[src + 1];
+      rgba[dst + 2] = pixels[src];
+    } else {
+      rgba[dst] = rgba[dst + 1] = rgba[dst + 2] = pixels[src];
+    }
+    rgba[dst + 3] = 255;
+  }
+  return image;
+}
+
+export default function VideoStream({ stream }: { stream: VideoStreamType }) {
+  const canvasRef = useRef<HTMLCanvasElement>(null);
+
+  useEffect(() => {
+    if (stream.url) return; // the browser decodes MJPEG streams itself
+    let drawing = false;
+    let rawQueue = Promise.resolve(); // 'raw' frames are decoded in order, as each delta applies to the last
+    let prevPixels: Uint8Array | null = null;
+
+    const resize = (canvas: HTMLCanvasElement, frame: VideoFrame) => {
+      if (canvas.width !== frame.width || canvas.height !== frame.height) {
+        canvas.width = frame.width;
+        canvas.height = frame.height;
+      }
+      return canvas.getContext("2d");
+    };
+
+    const drawRaw = async (frame: VideoFrame) => {
+      const pixels = await inflate(frame.payload);
+      if (!frame.keyframe) {
+        if (!prevPixels || prevPixels.length !== pixels.length) return; // wait for a keyframe
+        for (let i = 0; i < pixels.length; i++) pixels[i] ^= prevPixels[i];
+      }
+      prevPixels = pixels;
+      const canvas = canvasRef.current;
+      if (canvas) resize(canvas, frame).putImageData(toImageData(pixels, frame), 0, 0);
+    };
+
+    const draw = async (frame: VideoFrame | null) => {
+      if (!frame) return;
+      if (frame.format === "raw") {
+        rawQueue = rawQueue.then(() => drawRaw(frame)).catch(console.error);
+        return;
+      }
+
+      // skip frames that arrive while the last is still being decoded
+      const canvas = canvasRef.current;
+      if (!canvas || drawing) return;
+      drawing = true;
+      try {
+        const blob = new Blob([frame.payload], { type: MIME_TYPES[frame.format] });
+        const bitmap = await createImageBitmap(blob);
+        resize(canvas, frame).drawImage(bitmap, 0, 0);
+        bitmap.close();
+      } finally {
+        drawing = false;
+      }
+    };
+
+    stream.frame.onChange(draw);
+    return () => stream.frame.deRegister(draw);
+  }, [stream]);
+
+  if (stream.url) return <img className="stream-viewer" src={stream.url} />;
+  return <canvas className="stream-viewer" ref={canvasRef} />;
 }
@@ -1,5 +1,5 @@
 import { useState, useEffect } from "react";
-import { decode, encode } from "@msgpack/msgpack";
+import { decode, encode, ExtensionCodec } from "@msgpack/msgpack";
 
 import { AnyParam } from "./paramTypes";
 import { Observable } from "./observable";
@@ -8,27 +8,97 @@ type AvailableNodesApiMsg = {
   available_nodes: string[];
 };
 
+type VideoStreamDesc = {
+  id: number;
+  name: string;
+  format: VideoFormat;
+  url?: string; // set for streams served as MJPEG over HTTP rather than over the link
+};
+
 type BdsimNodeDescApiMsg = {
   start_time: number; // ms since epoch
   ip: string;
   params: AnyParam[];
-  video_streams: string[];
+  video_streams: (VideoStreamDesc | string)[]; // a string is an MJPEG stream's url
   signal_scopes: SignalScope[];
 };
 
-type ParamUpdateApiMsg = Partial<AnyParam>[];
+export type VideoFormat = "jpeg" | "webp" | "raw";
+
+// see bdsim_realtime/video.py
+const VIDEO_FRAME_EXT = 2;
+const VIDEO_FORMATS: VideoFormat[] = ["jpeg", "webp", "raw"];
+const KEYFRAME = 0x1;
+const FRAME_HEADER_SIZE = 9; // struct "<HBBHHB"
+
+export class VideoFrame {
+  constructor(
+    public streamId: number,
+    public format: VideoFormat,
+    public keyframe: boolean,
+    public width: number,
+    public height: number,
+    public channels: number,
+    public payload: Uint8Array // the encoded image
+  ) {}
+
+  static decode(data: Uint8Array): VideoFrame {
+    const header = new DataView(data.buffer, data.byteOffset, FRAME_HEADER_SIZE);
+    return new VideoFrame(
+      header.getUint16(0, true),
+      VIDEO_FORMATS[header.getUint8(2)],
+      (header.getUint8(3) & KEYFRAME) !== 0,
+      header.getUint16(4, true),
+      header.getUint16(6, true),
+      header.getUint8(8),
+      data.subarray(FRAME_HEADER_SIZE)
+    );
+  }
+}
+
+// see bdsim_realtime/scopes.py
+const SCOPE_DATA_EXT = 3;
+const SCOPE_HEADER_SIZE = 6; // struct "<HI"
+
+export class ScopeData {
+  constructor(
+    public scopeIdx: number,
+    public columns: number[][] // the samples' times (secs), then each signal's values
+  ) {}
 
-type SignalScopeApiMsg = [
-  id: number,
-  ms_since_start: number[],
-  ...data: number[]
-];
+  static decode(data: Uint8Array): ScopeData {
+    const header = new DataView(data.buffer, data.byteOffset, SCOPE_HEADER_SIZE);
+    const nSamples = header.getUint32(2, true);
+    // copied, as a Float64Array must be 8-byte aligned
+    const values = new Float64Array(data.slice(SCOPE_HEADER_SIZE).buffer);
+    const columns = [];
+    for (let start = 0; start < values.length; start += nSamples) {
+      columns.push(Array.from(values.subarray(start, start + nSamples)));
+    }
+    return new ScopeData(header.getUint16(0, true), columns);
+  }
+}
+
+const extensionCodec = new ExtensionCodec();
+extensionCodec.register({
+  type: VIDEO_FRAME_EXT,
+  encode: () => null, // only ever received
+  decode: VideoFrame.decode,
+});
+extensionCodec.register({
+  type: SCOPE_DATA_EXT,
+  encode: () => null, // only ever received
+  decode: ScopeData.decode,
+});
+
+type ParamUpdateApiMsg = Partial<AnyParam>[];
 
 type ApiMsg =
   | AvailableNodesApiMsg
   | BdsimNodeDescApiMsg
   | ParamUpdateApiMsg
-  | SignalScopeApiMsg;
+  | ScopeData
+  | VideoFrame;
 
 type BDSimNode = {
   startTime: number;
@@ -41,10 +111,15 @@ type BDSimNode = {
   // so that api updates can reference the correct one. Includes subParams
   id2param: { [id: number]: Observable<AnyParam> };
 
-  videoStreamUrls: string[];
+  videoStreams: VideoStream[];
   signalScopes: SignalScope[];
 };
 
+export type VideoStream = VideoStreamDesc & {
+  // the newest frame received
+  frame: Observable<VideoFrame | null>;
+};
+
 export type SignalScope = {
   name: string;
   n: number;
@@ -72,7 +147,7 @@ export class Api {
 
     ws.onmessage = async ({ data }: { data: Blob }) => {
       const apiMsg = await data.arrayBuffer();
-      this.onMsg(decode(apiMsg) as ApiMsg);
+      this.onMsg(decode(apiMsg, { extensionCodec }) as ApiMsg);
     };
   }
 
@@ -82,15 +157,16 @@ export class Api {
       throw new Error(`Unhandled Api message ${msg}`);
     };
 
-    if (Array.isArray(msg)) {
-      if (typeof msg[0] === "number") {
-        // signal data update
-        const [idx, ...newData] = msg as SignalScopeApiMsg;
-        const scope = this.currentNode.state.signalScopes[idx];
-
+    if (msg instanceof VideoFrame) {
+      // frames may arrive for a stream just before its node is chosen
+      this.currentNode.state?.videoStreams[msg.streamId]?.frame.set(msg);
+    } else if (msg instanceof ScopeData) {
+      // a batch of signal samples
+      const scope = this.currentNode.state?.signalScopes[msg.scopeIdx];
+      if (scope) {
         // append the data
         const updatedData = scope.data.state.map((series, serIdx) =>
-          series.concat(newData[serIdx])
+          series.concat(msg.columns[serIdx])
         );
 
         // only keep scope.keepLastSecs worth of data
@@ -107,7 +183,9 @@ export class Api {
 
         // update the observable{
         scope.data.set(updatedData);
-      } else if ("name" in msg[0]) {
+      }
+    } else if (Array.isArray(msg)) {
+      if ("name" in msg[0]) {
         // parameter change from backend
         for (const paramUpdate of msg as ParamUpdateApiMsg) {
           const param = this.currentNode.state.id2param[paramUpdate.id];
@@ -156,7 +234,12 @@ export class Api {
       this.currentNode.set({
         startTime: msg.start_time,
         ip: msg.ip,
-        videoStreamUrls: msg.video_streams,
+        videoStreams: msg.video_streams.map((stream, id) => ({
+          ...(typeof stream === "string"
+            ? { id, name: stream.split("/").pop()!, format: "jpeg" as VideoFormat, url: stream }
+            : stream),
+          frame: new Observable(null),
+        })),
         id2param,
         params,
 
@@ -177,7 +260,8 @@ export class Api {
   }
 
   setCurrentNode(nodeUrl: string) {
-    this.send({ chosenNode: nodeUrl });
+    // the webapp only forwards the extension types we can decode. Without them, it sends scope data as plain lists
+    this.send({ chosenNode: nodeUrl, extTypes: [VIDEO_FRAME_EXT, SCOPE_DATA_EXT] });
   }
 }
 
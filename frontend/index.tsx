@@ -70,13 +70,13 @@ export function NodeInterface({ api }: { api: Api }) {
 
             <Column isClosable={false}>
               <Stack isClosable={false}>
-                {currentNode.videoStreamUrls.map((url) => (
+                {currentNode.videoStreams.map((stream) => (
                   <Content
-                    title={url.split("/").pop()}
-                    key={url}
+                    title={stream.name}
+                    key={stream.id}
                     isClosable={false}
                   >
-                    <VideoStream url={url} />
+                    <VideoStream stream={stream} />
                   </Content>
                 ))}
               </Stack>
@@ -88,7 +88,8 @@ setup(
 
     
     extras_require={
-        'opencv': 'opencv-python>=2.0.0' # if you want to use computer-vision blocks
+        'opencv': 'opencv-python>=2.0.0', # if you want to use computer-vision blocks
+        'parquet': 'pyarrow' # if you want to record to parquet or arrow files
     }
 
 )
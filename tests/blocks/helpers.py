@@ -0,0 +1,27 @@
+"Helpers shared by the block tests"
+from bdsim.components import ClockedBlock
+
+
+def block_output(block, *inputs):
+    "Returns a single-output block's output for the given inputs, fed to it directly as bdsim's unit tests do"
+    block._T_inputs = inputs
+    [out] = block.output()
+    return out
+
+
+class Frames(ClockedBlock):
+    "Outputs a frame on every tick of its clock. Given a function, outputs what it returns for each tick's time"
+    nin = 0
+    nout = 1
+
+    def __init__(self, frame, clock, **blockargs):
+        super().__init__(nin=0, nout=1, clock=clock, **blockargs)
+        self.frame = frame
+        self._x0 = [0]
+        self.ndstates = 1
+
+    def next(self):
+        return self._x
+
+    def output(self, t=None):
+        return [self.frame(t) if callable(self.frame) else self.frame]
@@ -0,0 +1,77 @@
+import os
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+from bdsim import BDSim, BDSimState
+
+from bdsim_realtime.blocks.vision import Camera
+
+FPS = 30
+N_FRAMES = 60
+
+
+class _CountingCapture:
+    "Wraps a cv2.VideoCapture, counting seeks"
+
+    def __init__(self, video_capture):
+        self.video_capture = video_capture
+        self.seeks = 0
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            self.seeks += 1
+        return self.video_capture.set(prop, value)
+
+    def __getattr__(self, name):
+        return getattr(self.video_capture, name)
+
+
+class CameraFilePlaybackTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.path = os.path.join(cls.tmpdir.name, "frames.avi")
+        writer = cv2.VideoWriter(cls.path, cv2.VideoWriter_fourcc(*"MJPG"), FPS, (32, 24))
+        for n in range(N_FRAMES):
+            writer.write(np.full((24, 32, 3), 4 * n, dtype=np.uint8))
+        writer.release()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmpdir.cleanup()
+
+    def setUp(self):
+        bd = BDSim(graphics=False).blockdiagram()
+        self.camera = Camera(self.path, clock=bd.clock(FPS, 'Hz'))
+        bd.add_block(self.camera)
+        self.state = bd.state = BDSimState()
+        self.camera.start(self.state)
+        self.capture = self.camera.video_capture = _CountingCapture(self.camera.video_capture)
+
+    def frame_at(self, t):
+        self.state.t = t
+        return int(round(self.camera.next().mean() / 4))
+
+    def test_plays_sequentially_without_seeking(self):
+        frames = [self.frame_at(n / FPS) for n in range(N_FRAMES)]
+        self.assertEqual(frames, list(range(N_FRAMES)))
+        self.assertEqual(self.capture.seeks, 0)
+
+    def test_skips_and_holds_frames(self):
+        # a clock slower than the video skips frames, a faster one holds them
+        self.assertEqual([self.frame_at(n * 5 / FPS) for n in range(5)], [0, 5, 10, 15, 20])
+        self.assertEqual([self.frame_at((42 + n / 3) / FPS) for n in range(4)], [42, 42, 43, 43])
+        self.assertEqual(self.capture.seeks, 0)
+
+    def test_seeks_on_discontinuities(self):
+        self.assertEqual(self.frame_at(50 / FPS), 50)
+        self.assertEqual(self.frame_at(3 / FPS), 3)
+        self.assertEqual(self.frame_at(4 / FPS), 4)
+        self.assertEqual(self.capture.seeks, 1)  # only seeking back - 50 frames ahead is decoded through
+
+
+if __name__ == "__main__":
+    unittest.main()
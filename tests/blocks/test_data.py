@@ -0,0 +1,108 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from bdsim import BDSim
+from bdsim.components import SinkBlock
+
+from bdsim_realtime.blocks.data import DataReceiver, DataSender, Recorder, Replay
+from bdsim_realtime.recording import read_recording
+from bdsim_realtime.run import run
+from bdsim_realtime.scheduling import VirtualScheduler
+from bdsim_realtime.transport import SharedMemoryTransport
+
+
+class _Log(SinkBlock):
+    "Logs the simulation time and its inputs each tick"
+
+    nin = -1
+    nout = 0
+
+    def __init__(self, *inputs, nin, **kwargs):
+        super().__init__(nin=nin, nout=0, inputs=inputs, **kwargs)
+        self.rows = []
+
+    def step(self):
+        self.rows.append([self.bd.state.t] + [np.asarray(u).item() for u in self.inputs])
+
+
+class ReplayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "recording.npy")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_replays_a_recorded_run(self):
+        bd = BDSim(graphics=False).blockdiagram()
+        clock = bd.clock(20, 'Hz')
+        zoh = bd.ZOH(clock)
+        bd.connect(bd.WAVEFORM('sine'), zoh)
+        gain = bd.GAIN(2)
+        bd.connect(zoh, gain)
+        Recorder(self.path, zoh, gain, nin=2, format="npy", names=["x", "y"], bd=bd)
+        run(bd, max_time=1, scheduler=VirtualScheduler())
+        columns, recorded = read_recording(self.path)
+        self.assertEqual(columns, ["t", "x", "y"])
+
+        bd = BDSim(graphics=False).blockdiagram()
+        replay = Replay(self.path, clock=bd.clock(20, 'Hz'), format="npy", bd=bd)
+        log = _Log(replay[0], replay[1], nin=2, bd=bd)
+        run(bd, max_time=2, scheduler=VirtualScheduler())
+
+        # each tick replays the row recorded at its time, stopping at the end of the recording
+        self.assertTrue(replay.ended)
+        np.testing.assert_allclose(log.rows, recorded)
+
+    def test_done_closes_the_recording(self):
+        path = os.path.join(self.dir.name, "recording.csv")
+        with open(path, "w") as f:
+            f.write("t,x\n" + "".join("{},{}\n".format(n / 20, n) for n in range(100)))
+
+        bd = BDSim(graphics=False).blockdiagram()
+        f = open(path)
+        replay = Replay(f, clock=bd.clock(20, 'Hz'), format="csv", time="t", bd=bd)
+        bd.connect(replay, bd.NULL())
+        run(bd, max_time=1, scheduler=VirtualScheduler())
+        self.assertFalse(replay.ended)
+        self.assertTrue(f.closed)
+
+
+class SharedMemoryDataTest(unittest.TestCase):
+
+    def tearDown(self):
+        self.transport.close()
+        self.transport.unlink()
+
+    def transfer(self, dtype, constant):
+        # a block's outputs, ie; a 1-element array from the ZOH
+        bd = BDSim(graphics=False).blockdiagram()
+        clock = bd.clock(20, 'Hz')
+        zoh = bd.ZOH(clock)
+        bd.connect(bd.WAVEFORM('sine'), zoh)
+        sent = _Log(zoh, nin=1, bd=bd)
+        self.transport = SharedMemoryTransport(dtype)
+        DataSender(self.transport, zoh, bd.CONSTANT(constant), nin=2, clock=clock, bd=bd)
+        receiver = DataReceiver(self.transport, nout=2, clock=clock, bd=bd)
+        received = _Log(receiver[0], nin=1, bd=bd)
+        run(bd, max_time=1, scheduler=VirtualScheduler())
+        return np.array(sent.rows), np.array(received.rows), receiver
+
+    def test_float_channels(self):
+        sent, received, receiver = self.transfer(2, 3.0)
+        # received the tick after being sent
+        np.testing.assert_allclose(received[2:, 1], sent[1:-1, 1])
+        self.assertEqual(receiver.output(1)[1], 3.0)
+
+    def test_structured_records(self):
+        sent, received, receiver = self.transfer([('x', 'f8'), ('v', 'f8', (2,))], np.array([1.0, 2.0]))
+        # received the tick after being sent
+        np.testing.assert_allclose(received[2:, 1], sent[1:-1, 1])
+        np.testing.assert_array_equal(receiver.output(1)[1], [1.0, 2.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
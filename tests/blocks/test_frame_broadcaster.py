@@ -0,0 +1,59 @@
+import time
+import unittest
+from threading import Thread
+
+from bdsim_realtime.blocks.vision import _FrameBroadcaster
+
+
+class FrameBroadcasterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.broadcaster = _FrameBroadcaster()
+
+    def test_slow_subscriber_takes_the_newest_frame(self):
+        fast, slow = self.broadcaster.subscribe(), self.broadcaster.subscribe()
+        taken = []
+        for n in range(5):
+            self.broadcaster.publish(n, time.monotonic())
+            taken.append(fast.next())
+        self.assertEqual(taken, list(range(5)))
+
+        # frames it was due but never took were dropped, and counted
+        self.assertEqual(slow.next(), 4)
+        self.assertEqual((slow.received, slow.dropped), (1, 4))
+        self.assertEqual((fast.received, fast.dropped), (5, 0))
+
+    def test_waits_for_a_new_frame(self):
+        subscriber = self.broadcaster.subscribe()
+        stamp = time.monotonic()
+        publisher = Thread(target=lambda: (time.sleep(0.05), self.broadcaster.publish("frame", stamp)))
+        publisher.start()
+        self.assertEqual(subscriber.next(), "frame")
+        self.assertGreaterEqual(subscriber.latency, 0.05)
+        publisher.join()
+
+    def test_subscriber_fps(self):
+        subscriber = self.broadcaster.subscribe(fps=10)
+        # published at 40Hz, taken at 10Hz - the skipped frames weren't due, so weren't dropped
+        taken = []
+        for n in range(12):
+            self.broadcaster.publish(n, n / 40)
+            if self.broadcaster.version > subscriber.last_seen and subscriber.due(n / 40):
+                taken.append(subscriber.next())
+        self.assertEqual(taken, [0, 4, 8])
+        self.assertEqual(subscriber.dropped, 0)
+
+    def test_out_of_order_frames_are_ignored(self):
+        subscriber = self.broadcaster.subscribe()
+        self.assertTrue(self.broadcaster.publish("newer", 2.0))
+        self.assertFalse(self.broadcaster.publish("older", 1.0))
+        self.assertEqual(subscriber.next(), "newer")
+
+    def test_close_wakes_subscribers(self):
+        subscriber = self.broadcaster.subscribe()
+        Thread(target=lambda: (time.sleep(0.02), self.broadcaster.close())).start()
+        self.assertIsNone(subscriber.next())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import time
+import unittest
+
+import numpy as np
+
+from bdsim_realtime.blocks.vision import _FrameGrabber
+
+
+class _FakeCapture:
+    "Delivers numbered 4x4 frames every `interval` seconds, writing into the given buffer like `cv2.VideoCapture.read()`"
+
+    def __init__(self, interval: float, n_frames: int = 1000):
+        self.interval = interval
+        self.n_frames = n_frames
+        self.count = 0
+        self.allocations = 0
+
+    def read(self, image=None):
+        time.sleep(self.interval)
+        if self.count >= self.n_frames:
+            return False, None
+        if image is None:
+            image = np.empty((4, 4), dtype=np.int64)
+            self.allocations += 1
+        image[:] = self.count
+        self.count += 1
+        return True, image
+
+
+class FrameGrabberTest(unittest.TestCase):
+
+    def test_latest_frame_without_blocking(self):
+        capture = _FakeCapture(interval=1e-3)
+        grabber = _FrameGrabber(capture)
+        grabber.start()
+        try:
+            frame, _ = grabber.latest()
+            time.sleep(0.05)
+            start = time.monotonic()
+            frame, age = grabber.latest()
+            self.assertLess(time.monotonic() - start, 1e-3)
+            self.assertLess(age, 0.01)
+            # the newest frame, and everything before it that was never returned was dropped
+            self.assertGreaterEqual(frame[0, 0], grabber.frames - 2)
+            self.assertGreater(grabber.dropped, 10)
+        finally:
+            grabber.stop()
+        self.assertEqual(capture.allocations, 3)
+
+    def test_held_frame_is_not_overwritten(self):
+        grabber = _FrameGrabber(_FakeCapture(interval=1e-4))
+        grabber.start()
+        try:
+            for _ in range(50):
+                frame, _ = grabber.latest()
+                value = frame[0, 0]
+                time.sleep(2e-3)
+                self.assertTrue((frame == value).all())
+        finally:
+            grabber.stop()
+
+    def test_holds_last_frame_until_a_new_one(self):
+        grabber = _FrameGrabber(_FakeCapture(interval=0.05))
+        grabber.start()
+        try:
+            first, _ = grabber.latest()
+            again, age = grabber.latest()
+            self.assertIs(again, first)
+            self.assertEqual(again[0, 0], 0)
+        finally:
+            grabber.stop()
+
+    def test_capture_failure_is_raised(self):
+        grabber = _FrameGrabber(_FakeCapture(interval=0, n_frames=0))
+        grabber.start()
+        grabber.join()
+        with self.assertRaises(AssertionError):
+            grabber.latest()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import unittest
+
+import cv2
+import numpy as np
+from bdsim import BDSim, BDSimState
+from bdsim.components import ClockedBlock
+
+from bdsim_realtime.blocks.vision import CvtColor, Display, Erode, InRange, Mask
+from bdsim_realtime.run import run
+
+from helpers import Frames, block_output
+
+
+class OutputBufferTest(unittest.TestCase):
+
+    def setUp(self):
+        self.bd = BDSim(graphics=False).blockdiagram()
+        self.src = self.bd.CONSTANT(0)
+        rng = np.random.default_rng(0)
+        self.frames = [rng.integers(0, 256, (24, 32, 3), dtype=np.uint8) for _ in range(2)]
+
+    def test_outputs_are_written_into_one_buffer(self):
+        block = CvtColor(self.src, cv2.COLOR_BGR2HSV, bd=self.bd)
+        first = block_output(block, self.frames[0])
+        second = block_output(block, self.frames[1])
+        self.assertIs(first, second)
+        np.testing.assert_array_equal(second, cv2.cvtColor(self.frames[1], cv2.COLOR_BGR2HSV))
+
+        # and resized along with the frames
+        resized = block_output(block, self.frames[0][:12])
+        self.assertEqual(resized.shape, (12, 32, 3))
+
+    def test_reused_mask_output_is_cleared(self):
+        block = Mask(self.src, bd=self.bd)
+        masks = [(frame[..., 0] > 128).astype(np.uint8) for frame in self.frames]
+        block_output(block, self.frames[0], masks[0])
+        masked = block_output(block, self.frames[1], masks[1])
+        np.testing.assert_array_equal(masked, cv2.bitwise_and(self.frames[1], self.frames[1], mask=masks[1]))
+
+    def test_morphology_iterations(self):
+        block = Erode(self.src, iterations=2, enable=True, bd=self.bd)
+        mask = (self.frames[0][..., 0] > 64).astype(np.uint8)
+        np.testing.assert_array_equal(block_output(block, mask), cv2.erode(mask, block.kernel, iterations=2))
+
+    def test_disabled_in_range_mask_is_cached(self):
+        block = InRange(self.src, enable=False, bd=self.bd)
+        mask = block_output(block, self.frames[0])
+        self.assertIs(block_output(block, self.frames[1]), mask)
+        np.testing.assert_array_equal(mask, np.ones((24, 32), np.uint8))
+        self.assertFalse(mask.flags.writeable)
+
+    def test_display_fps_is_drawn_on_a_copy(self):
+        # upstream blocks reuse (or share) their output buffers, so DISPLAY mustn't draw into them
+        mask = block_output(InRange(self.src, enable=False, bd=self.bd), self.frames[0])
+        eroded = block_output(Erode(self.src, enable=False, bd=self.bd), mask)
+        display = Display(self.src, show_fps=True, web_stream_host=True, bd=self.bd)
+        self.bd.state = BDSimState()
+        for input in (mask, eroded, self.frames[0]):
+            original = input.copy()
+            display._T_inputs = (input,)
+            display.step()
+            np.testing.assert_array_equal(input, original)
+        self.assertTrue(np.any(display._overlay != self.frames[0]))
+        display.done(display)
+
+
+class _Keep(ClockedBlock):
+    "Keeps its input, and a copy of it as it was then, on every tick of its clock"
+    nin = 1
+    nout = 1
+
+    def __init__(self, kept, clock, **blockargs):
+        super().__init__(nin=1, nout=1, clock=clock, **blockargs)
+        self.kept = kept
+        self._x0 = [0]
+        self.ndstates = 1
+
+    def next(self):
+        [frame] = self.inputs
+        self.kept.append((frame, frame.copy()))
+        return self._x
+
+    def output(self, t=None):
+        return [0]
+
+
+class CrossClockTest(unittest.TestCase):
+
+    def test_reader_on_another_clock_keeps_whole_frames(self):
+        # a fast vision clock's reused output buffer, read by a block on another clock's thread
+        bd = BDSim(graphics=False).blockdiagram()
+        frames = Frames(lambda t: np.full((48, 64, 3), round(t * 100) % 256, np.uint8), bd.clock(100, 'Hz'), bd=bd)
+        gray = CvtColor(frames, cv2.COLOR_BGR2GRAY, bd=bd)
+        kept = []
+        keep = _Keep(kept, bd.clock(30, 'Hz'), bd=bd)
+        bd.connect(gray, keep)
+        bd.connect(keep, bd.NULL(1))
+
+        run(bd, max_time=0.3, executor="thread")
+        self.assertGreater(len(kept), 3)
+        for frame, then in kept[1:]:
+            self.assertEqual(len(np.unique(then)), 1)  # never caught mid-write
+            np.testing.assert_array_equal(frame, then)  # nor overwritten by a later tick
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from bdsim_realtime.blocks.vision import _MjpegEncoder
+
+
+class MjpegEncoderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.encoder = _MjpegEncoder(workers=2)
+        self.viewers = ThreadPoolExecutor(4)
+        # smooth, so that it survives JPEG compression
+        self.frame = np.zeros((48, 64, 3), np.uint8)
+        self.frame[..., 1] = np.arange(64) * 4
+        self.frame[..., 2] = np.arange(48)[:, None] * 5
+
+    def tearDown(self):
+        self.encoder.close()
+        self.viewers.shutdown(wait=False)
+
+    def watch(self, *clients):
+        "Starts a viewer per (quality, fps), each waiting for its first part. Returns the futures of their parts"
+        # keep the streams open - a closed stream unsubscribes its client
+        self.streams = [self.encoder.stream(quality, fps) for quality, fps in clients]
+        futures = [self.viewers.submit(next, stream) for stream in self.streams]
+        while len(self.encoder.viewers) < len(clients):
+            time.sleep(1e-3)
+        return futures
+
+    def test_nothing_is_encoded_without_clients(self):
+        self.encoder.submit(self.frame)
+        self.assertEqual(self.encoder.encoded, 0)
+        self.assertIsNone(self.encoder._pool)
+
+    def test_clients_share_each_quality_part(self):
+        a, b, c = self.watch((80, None), (80, None), (20, None))
+        self.encoder.submit(self.frame)
+        a, b, c = a.result(1), b.result(1), c.result(1)
+
+        self.assertIs(a, b)
+        self.assertNotEqual(a, c)
+        self.assertEqual(self.encoder.encoded, 1)
+
+        self.assertTrue(a.startswith(_MjpegEncoder.BOUNDARY) and a.endswith(b"\r\n"))
+        jpg = np.frombuffer(a[len(_MjpegEncoder.BOUNDARY):-2], np.uint8)
+        decoded = cv2.imdecode(jpg, cv2.IMREAD_COLOR)
+        self.assertLess(np.abs(decoded.astype(int) - self.frame).mean(), 4)
+
+    def test_frames_are_throttled_to_the_client_fps(self):
+        [part] = self.watch((80, 2))
+        self.encoder.submit(self.frame)
+        part.result(1)
+
+        # the client is ready for another frame, but not due one for half a second
+        [viewer] = self.encoder.viewers
+        self.encoder.submit(self.frame)
+        time.sleep(0.05)
+        self.assertEqual(self.encoder.encoded, 1)
+        self.assertEqual((viewer.received, viewer.dropped), (1, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
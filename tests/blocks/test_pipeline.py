@@ -0,0 +1,103 @@
+import threading
+import unittest
+
+import cv2
+import numpy as np
+from bdsim import BDSim
+
+from bdsim_realtime.blocks.vision import (
+    Blobs,
+    CvtColor,
+    Dilate,
+    Erode,
+    InRange,
+    OpenMask,
+    VisionPipeline,
+    fuse_vision_chains,
+)
+from bdsim_realtime.run import run
+from bdsim_realtime.scheduling import VirtualScheduler
+
+from helpers import Frames, block_output
+
+
+class VisionPipelineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.bd = BDSim(graphics=False).blockdiagram()
+        self.src = self.bd.CONSTANT(0)
+        rng = np.random.default_rng(0)
+        # taller than a few bands, and not a multiple of the band height
+        self.frames = [rng.integers(0, 256, (100, 64, 3), dtype=np.uint8) for _ in range(2)]
+
+    def stages(self):
+        return [
+            CvtColor(self.src, cv2.COLOR_BGR2HSV, bd=self.bd),
+            InRange(self.src, lower=(0, 0, 0), upper=(90, 255, 255), bd=self.bd),
+            OpenMask(self.src, bd=self.bd),
+        ]
+
+    def sequential(self, stages, frame):
+        x = frame
+        for stage in stages:
+            x = block_output(stage, x)
+        return x.copy()
+
+    def assert_matches_sequential(self, threads):
+        stages = self.stages()
+        pipeline = VisionPipeline(stages, threads=threads, bd=self.bd)
+        try:
+            for frame in self.frames:
+                expected = self.sequential(stages, frame)
+                stages[0]._T_inputs = (frame,)
+                [out] = pipeline.output()
+                np.testing.assert_array_equal(out, expected)
+        finally:
+            pipeline.done()
+
+    def test_matches_sequential_stages(self):
+        self.assert_matches_sequential(threads=1)
+
+    def test_matches_sequential_stages_threaded(self):
+        self.assert_matches_sequential(threads=2)
+
+    def test_open_mask_is_erode_then_dilate(self):
+        mask = (self.frames[0][..., 0] > 64).astype(np.uint8)
+        erode = Erode(self.src, iterations=2, enable=True, bd=self.bd)
+        dilate = Dilate(self.src, iterations=2, enable=True, bd=self.bd)
+        opened = block_output(OpenMask(self.src, iterations=2, bd=self.bd), mask)
+        np.testing.assert_array_equal(opened, block_output(dilate, block_output(erode, mask)))
+
+
+class FuseVisionChainsTest(unittest.TestCase):
+
+    def test_fuses_single_consumer_chains(self):
+        bd = BDSim(graphics=False).blockdiagram()
+        src = bd.CONSTANT(np.zeros((8, 8, 3), np.uint8))
+        hsv = CvtColor(src, cv2.COLOR_BGR2HSV, bd=bd)
+        mask = InRange(hsv, lower=(0, 0, 0), upper=(90, 255, 255), bd=bd)
+        opened = OpenMask(mask, bd=bd)
+        blobs = Blobs(opened, bd=bd)
+        # the mask is read by another block, so the chain is split there
+        other = bd.NULL(1)
+        bd.connect(mask, other)
+        bd.compile()
+
+        plan = [src, hsv, mask, opened, blobs, other]
+        fused = fuse_vision_chains(plan)
+        pipelines = [b for b in fused if isinstance(b, VisionPipeline)]
+        self.assertEqual([p.stages for p in pipelines], [[hsv, mask], [opened, blobs]])
+        self.assertEqual(fused, [src, pipelines[0], pipelines[1], other])
+
+    def test_fused_pipelines_are_done_after_a_run(self):
+        bd = BDSim(graphics=False).blockdiagram()
+        frames = Frames(np.zeros((100, 8, 3), np.uint8), bd.clock(10, 'Hz'), bd=bd)
+        mask = InRange(CvtColor(frames, cv2.COLOR_BGR2HSV, bd=bd), lower=(0, 0, 0), upper=(90, 255, 255), bd=bd)
+        bd.connect(mask, bd.NULL(1))
+
+        run(bd, max_time=0.5, scheduler=VirtualScheduler(), fuse_vision=2)
+        self.assertFalse([t for t in threading.enumerate() if t.name.startswith("vision-pipeline")])
+
+
+if __name__ == "__main__":
+    unittest.main()
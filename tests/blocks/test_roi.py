@@ -0,0 +1,66 @@
+import pickle
+import unittest
+
+import cv2
+import numpy as np
+from bdsim import BDSim
+
+from bdsim_realtime.blocks.vision import Blobs, InRange, Roi, RoiFrame, VisionPipeline
+
+from helpers import block_output
+
+
+class RoiTest(unittest.TestCase):
+
+    def setUp(self):
+        self.bd = BDSim(graphics=False).blockdiagram()
+        self.src = self.bd.CONSTANT(0)
+        self.frame = np.zeros((240, 320, 3), np.uint8)
+        cv2.circle(self.frame, (200, 120), 20, (255, 255, 255), -1)
+
+    def detect(self, roi):
+        mask = block_output(InRange(self.src, lower=(200, 200, 200), bd=self.bd), roi)
+        self.assertIsInstance(mask, RoiFrame)
+        return block_output(Blobs(self.src, bd=self.bd), mask)
+
+    def test_region_is_a_view(self):
+        roi = block_output(Roi(self.src, rect=(150, 60, 120, 100), bd=self.bd), self.frame)
+        self.assertEqual(roi.shape, (100, 120, 3))
+        self.assertEqual((roi.origin, roi.scale), ((150, 60), 1))
+        self.assertTrue(np.shares_memory(roi, self.frame))
+
+        roi = pickle.loads(pickle.dumps(roi))
+        self.assertEqual((roi.origin, roi.scale), ((150, 60), 1))
+
+    def test_keypoints_are_mapped_to_the_frame(self):
+        for level in (0, 1, 2):
+            roi = block_output(Roi(self.src, rect=(150, 60, 120, 120), level=level, bd=self.bd), self.frame)
+            self.assertEqual(roi.shape[:2], (120 // 2 ** level,) * 2)
+            [keypoint] = self.detect(roi)
+            np.testing.assert_allclose(keypoint.pt, (200, 120), atol=0.5)
+            self.assertAlmostEqual(keypoint.size, 40, delta=10)
+
+    def test_fused_pipeline_keeps_the_region(self):
+        stages = [InRange(self.src, lower=(200, 200, 200), bd=self.bd), Blobs(self.src, bd=self.bd)]
+        stages[0]._T_inputs = (block_output(Roi(self.src, rect=(150, 60, 120, 120), bd=self.bd), self.frame),)
+        [[keypoint]] = VisionPipeline(stages, bd=self.bd).output()
+        np.testing.assert_allclose(keypoint.pt, (200, 120), atol=0.5)
+
+    def test_tracking_window_follows_the_previous_keypoints(self):
+        blobs = Blobs(self.src, bd=self.bd)
+        roi = Roi(self.src, rect=(0, 0, 100, 80), track=blobs, bd=self.bd)
+
+        blobs.output_values = [()]  # nothing found yet - search the whole frame
+        self.assertEqual(block_output(roi, self.frame).shape[:2], (240, 320))
+
+        blobs.output_values = [self.detect(block_output(roi, self.frame))]
+        window = block_output(roi, self.frame)
+        self.assertEqual((window.origin, window.shape[:2]), ((150, 80), (80, 100)))
+
+        # kept inside the frame
+        blobs.output_values = [(cv2.KeyPoint(310, 5, 10),)]
+        self.assertEqual(block_output(roi, self.frame).origin, (220, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
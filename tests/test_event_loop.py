@@ -0,0 +1,88 @@
+import asyncio
+import unittest
+
+from bdsim import BDSim
+from bdsim.components import SinkBlock
+
+from bdsim_realtime.event_loop import _LoopScheduler, arun, async_run
+from bdsim_realtime.timing import TickTimings
+
+
+class _AsyncSleep(SinkBlock):
+    "Awaits `delay` seconds on every step, then appends the tick's t to `log`"
+    nin = 1
+    nout = 0
+
+    def __init__(self, log, delay, **blockargs):
+        super().__init__(nin=1, **blockargs)
+        self.log = log
+        self.delay = delay
+
+    async def async_step(self):
+        t = self.bd.state.t
+        await asyncio.sleep(self.delay)
+        self.log.append((t, self.bd.state.t))
+
+
+class _Fail(SinkBlock):
+    nin = 1
+    nout = 0
+
+    def step(self):
+        raise ValueError("failed")
+
+
+class AsyncRunTest(unittest.TestCase):
+
+    def setUp(self):
+        self.bd = BDSim(graphics=False).blockdiagram()
+
+    def test_awaiting_clock_overlaps_other_clocks(self):
+        bd = self.bd
+        fast, slow = bd.clock(100, 'Hz'), bd.clock(5, 'Hz')
+        zoh_fast = bd.ZOH(fast)
+        bd.connect(bd.WAVEFORM('sine'), zoh_fast)
+        bd.connect(zoh_fast, bd.NULL())
+        zoh_slow = bd.ZOH(slow)
+        bd.connect(bd.WAVEFORM('sine'), zoh_slow)
+        log = []
+        sink = _AsyncSleep(log, 0.15)
+        bd.add_block(sink)
+        bd.connect(zoh_slow, sink)
+
+        timings = TickTimings()
+        async_run(bd, max_time=1, timings=timings, use_uvloop=False)
+
+        # the fast clock kept ticking on time while the slow one awaited
+        self.assertGreaterEqual(timings[fast].ticks, 95)
+        self.assertLess(timings[fast].jitter.max(), 0.05)
+        self.assertEqual(len(log), timings[slow].ticks)
+        # each clock's ticks see their own t, even across awaits
+        for t_before, t_after in log:
+            self.assertEqual(t_before, t_after)
+
+    def test_errors_propagate(self):
+        bd = self.bd
+        zoh = bd.ZOH(bd.clock(100, 'Hz'))
+        bd.connect(bd.WAVEFORM('sine'), zoh)
+        sink = _Fail(nin=1)
+        bd.add_block(sink)
+        bd.connect(zoh, sink)
+
+        with self.assertRaises(ValueError):
+            asyncio.run(arun(bd, max_time=1))
+
+
+class LoopSchedulerTest(unittest.TestCase):
+
+    def test_skip_overrun_policy(self):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        scheduler = _LoopScheduler(loop, overrun="skip")
+        scheduled = scheduler.time() - 0.035  # 3.5 periods late
+        self.assertGreater(scheduler.next_time(scheduled, 0.01), scheduler.time() - 1e-3)
+        self.assertEqual((scheduler.overruns, scheduler.skipped_ticks), (1, 3))
+
+
+if __name__ == "__main__":
+    unittest.main()
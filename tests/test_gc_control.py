@@ -0,0 +1,67 @@
+import gc
+import unittest
+
+from bdsim_realtime.gc_control import IdleCollector
+
+
+def make_cyclic_garbage(n):
+    for _ in range(n):
+        cycle = []
+        cycle.append(cycle)
+
+
+class IdleCollectorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.collector = IdleCollector()
+        self.collector.freeze()
+
+    def tearDown(self):
+        self.collector.restore()
+
+    def test_freeze_disables_automatic_collection(self):
+        self.assertFalse(gc.isenabled())
+        self.assertGreater(gc.get_freeze_count(), 0)
+
+    def test_freeze_estimates_each_generations_pause(self):
+        self.assertTrue(all(pause > 0 for pause in self.collector.worst_pauses))
+
+    def test_collects_when_due_and_within_budget(self):
+        self.assertEqual(self.collector.collect_within(1.0), 0.0)  # nothing allocated yet
+
+        make_cyclic_garbage(gc.get_threshold()[0] + 1)
+        self.assertGreater(self.collector.collect_within(1.0), 0.0)
+        self.assertEqual(self.collector.collections[0], 1)
+
+    def test_defers_collection_that_does_not_fit(self):
+        self.collector.worst_pauses = [1.0, 1.0, 1.0]
+        make_cyclic_garbage(gc.get_threshold()[0] + 1)
+        self.assertEqual(self.collector.collect_within(1e-3), 0.0)
+        self.assertEqual(self.collector.deferred, 1)
+
+
+class RestoreTest(unittest.TestCase):
+
+    def tearDown(self):
+        gc.unfreeze()
+        gc.enable()
+
+    def test_restores_automatic_collection(self):
+        collector = IdleCollector()
+        collector.freeze()
+        collector.restore()
+        self.assertTrue(gc.isenabled())
+        self.assertEqual(gc.get_freeze_count(), 0)
+
+    def test_leaves_collection_as_it_found_it(self):
+        gc.disable()
+        gc.freeze()
+        collector = IdleCollector()
+        collector.freeze()
+        collector.restore()
+        self.assertFalse(gc.isenabled())
+        self.assertGreater(gc.get_freeze_count(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
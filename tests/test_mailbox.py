@@ -0,0 +1,91 @@
+import multiprocessing
+import unittest
+
+import numpy as np
+
+from bdsim_realtime.mailbox import LocalMailbox, Mailbox
+
+
+def _put_values(mailbox, n):
+    for i in range(n):
+        mailbox.put([i, "x" * (i % 50)])
+
+
+def _put_sized_values(mailbox, n):
+    # lengths that differ a lot from one value to the next, so that a payload read with another's length can't unpickle
+    for i in range(n):
+        mailbox.put((i, bytes([i % 256]) * ((i * 7919) % 8000)))
+
+
+class MailboxTest(unittest.TestCase):
+
+    def test_get_before_put_returns_default(self):
+        self.assertEqual(Mailbox().get("default"), "default")
+
+    def test_get_returns_latest_value(self):
+        mailbox = Mailbox()
+        mailbox.put([1, 2])
+        mailbox.put([3, 4])
+        self.assertEqual(mailbox.get(), [3, 4])
+        self.assertEqual(mailbox.get(), [3, 4])
+
+    def test_oversized_value_rejected(self):
+        with self.assertRaises(AssertionError):
+            Mailbox(size=16).put(b"x" * 64)
+
+    @unittest.skipUnless("fork" in multiprocessing.get_all_start_methods(), "requires fork")
+    def test_values_cross_processes_consistently(self):
+        mailbox = Mailbox()
+        writer = multiprocessing.get_context("fork").Process(target=_put_values, args=(mailbox, 2000))
+        writer.start()
+
+        last = -1
+        while writer.is_alive() or last < 1999:
+            value = mailbox.get()
+            if value is not None:
+                i, padding = value
+                self.assertEqual(padding, "x" * (i % 50))  # never torn
+                self.assertGreaterEqual(i, last)  # never goes backwards
+                last = i
+        writer.join()
+        self.assertEqual(last, 1999)
+
+    @unittest.skipUnless("fork" in multiprocessing.get_all_start_methods(), "requires fork")
+    def test_concurrent_puts_and_gets_of_varying_lengths(self):
+        mailbox = Mailbox(size=1 << 14)
+        n = 20000
+        writer = multiprocessing.get_context("fork").Process(target=_put_sized_values, args=(mailbox, n))
+        writer.start()
+
+        reads = 0
+        last = -1
+        while writer.is_alive() or last < n - 1:
+            value = mailbox.get()
+            if value is not None:
+                i, payload = value
+                self.assertEqual(payload, bytes([i % 256]) * ((i * 7919) % 8000))
+                self.assertGreaterEqual(i, last)
+                last = i
+                reads += 1
+        writer.join()
+        self.assertEqual(writer.exitcode, 0)
+        self.assertGreater(reads, 1)
+
+
+class LocalMailboxTest(unittest.TestCase):
+
+    def test_get_before_put_returns_default(self):
+        self.assertEqual(LocalMailbox().get("default"), "default")
+
+    def test_put_snapshots_arrays(self):
+        mailbox = LocalMailbox()
+        buffer = np.zeros(4)
+        mailbox.put([buffer, 1.0])
+        buffer[:] = 7  # ie; a block reusing its output buffer on its next tick
+        value, number = mailbox.get()
+        np.testing.assert_array_equal(value, np.zeros(4))
+        self.assertEqual(number, 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
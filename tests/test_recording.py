@@ -0,0 +1,177 @@
+import multiprocessing
+import os
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+from bdsim_realtime.recording import ChunkedRecorder, RingRecorder, RingRecording, iter_recording, read_recording
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+class ChunkedRecorderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.rows = np.random.rand(1000, 3)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def roundtrip(self, format: str):
+        path = os.path.join(self.dir.name, "recording." + format)
+        recorder = ChunkedRecorder(path, ["t", "x", "y"], format=format, chunk_rows=64)
+        for row in self.rows:
+            recorder.append(row)
+        recorder.close()
+
+        columns, rows = read_recording(path)
+        self.assertEqual(columns, ["t", "x", "y"])
+        np.testing.assert_array_equal(rows, self.rows)
+
+    def test_csv(self):
+        self.roundtrip("csv")
+
+    def test_npy(self):
+        self.roundtrip("npy")
+
+    @unittest.skipUnless(pyarrow, "pyarrow not installed")
+    def test_parquet(self):
+        self.roundtrip("parquet")
+
+    @unittest.skipUnless(pyarrow, "pyarrow not installed")
+    def test_arrow(self):
+        self.roundtrip("arrow")
+
+    def test_flush_rows_writes_partial_chunks(self):
+        path = os.path.join(self.dir.name, "recording.csv")
+        recorder = ChunkedRecorder(path, ["x"], chunk_rows=1000, flush_rows=10)
+        for i in range(25):
+            recorder.append([i])
+
+        # the first 20 rows are flushed without waiting for the chunk to fill
+        deadline = time.monotonic() + 1
+        while time.monotonic() < deadline:
+            with open(path) as f:
+                if len(f.readlines()) == 21:
+                    break
+            time.sleep(1e-3)
+        with open(path) as f:
+            self.assertEqual(len(f.readlines()), 21)
+        recorder.close()
+        np.testing.assert_array_equal(read_recording(path)[1][:, 0], np.arange(25))
+
+    def test_chunks_are_reused(self):
+        recorder = ChunkedRecorder(os.path.join(self.dir.name, "recording.npy"), ["x"], format="npy",
+                                   chunk_rows=8, chunks=2)
+        chunks = set()
+        for i in range(200):
+            recorder.append([i])
+            chunks.add(id(recorder._chunk))
+            if i % 8 == 7:
+                time.sleep(1e-3)  # let the writer keep up
+        recorder.close()
+        self.assertEqual(recorder.overflows, len(chunks) - 2)
+        self.assertLess(len(chunks), 10)
+
+
+def _record_and_crash(path: str):
+    recorder = RingRecorder(path, ["x"], capacity=100, sync_interval=None)
+    for i in range(42):
+        recorder.append([i])
+    os._exit(1)  # no close()
+
+
+class RingRecorderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "recording.bdrec")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_roundtrip(self):
+        recorder = RingRecorder(self.path, ["t", "x"], capacity=100)
+        for i in range(10):
+            recorder.append([i * 0.1, -i])
+        recorder.close()
+
+        recording = RingRecording(self.path)
+        self.assertEqual(recording.columns, ["t", "x"])
+        self.assertEqual(len(recording), 10)
+        np.testing.assert_array_equal(recording[:]['x'], -np.arange(10))
+        self.assertEqual(recording[-1]['t'], 0.9)
+
+        columns, rows = read_recording(self.path)
+        np.testing.assert_array_equal(rows, np.column_stack((np.arange(10) * 0.1, -np.arange(10))))
+        recording.close()
+
+    def test_wraps_keeping_the_latest_in_order(self):
+        recorder = RingRecorder(self.path, ["x"], capacity=100)
+        recording = RingRecording(self.path)
+        for i in range(250):
+            recorder.append([i])
+
+        # read while still recording
+        self.assertEqual(len(recording), 100)
+        self.assertEqual(recording.written, 250)
+        np.testing.assert_array_equal(recording[:]['x'], np.arange(150, 250))
+        np.testing.assert_array_equal(recording[::25]['x'], [150, 175, 200, 225])
+        self.assertEqual(recording[0]['x'], 150)
+        self.assertEqual(recording[-1]['x'], 249)
+        recorder.close()
+        recording.close()
+
+    def test_survives_a_crash(self):
+        process = multiprocessing.get_context('fork').Process(target=_record_and_crash, args=(self.path,))
+        process.start()
+        process.join(5)
+        self.assertEqual(process.exitcode, 1)
+
+        recording = RingRecording(self.path)
+        np.testing.assert_array_equal(recording[:]['x'], np.arange(42))
+        recording.close()
+
+
+
+class IterRecordingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_streams_chunks(self):
+        path = os.path.join(self.dir.name, "recording.npy")
+        rows = np.random.rand(100, 2)
+        recorder = ChunkedRecorder(path, ["t", "x"], format="npy")
+        for row in rows:
+            recorder.append(row)
+        recorder.close()
+
+        columns, chunks = iter_recording(path, chunk_rows=30)
+        chunks = list(chunks)
+        self.assertEqual(columns, ["t", "x"])
+        self.assertEqual([len(chunk) for chunk in chunks], [30, 30, 30, 10])
+        np.testing.assert_array_equal(np.vstack(chunks), rows)
+
+    def test_csv_block_output(self):
+        # no header, and 1-element array signals written as "[x]"
+        path = os.path.join(self.dir.name, "bdsim-dataout.csv")
+        with open(path, "w") as f:
+            f.write("0.0,[0.5],1\n0.1,[0.25],2\n0.2,[0.125],3\n")
+
+        columns, chunks = iter_recording(path, chunk_rows=2, columns=["t", "x", "y"])
+        self.assertEqual(columns, ["t", "x", "y"])
+        np.testing.assert_array_equal(np.vstack(list(chunks)), [[0.0, 0.5, 1], [0.1, 0.25, 2], [0.2, 0.125, 3]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,197 @@
+import multiprocessing
+import time
+import unittest
+
+import numpy as np
+from bdsim import BDSim
+from bdsim.components import SinkBlock
+
+from bdsim_realtime.run import _PlannedInputs, _clocked_plans, run
+from bdsim_realtime.scheduling import VirtualScheduler
+from bdsim_realtime.timing import TickTimings
+
+
+class _TickLog(SinkBlock):
+    "Appends (tag, t) to `log` on every step"
+    nin = 1
+    nout = 0
+
+    def __init__(self, log, tag, **blockargs):
+        super().__init__(nin=1, **blockargs)
+        self.log = log
+        self.tag = tag
+
+    def step(self, state=None):
+        self.log.append((self.tag, self.bd.state.t))
+
+
+class ClockedPlansTest(unittest.TestCase):
+
+    def setUp(self):
+        self.bd = BDSim(graphics=False).blockdiagram()
+
+    def test_plans_follow_data_dependencies(self):
+        bd = self.bd
+        fast, slow = bd.clock(50, 'Hz'), bd.clock(25, 'Hz')
+        wave = bd.WAVEFORM('sine')
+        zoh_fast = bd.ZOH(fast)
+        bd.connect(wave, zoh_fast)
+        gain = bd.GAIN(2)
+        bd.connect(zoh_fast, gain)
+        zoh_slow = bd.ZOH(slow)
+        bd.connect(gain, zoh_slow)
+        null = bd.NULL()
+        bd.connect(zoh_slow, null)
+        bd.compile(verbose=False)
+
+        plans = _clocked_plans(bd)
+        self.assertEqual(plans[fast], [wave, zoh_fast, gain])
+        self.assertEqual(plans[slow], [zoh_slow, null])
+
+    def test_shared_fan_in_is_planned_once(self):
+        bd = self.bd
+        clock = bd.clock(50, 'Hz')
+        zoh = bd.ZOH(clock)
+        bd.connect(bd.WAVEFORM('sine'), zoh)
+        blocks = [zoh]
+        for _ in range(20):
+            total = bd.SUM('++')
+            bd.connect(blocks[-1], total[0])
+            bd.connect(blocks[len(blocks) // 2], total[1])
+            blocks.append(total)
+        bd.compile(verbose=False)
+
+        plan = _clocked_plans(bd)[clock]
+        self.assertEqual(len(plan), len(set(plan)))
+        self.assertEqual(len(plan), len(bd.blocklist))
+        for idx, block in enumerate(blocks[1:], start=1):
+            self.assertLess(plan.index(blocks[idx - 1]), plan.index(block))
+
+
+class VirtualRunTest(unittest.TestCase):
+
+    def run_diagram(self, max_time):
+        bd = BDSim(graphics=False).blockdiagram()
+        fast, slow = bd.clock(50, 'Hz'), bd.clock(25, 'Hz', offset=0.02)
+        log = []
+        zoh_fast = bd.ZOH(fast)
+        bd.connect(bd.WAVEFORM('sine'), zoh_fast)
+        zoh_slow = bd.ZOH(slow)
+        bd.connect(zoh_fast, zoh_slow)
+        for zoh, tag in ((zoh_fast, 'fast'), (zoh_slow, 'slow')):
+            sink = _TickLog(log, tag)
+            bd.add_block(sink)
+            bd.connect(zoh, sink)
+
+        timings = TickTimings(capacity=100000)
+        run(bd, max_time=max_time, scheduler=VirtualScheduler(), timings=timings)
+        return log, timings[fast], timings[slow]
+
+    def test_runs_faster_than_realtime(self):
+        start = time.monotonic()
+        log, fast, slow = self.run_diagram(60)
+        self.assertLess(time.monotonic() - start, 10)
+        self.assertEqual(fast.ticks, 60 * 50 + 1)
+        self.assertEqual(log[-1], ('slow', 60.0))
+
+    def test_ticks_are_exact_and_interleaved(self):
+        log, fast, slow = self.run_diagram(10)
+        # no drift from accumulating periods, and the offset is honoured
+        np.testing.assert_array_equal(fast.scheduled, np.arange(fast.ticks) * 20_000_000 / 1e9)
+        np.testing.assert_array_equal(slow.scheduled, (np.arange(slow.ticks) * 40_000_000 + 20_000_000) / 1e9)
+        # where ticks coincide, the clocks always run in planning order
+        tags = [tag for tag, _ in log]
+        self.assertEqual(tags[:-2], ['fast', 'fast', 'slow'] * (len(tags) // 3))
+        self.assertEqual(log, self.run_diagram(10)[0])
+
+    def test_inputs_are_written_by_their_producers(self):
+        bd = BDSim(graphics=False).blockdiagram()
+        zoh = bd.ZOH(bd.clock(10, 'Hz'))
+        bd.connect(bd.WAVEFORM('sine', freq=1), zoh)
+        gain = bd.GAIN(2)
+        bd.connect(zoh, gain)
+        log = []
+        sink = _InputLog(log)
+        bd.add_block(sink)
+        bd.connect(gain, sink)
+
+        run(bd, max_time=1, scheduler=VirtualScheduler())
+        t = np.arange(11) / 10
+        np.testing.assert_allclose(np.ravel(log), 2 * np.sin(2 * np.pi * t), atol=1e-9)
+        # and the blocks read their inputs through their wires again afterwards
+        self.assertFalse(any(isinstance(b, _PlannedInputs) for b in bd.blocklist))
+
+
+class _InputLog(SinkBlock):
+    "Appends its input to `log` on every step"
+    nin = 1
+    nout = 0
+
+    def __init__(self, log, **blockargs):
+        super().__init__(nin=1, **blockargs)
+        self.log = log
+
+    def step(self, state=None):
+        self.log.append(self.inputs[0])
+
+
+class _StopAt(SinkBlock):
+    "Stops the run once the time passes `t_stop`, and notes when it's done()"
+    nin = 1
+    nout = 0
+
+    def __init__(self, t_stop, **blockargs):
+        super().__init__(nin=1, **blockargs)
+        self.t_stop = t_stop
+        self.is_done = False
+
+    def step(self, state=None):
+        if self.bd.state.t >= self.t_stop:
+            self.bd.state.stop = True
+
+    def done(self, **kwargs):
+        self.is_done = True
+
+
+class ThreadRunTest(unittest.TestCase):
+
+    def test_values_cross_clocks(self):
+        bd = BDSim(graphics=False).blockdiagram()
+        fast, slow = bd.clock(100, 'Hz'), bd.clock(20, 'Hz')
+        zoh_fast = bd.ZOH(fast)
+        bd.connect(bd.CONSTANT(3), zoh_fast)
+        gain = bd.GAIN(2)
+        bd.connect(zoh_fast, gain)
+        zoh_slow = bd.ZOH(slow)
+        bd.connect(gain, zoh_slow)
+        log = []
+        sink = _InputLog(log)
+        bd.add_block(sink)
+        bd.connect(zoh_slow, sink)
+
+        run(bd, max_time=0.2, executor="thread")
+        # the fast clock's outputs reach the slow one through a mailbox, once it has ticked
+        self.assertGreater(len(log), 2)
+        np.testing.assert_array_equal(np.ravel(log[1:]), 6)
+
+
+@unittest.skipUnless("fork" in multiprocessing.get_all_start_methods(), "requires fork")
+class ProcessRunTest(unittest.TestCase):
+
+    def test_any_clock_can_stop_the_others(self):
+        bd = BDSim(graphics=False).blockdiagram()
+        for clock, t_stop in ((bd.clock(50, 'Hz'), 0.1), (bd.clock(20, 'Hz'), float('inf'))):
+            zoh = bd.ZOH(clock)
+            bd.connect(bd.WAVEFORM('sine'), zoh)
+            stopper = _StopAt(t_stop)
+            bd.add_block(stopper)
+            bd.connect(zoh, stopper)
+
+        start = time.monotonic()
+        run(bd, executor="process")  # forever, unless stopped
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertTrue(stopper.is_done)
+
+
+if __name__ == "__main__":
+    unittest.main()
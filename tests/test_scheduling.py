@@ -0,0 +1,90 @@
+import threading
+import time
+import unittest
+
+from bdsim_realtime.scheduling import RealtimeScheduler, DeadlineMissed, VirtualScheduler
+
+
+class RealtimeSchedulerTest(unittest.TestCase):
+
+    def test_runs_events_in_time_order(self):
+        scheduler = RealtimeScheduler()
+        now = scheduler.time()
+        order = []
+        scheduler.enterabs(now + 0.02, 1, order.append, ("b",))
+        scheduler.enterabs(now + 0.01, 1, order.append, ("a",))
+        scheduler.enterabs(now + 0.02, 1, order.append, ("c",))
+        scheduler.run()
+        self.assertEqual(order, ["a", "b", "c"])
+
+    def test_wait_until_meets_deadline(self):
+        scheduler = RealtimeScheduler(spin=2e-3)
+        deadline = scheduler.time() + 0.01
+        scheduler.wait_until(deadline)
+        self.assertGreaterEqual(scheduler.time(), deadline)
+        self.assertLess(scheduler.time() - deadline, 5e-3)
+
+    def test_skip_overrun_policy(self):
+        scheduler = RealtimeScheduler(overrun="skip")
+        scheduled = scheduler.time() - 0.035  # 3.5 periods late
+        next_time = scheduler.next_time(scheduled, 0.01)
+        self.assertGreater(next_time, scheduler.time() - 1e-3)
+        periods = (next_time - scheduled) / 0.01
+        self.assertAlmostEqual(periods, round(periods), places=6)
+        self.assertEqual(scheduler.overruns, 1)
+        self.assertEqual(scheduler.skipped_ticks, 3)
+
+    def test_catchup_overrun_policy(self):
+        scheduler = RealtimeScheduler(overrun="catchup")
+        scheduled = scheduler.time() - 0.035
+        self.assertEqual(scheduler.next_time(scheduled, 0.01), scheduled + 0.01)
+        self.assertEqual(scheduler.overruns, 1)
+
+    def test_catches_up_by_default(self):
+        scheduler = RealtimeScheduler()
+        scheduled = scheduler.time() - 0.035
+        self.assertEqual(scheduler.next_time(scheduled, 0.01), scheduled + 0.01)
+        self.assertEqual(scheduler.skipped_ticks, 0)
+
+    def test_fail_overrun_policy(self):
+        scheduler = RealtimeScheduler(overrun="fail")
+        with self.assertRaises(DeadlineMissed):
+            scheduler.next_time(scheduler.time() - 0.035, 0.01)
+
+    def test_next_deadline_seen_from_another_thread(self):
+        # ie; by another clock's thread, to fit an idle garbage collection before it
+        scheduler = RealtimeScheduler()
+        deadline = scheduler.time() + 0.05
+        during = []
+        scheduler.enterabs(deadline, 1, lambda: during.append(scheduler.next_deadline(0.0)))
+        thread = threading.Thread(target=scheduler.run)
+        thread.start()
+        time.sleep(0.01)
+        self.assertEqual(scheduler.next_deadline(), deadline)  # still queued while it's waited for
+        thread.join()
+        self.assertEqual(during, [0.0])
+
+
+class VirtualSchedulerTest(unittest.TestCase):
+
+    def test_jumps_to_each_deadline(self):
+        scheduler = VirtualScheduler()
+        times = []
+        for deadline in (3600.0, 0.5, 60.0):
+            scheduler.enterabs(deadline, 1, lambda: times.append(scheduler.time()))
+        start = time.monotonic()
+        scheduler.run()
+        self.assertEqual(times, [0.5, 60.0, 3600.0])
+        self.assertLess(time.monotonic() - start, 0.1)
+
+    def test_paced(self):
+        scheduler = VirtualScheduler(speed=10)
+        scheduler.enterabs(0.5, 1, lambda: None)
+        start = time.monotonic()
+        scheduler.run()
+        self.assertAlmostEqual(time.monotonic() - start, 0.05, delta=0.02)
+        self.assertEqual(scheduler.time(), 0.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+import struct
+import threading
+import unittest
+
+import msgpack
+import numpy as np
+
+from bdsim_realtime.scopes import SCOPE_DATA_EXT, ScopeBuffer, decimate, legacy_scope_message, unpack_scope_data
+
+
+def _flush(buffer):
+    msg = buffer.flush()
+    assert msg.code == SCOPE_DATA_EXT
+    index, columns = unpack_scope_data(msg.data)
+    assert index == buffer.index
+    return columns
+
+
+class ScopeBufferTest(unittest.TestCase):
+
+    def test_samples_are_batched_into_columns(self):
+        buffer = ScopeBuffer(2, 2, capacity=2)
+        for n in range(5):  # grows past its capacity
+            buffer.append(n * 0.1, [n, np.array([-n])])
+        np.testing.assert_array_equal(_flush(buffer), [np.arange(5) * 0.1, np.arange(5), -np.arange(5)])
+
+        self.assertIsNone(buffer.flush())
+        buffer.append(1.0, [np.float64(7), 8])
+        np.testing.assert_array_equal(_flush(buffer), [[1.0], [7], [8]])
+
+    def test_samples_flushed_while_appending_are_sent_once_in_order(self):
+        buffer = ScopeBuffer(0, 1, capacity=8)
+        writer = threading.Thread(target=lambda: [buffer.append(n, [n]) for n in range(20000)])
+        writer.start()
+        received = []
+        while writer.is_alive():
+            msg = buffer.flush()
+            received.extend(unpack_scope_data(msg.data)[1][1] if msg else ())
+        writer.join()
+        msg = buffer.flush()
+        received.extend(unpack_scope_data(msg.data)[1][1] if msg else ())
+        np.testing.assert_array_equal(received, np.arange(20000))
+
+    def test_decimated_to_the_display_rate(self):
+        # 1 second of a 1kHz sine, with a spike, shown at 50Hz
+        buffer = ScopeBuffer(0, 1, rate=50)
+        t = np.arange(1000) / 1000
+        x = np.sin(2 * np.pi * t)
+        x[500] = 5
+        for sample in zip(t, x):
+            buffer.append(sample[0], [sample[1]])
+
+        columns = _flush(buffer)
+        self.assertEqual(columns.shape, (2, 100))
+        self.assertEqual(columns[1].max(), 5)
+        self.assertAlmostEqual(columns[1].min(), -1, places=3)
+        self.assertTrue(np.all(np.diff(columns[0]) > 0))
+
+    def test_decimated_samples_wait_for_their_bucket(self):
+        buffer = ScopeBuffer(0, 1, rate=10)
+        buffer.append(0.0, [1.0])
+        np.testing.assert_array_equal(_flush(buffer), [[0.0], [1.0]])  # too slow to decimate
+
+        buffer.append(0.01, [1.0])
+        buffer.append(0.02, [2.0])
+        self.assertIsNone(buffer.flush())
+        buffer.append(0.11, [3.0])
+        np.testing.assert_array_equal(_flush(buffer), [[0.01, 0.02, 0.11], [1.0, 2.0, 3.0]])
+
+    def test_decimation_keeps_the_order_of_each_min_and_max(self):
+        t = np.arange(8) / 8
+        falling = np.vstack((t, -t, t))
+        np.testing.assert_array_equal(decimate(falling, 2), [
+            [0, 3 / 8, 4 / 8, 7 / 8],
+            [0, -3 / 8, -4 / 8, -7 / 8],
+            [0, 3 / 8, 4 / 8, 7 / 8],
+        ])
+        # slower than the display rate - sent as they are
+        self.assertIs(decimate(falling, 10), falling)
+
+
+def _decode_like_frontend(data: bytes):
+    # mirrors ScopeData.decode in frontend/api.ts
+    scope_idx, = struct.unpack_from("<H", data, 0)
+    n_samples, = struct.unpack_from("<I", data, 2)
+    values = struct.unpack("<%dd" % ((len(data) - 6) // 8), data[6:])
+    return scope_idx, [list(values[start:start + n_samples]) for start in range(0, len(values), n_samples)]
+
+
+class ScopeMessageTest(unittest.TestCase):
+
+    def _round_trip(self, buffer):
+        # as sent over the link and forwarded by the webapp
+        msg = msgpack.unpackb(msgpack.packb(buffer.flush()))
+        self.assertEqual(msg.code, SCOPE_DATA_EXT)
+        return msg.data
+
+    def test_frontend_decodes_the_columns(self):
+        buffer = ScopeBuffer(3, 2)
+        for n in range(4):
+            buffer.append(n * 0.5, [n, 10 * n])
+        self.assertEqual(_decode_like_frontend(self._round_trip(buffer)), (3, [
+            [0.0, 0.5, 1.0, 1.5],
+            [0.0, 1.0, 2.0, 3.0],
+            [0.0, 10.0, 20.0, 30.0],
+        ]))
+
+    def test_frontend_decodes_decimated_min_and_max(self):
+        buffer = ScopeBuffer(1, 1, rate=2)
+        for t, x in [(0.0, 1.0), (0.1, -2.0), (0.2, 4.0), (0.3, 0.0), (0.5, 3.0), (0.6, 5.0)]:
+            buffer.append(t, [x])
+        index, columns = _decode_like_frontend(self._round_trip(buffer))
+        self.assertEqual(index, 1)
+        # each half second bucket's min and max at its first and last sample times - max first if it fell
+        self.assertEqual(columns, [[0.0, 0.3, 0.5, 0.6], [4.0, -2.0, 3.0, 5.0]])
+
+    def test_legacy_message_lists_the_columns(self):
+        buffer = ScopeBuffer(2, 1)
+        buffer.append(0.0, [1.0])
+        buffer.append(0.1, [2.0])
+        data = self._round_trip(buffer)
+        self.assertEqual(legacy_scope_message(data), [2, [0.0, 0.1], [1.0, 2.0]])
+        self.assertEqual(legacy_scope_message(data)[1:], _decode_like_frontend(data)[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
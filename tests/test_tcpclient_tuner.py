@@ -0,0 +1,110 @@
+import socket
+import time
+import unittest
+
+import msgpack
+
+from bdsim_realtime.scopes import unpack_scope_data
+from bdsim_realtime.tuning.tuners import TcpClientTuner
+
+
+def _wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(1e-3)
+
+
+class _TunerTestCase:
+    io_thread = True
+    telemetry_interval = 0.01
+
+    def setUp(self):
+        self.server = socket.socket()
+        self.server.bind(("localhost", 0))
+        self.server.listen(1)
+        self.tuner = TcpClientTuner("localhost", self.server.getsockname()[1], io_thread=self.io_thread,
+                                    telemetry_interval=self.telemetry_interval, max_backlog=1 << 16)
+        self.webapp, _ = self.server.accept()
+        self.webapp.settimeout(1)
+        self.unpacker = msgpack.Unpacker()
+
+        self.gain = self.tuner.param(1.0, name="gain", force_gui=True)
+        self.scope_id = self.tuner.register_signal_scope("signal", 1)
+        self.wide_scope_id = self.tuner.register_signal_scope("wide", 1000)
+        self.tuner.setup()
+        self.assertEqual(self.receive()["params"][0]["name"], "gain")
+
+    def tearDown(self):
+        self.tuner.close()
+        self.webapp.close()
+        self.server.close()
+
+    def receive(self):
+        while True:
+            for msg in self.unpacker:
+                return msg
+            self.unpacker.feed(self.webapp.recv(1 << 16))
+
+
+class TcpClientTunerTest(_TunerTestCase, unittest.TestCase):
+    io_thread = False
+    telemetry_interval = 0.5
+
+    def test_scopes_are_sent_once_per_telemetry_interval(self):
+        self.webapp.setblocking(False)
+        self.tuner.queue_signal_update(self.scope_id, 0.0, [1.0])
+        self.tuner.update()
+        self.tuner.queue_signal_update(self.scope_id, 0.001, [2.0])
+        self.tuner.update()
+        self.assertEqual(unpack_scope_data(self.receive().data)[1].tolist(), [[0.0], [1.0]])
+        with self.assertRaises(BlockingIOError):
+            self.webapp.recv(1)
+
+        time.sleep(self.telemetry_interval)
+        self.tuner.update()
+        self.webapp.setblocking(True)
+        self.assertEqual(unpack_scope_data(self.receive().data)[1].tolist(), [[0.001], [2.0]])
+
+
+class TcpClientTunerIoThreadTest(_TunerTestCase, unittest.TestCase):
+
+    def test_param_changes_are_applied_at_update(self):
+        self.webapp.sendall(msgpack.packb([0, 2.0]))
+        _wait_for(lambda: self.tuner._param_updates)
+        self.assertEqual(self.gain.val, 1.0)
+        self.tuner.update()
+        self.assertEqual(self.gain.val, 2.0)
+
+    def test_scopes_are_sent_without_update(self):
+        self.tuner.queue_signal_update(self.scope_id, 0.5, [1.0])
+        index, columns = unpack_scope_data(self.receive().data)
+        self.assertEqual((index, columns.tolist()), (0, [[0.5], [1.0]]))
+
+    def test_stalled_webapp_drops_scopes_without_blocking(self):
+        # the webapp stops reading: the socket's buffers fill, then the backlog
+        samples = [0.0] * 1000
+        longest = 0.0
+        while not self.tuner.dropped:
+            for i in range(10):
+                self.tuner.queue_signal_update(self.wide_scope_id, i, samples)
+            start = time.perf_counter()
+            self.tuner.update()
+            longest = max(longest, time.perf_counter() - start)
+            time.sleep(0.01)
+        self.assertLess(len(self.tuner._outbox), 2 * self.tuner.max_backlog)
+        self.assertLess(longest, 1e-3)
+        self.assertTrue(self.tuner._thread.is_alive())
+
+    def test_disconnected_webapp_stops_the_thread(self):
+        self.webapp.close()
+        self.tuner._thread.join(1)
+        self.assertIsInstance(self.tuner.error, ConnectionError)
+        self.tuner.queue_signal_update(self.scope_id, 0.5, [1.0])
+        self.assertIsNone(self.tuner._scope_buffers[0].flush())
+        with self.assertRaises(ConnectionError):
+            self.tuner.update()
+
+
+if __name__ == "__main__":
+    unittest.main()
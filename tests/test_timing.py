@@ -0,0 +1,40 @@
+import unittest
+
+import numpy as np
+import numpy.testing as nt
+from bdsim.components import Clock
+
+from bdsim_realtime.timing import ClockTimings
+
+
+class ClockTimingsTest(unittest.TestCase):
+
+    def record(self, timings, n):
+        for i in range(n):
+            next_durations, exec_durations = timings.begin_tick(i * 0.1, i * 0.1 + 0.001)
+            exec_durations[:] = 0.002
+            timings.end_tick(i * 0.1 + 0.004, i * 0.1)
+
+    def test_ring_buffer_keeps_latest_ticks_in_order(self):
+        timings = ClockTimings(Clock(10, 'Hz'), blocks=["a", "b"], capacity=4)
+        self.record(timings, 10)
+
+        self.assertEqual(timings.ticks, 10)
+        nt.assert_allclose(timings.scheduled, [0.6, 0.7, 0.8, 0.9])
+        nt.assert_allclose(timings.jitter, 0.001)
+        nt.assert_allclose(timings.duration, 0.003)
+        nt.assert_allclose(timings.slack, 0.096)
+        self.assertEqual(timings.exec_durations.shape, (4, 2))
+
+    def test_summary_statistics(self):
+        timings = ClockTimings(Clock(10, 'Hz'), blocks=["a"], capacity=100)
+        self.record(timings, 3)
+
+        nt.assert_allclose(timings.percentiles((50,))['jitter'], [0.001])
+        counts, _ = timings.histogram(bins=5)
+        self.assertEqual(counts.sum(), 3)
+        self.assertIn("3 ticks", timings.summary())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,271 @@
+import multiprocessing
+import socket
+import threading
+import unittest
+
+import msgpack
+import numpy as np
+
+from bdsim_realtime.transport import (
+    SharedMemoryTransport, SocketTransport, StreamTransport, _pack_frames, as_transport, record_dtype)
+
+
+class SocketTransportTest(unittest.TestCase):
+
+    def setUp(self):
+        a, b = socket.socketpair()
+        self.sender, self.receiver = SocketTransport(a), SocketTransport(b)
+
+    def tearDown(self):
+        self.sender.sock.close()
+        self.receiver.sock.close()
+
+    def test_poll_returns_nothing_without_blocking(self):
+        self.assertEqual(self.receiver.poll(), [])
+
+    def test_poll_returns_all_received_messages_in_order(self):
+        for i in range(5):
+            self.sender.send([i, i * 0.5, "x"])
+        self.assertEqual(self.receiver.poll(), [[i, i * 0.5, "x"] for i in range(5)])
+        self.assertEqual(self.receiver.poll(), [])
+
+    def test_recv_blocks_until_message(self):
+        self.sender.send({"version": "0.1.0"})
+        self.assertEqual(self.receiver.recv(timeout=1), {"version": "0.1.0"})
+        with self.assertRaises(TimeoutError):
+            self.receiver.recv(timeout=0.01)
+
+    def test_backlog_when_receiver_stalls(self):
+        self.sender.max_backlog = 1 << 16
+        payload = b"x" * 4096
+        for _ in range(1000):  # far more than the socket buffers can take
+            self.sender.send(payload)
+        self.assertGreater(self.sender.dropped, 0)
+
+        # everything that wasn't dropped arrives intact once the receiver catches up
+        received = []
+        while len(received) < 1000 - self.sender.dropped:
+            received.extend(self.receiver.poll())
+            self.sender.poll()  # flushes the backlog
+        self.assertTrue(all(msg == payload for msg in received))
+
+
+class NdarrayFramingTest(unittest.TestCase):
+
+    def setUp(self):
+        a, b = socket.socketpair()
+        self.sender, self.receiver = SocketTransport(a), SocketTransport(b)
+
+    def tearDown(self):
+        self.sender.sock.close()
+        self.receiver.sock.close()
+
+    def test_arrays_roundtrip(self):
+        image = np.random.randint(0, 255, (48, 64, 3), dtype=np.uint8)
+        vector = np.array([1.5, -2.0, 3.25], dtype=np.float32)
+        self.sender.send([0.5, image, vector, np.float32(2), np.arange(3)[::2]])
+
+        t, received_image, received_vector, scalar, strided = self.receiver.recv(timeout=1)
+        self.assertEqual(t, 0.5)
+        np.testing.assert_array_equal(received_image, image)
+        self.assertEqual(received_image.dtype, np.uint8)
+        np.testing.assert_array_equal(received_vector, vector)
+        self.assertEqual(received_vector.dtype, np.float32)
+        self.assertEqual(scalar, 2.0)
+        np.testing.assert_array_equal(strided, [0, 2])
+
+    def test_nested_arrays_roundtrip(self):
+        self.sender.send({'pose': np.eye(3)})
+        np.testing.assert_array_equal(self.receiver.recv(timeout=1)['pose'], np.eye(3))
+
+    def test_top_level_arrays_are_not_copied(self):
+        image = np.zeros((480, 640), dtype=np.uint16)
+        frames = _pack_frames(msgpack.Packer(), [1, image])
+        self.assertTrue(any(
+            isinstance(frame, memoryview) and np.shares_memory(np.asarray(frame), image) for frame in frames))
+
+
+class StreamTransportTest(unittest.TestCase):
+
+    def test_roundtrip_over_socket_file(self):
+        a, b = socket.socketpair()
+        sender = as_transport(a.makefile('rwb'))
+        receiver = as_transport(b.makefile('rwb'))
+        self.assertIsInstance(sender, StreamTransport)
+
+        sender.send([1, 2, 3])
+        sender.send([4, 5, 6])
+        self.assertEqual(receiver.poll(), [[1, 2, 3]])
+        self.assertEqual(receiver.recv(), [4, 5, 6])
+
+        sender.send([np.arange(6).reshape(2, 3)])
+        np.testing.assert_array_equal(receiver.recv()[0], np.arange(6).reshape(2, 3))
+        a.close()
+        b.close()
+
+
+class TransportHandshakeTest(unittest.TestCase):
+
+    def test_sender_receiver_handshake(self):
+        a, b = socket.socketpair()
+        thread = threading.Thread(target=SocketTransport(a).handshake, args=('sender',))
+        thread.start()
+        SocketTransport(b).handshake('receiver')
+        thread.join(1)
+        self.assertFalse(thread.is_alive())
+        a.close()
+        b.close()
+
+
+
+def _handshake(sender, receiver, schema):
+    thread = threading.Thread(target=sender.handshake, args=('sender', schema))
+    thread.start()
+    receiver.handshake('receiver')
+    thread.join(1)
+
+
+class SchemaTest(unittest.TestCase):
+
+    def setUp(self):
+        a, b = socket.socketpair()
+        self.sender, self.receiver = SocketTransport(a), SocketTransport(b)
+
+    def tearDown(self):
+        self.sender.sock.close()
+        self.receiver.sock.close()
+
+    def test_without_schema_sends_messages(self):
+        _handshake(self.sender, self.receiver, None)
+        self.assertIsNone(self.sender.schema)
+        self.assertIsNone(self.receiver.schema)
+
+    def test_receiver_adopts_senders_schema(self):
+        schema = [('x', 'f4'), ('image', 'u1', (4, 6))]
+        _handshake(self.sender, self.receiver, schema)
+        self.assertEqual(self.receiver.schema, record_dtype(schema))
+        self.assertEqual(self.sender.schema, record_dtype(schema))
+
+        image = np.arange(24, dtype=np.uint8).reshape(4, 6)
+        self.sender.send_record(0.0, [1.5, image])
+        self.sender.send_record(0.01, [2.5, image + 1])
+        records = self.receiver.poll_records()
+        np.testing.assert_array_equal(records['seq'], [0, 1])
+        np.testing.assert_array_equal(records['t'], [0.0, 0.01])
+        np.testing.assert_array_equal(records['values']['x'], [1.5, 2.5])
+        np.testing.assert_array_equal(records['values']['image'][1], image + 1)
+        self.assertEqual(len(self.receiver.poll_records()), 0)
+
+    def test_partial_records_are_held_back(self):
+        _handshake(self.sender, self.receiver, 2)
+        record = bytes(self.sender._pack_record(0.0, [1, 2]))
+        self.sender.sock.send(record[:5])
+        self.assertEqual(len(self.receiver.poll_records()), 0)
+        self.sender.sock.send(record[5:])
+        np.testing.assert_array_equal(self.receiver.poll_records()['values']['c1'], [2])
+
+    def test_lost_and_reordered_records_are_counted(self):
+        _handshake(self.sender, self.receiver, 1)
+        records = []
+        for seq in (0, 1, 4, 2, 5):
+            self.sender._seq = seq
+            records.append(bytes(self.sender._pack_record(0.0, [seq])))
+        self.sender.sock.send(b"".join(records))
+
+        received = self.receiver.poll_records()
+        np.testing.assert_array_equal(received['seq'], [0, 1, 4, 5])
+        self.assertEqual(self.receiver.lost, 2)
+        self.assertEqual(self.receiver.reordered, 1)
+
+    def test_over_stream(self):
+        a, b = self.sender.sock.dup(), self.receiver.sock.dup()
+        a.setblocking(True)
+        b.setblocking(True)
+        sender, receiver = StreamTransport(a.makefile('rwb')), StreamTransport(b.makefile('rwb'))
+        thread = threading.Thread(target=lambda: (sender.handshake('sender', 3), sender.send_record(0.5, [1, 2, 3])))
+        thread.start()
+        receiver.handshake('receiver')
+        thread.join(1)
+        # the record may have been read into the msgpack buffer along with the handshake
+        np.testing.assert_array_equal(receiver.poll_records()['values']['c2'], [3])
+        a.close()
+        b.close()
+
+
+def _send_ramp(name: str, n: int):
+    transport = SharedMemoryTransport(3, capacity=n, name=name)
+    for i in range(n):
+        transport.send([i, -i, 2 * i])
+    transport.close()
+
+
+class SharedMemoryTransportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sender = SharedMemoryTransport(3, capacity=8)
+        self.receiver = SharedMemoryTransport(3, capacity=8, name=self.sender.name)
+        self.receiver.handshake('receiver')
+
+    def tearDown(self):
+        self.receiver.close()
+        self.sender.close()
+        self.sender.unlink()
+
+    def test_poll_returns_records_in_order(self):
+        self.assertEqual(self.receiver.poll(), [])
+        for i in range(5):
+            self.sender.send([i, i + 0.5, -i])
+        received = self.receiver.poll()
+        np.testing.assert_array_equal(received, [[i, i + 0.5, -i] for i in range(5)])
+        self.assertEqual(self.receiver.poll(), [])
+
+    def test_lapped_receiver_skips_to_oldest(self):
+        for i in range(20):
+            self.sender.send([i, 0, 0])
+        received = self.receiver.poll()
+        self.assertEqual([r[0] for r in received], list(range(12, 20)))
+        self.assertEqual(self.receiver.dropped, 12)
+
+    def test_recv(self):
+        self.sender.send([1, 2, 3])
+        self.sender.send([4, 5, 6])
+        np.testing.assert_array_equal(self.receiver.recv(timeout=0.1), [1, 2, 3])
+        np.testing.assert_array_equal(self.receiver.poll(), [[4, 5, 6]])
+        with self.assertRaises(TimeoutError):
+            self.receiver.recv(timeout=0.01)
+
+    def test_structured_records(self):
+        dtype = np.dtype([('t', np.float64), ('pose', np.float32, (3,)), ('valid', np.bool_)])
+        sender = SharedMemoryTransport(dtype, capacity=4)
+        sender.send((0.5, [1, 2, 3], True))
+        received, = sender.poll()
+        self.assertEqual(received['t'], 0.5)
+        np.testing.assert_array_equal(received['pose'], [1, 2, 3])
+        self.assertTrue(received['valid'])
+        sender.close()
+        sender.unlink()
+
+    def test_layout_mismatch_fails_handshake(self):
+        mismatched = SharedMemoryTransport(2, capacity=8, name=self.sender.name)
+        with self.assertRaises(AssertionError):
+            mismatched.handshake('receiver')
+        mismatched.close()
+
+    def test_from_another_process(self):
+        sender = SharedMemoryTransport(3, capacity=1000)
+        receiver = SharedMemoryTransport(3, capacity=1000, name=sender.name)
+        process = multiprocessing.get_context('fork').Process(target=_send_ramp, args=(sender.name, 1000))
+        process.start()
+        process.join(5)
+        self.assertEqual(process.exitcode, 0)
+
+        received = receiver.poll()
+        self.assertEqual(len(received), 1000)
+        np.testing.assert_array_equal(received[-1], [999, -999, 1998])
+        receiver.close()
+        sender.close()
+        sender.unlink()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,179 @@
+import socket
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import msgpack
+import numpy as np
+from bdsim import BDSim
+
+from bdsim_realtime.blocks.vision import Display
+from bdsim_realtime.scopes import SCOPE_DATA_EXT, unpack_scope_data
+from bdsim_realtime.tuning.tuners import TcpClientTuner
+from bdsim_realtime.video import FRAME_HEADER, MJPEG_BOUNDARY, VIDEO_FRAME_EXT, FrameEncoder, decode_raw, unpack_header
+
+
+class _FullSocket:
+    "Wraps a socket whose send buffer is full"
+
+    def __init__(self, sock):
+        self.sock = sock
+
+    def send(self, data):
+        raise BlockingIOError()
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+
+def _frames(n):
+    # a mostly-static scene: a square moving across a gradient
+    background = np.zeros((48, 64, 3), np.uint8)
+    background[..., 1] = np.arange(64) * 4
+    frames = []
+    for i in range(n):
+        frame = background.copy()
+        frame[10:20, i:i + 10] = 255
+        frames.append(frame)
+    return frames
+
+
+class FrameEncoderTest(unittest.TestCase):
+
+    def test_jpeg(self):
+        [frame] = _frames(1)
+        msg = FrameEncoder(3, "jpeg").encode(frame)
+        self.assertEqual(msg.code, VIDEO_FRAME_EXT)
+
+        header = unpack_header(msg.data)
+        self.assertEqual(tuple(header), (3, "jpeg", True, 64, 48, 3))
+        decoded = cv2.imdecode(np.frombuffer(msg.data[FRAME_HEADER.size:], np.uint8), cv2.IMREAD_COLOR)
+        self.assertLess(np.abs(decoded.astype(int) - frame).mean(), 4)
+
+    def test_raw_deltas_are_lossless(self):
+        encoder = FrameEncoder(0, "raw", keyframe_interval=4)
+        prev = None
+        sizes = []
+        for n, frame in enumerate(_frames(9)):
+            msg = encoder.encode(frame)
+            header = unpack_header(msg.data)
+            self.assertEqual(header.keyframe, n % 4 == 0)
+            prev = decode_raw(header, msg.data[FRAME_HEADER.size:], prev)
+            np.testing.assert_array_equal(prev, frame)
+            sizes.append(len(msg.data))
+        # deltas of a mostly-static scene are much smaller than keyframes
+        self.assertLess(max(sizes[1:4]), sizes[0] / 2)
+
+    def test_raw_shape_change_is_a_keyframe(self):
+        encoder = FrameEncoder(0, "raw")
+        encoder.encode(np.zeros((4, 4), np.uint8))
+        self.assertFalse(unpack_header(encoder.encode(np.zeros((4, 4), np.uint8)).data).keyframe)
+        self.assertTrue(unpack_header(encoder.encode(np.zeros((4, 8), np.uint8)).data).keyframe)
+
+
+class TcpClientTunerVideoTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = socket.socket()
+        self.server.bind(("localhost", 0))
+        self.server.listen(1)
+        self.tuner = TcpClientTuner("localhost", self.server.getsockname()[1], link_video=True)
+        self.webapp, _ = self.server.accept()
+        self.webapp.settimeout(1)
+        self.unpacker = msgpack.Unpacker()
+
+    def tearDown(self):
+        self.tuner.close()
+        self.webapp.close()
+        self.server.close()
+
+    def receive(self):
+        while True:
+            for msg in self.unpacker:
+                return msg
+            self.unpacker.feed(self.webapp.recv(1 << 16))
+
+    def test_frames_are_multiplexed_with_other_messages(self):
+        id = self.tuner.register_video_stream("camera", "raw")
+        scope_id = self.tuner.register_signal_scope("signal", 1)
+        self.tuner.setup()
+        self.assertEqual(self.receive()["video_streams"], [{"id": id, "name": "camera", "format": "raw"}])
+
+        [frame] = _frames(1)
+        self.tuner.send_video_frame(id, FrameEncoder(id, "raw").encode(frame))
+        self.assertFalse(self.tuner.video_stream_ready(id))
+        self.tuner.queue_signal_update(scope_id, 0.5, [1.0])
+        self.tuner.update()
+        self.assertTrue(self.tuner.video_stream_ready(id))
+
+        msg = self.receive()
+        self.assertEqual(msg.code, SCOPE_DATA_EXT)
+        index, columns = unpack_scope_data(msg.data)
+        self.assertEqual((index, columns.tolist()), (0, [[0.5], [1.0]]))
+        msg = self.receive()
+        self.assertEqual(msg.code, VIDEO_FRAME_EXT)
+        np.testing.assert_array_equal(decode_raw(unpack_header(msg.data), msg.data[FRAME_HEADER.size:]), frame)
+
+    def test_frames_wait_for_the_link(self):
+        id = self.tuner.register_video_stream("camera")
+        self.tuner._outbox += b"\xc0" * 10  # a message part-sent before a full socket buffer
+        self.tuner.sock = _FullSocket(self.tuner.sock)
+        self.tuner.send_video_frame(id, FrameEncoder(id).encode(_frames(1)[0]))
+        self.tuner.update()
+        self.assertFalse(self.tuner.video_stream_ready(id))
+        self.assertEqual(len(self.tuner._outbox), 10)
+
+
+class TcpClientTunerMjpegTest(unittest.TestCase):
+    "Without link_video, streams are served over HTTP - as the webapp's bundled frontend expects"
+
+    def setUp(self):
+        self.server = socket.socket()
+        self.server.bind(("localhost", 0))
+        self.server.listen(1)
+        self.tuner = TcpClientTuner("localhost", self.server.getsockname()[1])
+        self.webapp, _ = self.server.accept()
+        self.viewers = ThreadPoolExecutor(1)
+
+    def tearDown(self):
+        self.tuner.close()
+        self.viewers.shutdown()
+        self.webapp.close()
+        self.server.close()
+
+    def test_frames_are_served_as_mjpeg(self):
+        id = self.tuner.register_video_stream("my camera")
+        self.assertEqual(self.tuner.video_streams, ["http://%s:7646/my-camera" % self.tuner.ip])
+        self.assertFalse(self.tuner.video_stream_ready(id))  # nobody's watching
+
+        client = self.tuner._video_app().test_client()
+        # the test client waits for the first part of the response
+        part = self.viewers.submit(lambda: next(iter(client.get("/my-camera", buffered=False).response)))
+        while not self.tuner.video_stream_ready(id):
+            time.sleep(1e-3)
+
+        [frame] = _frames(1)
+        self.tuner.send_video_frame(id, FrameEncoder(id).encode(frame))
+        part = part.result(1)
+        self.assertTrue(part.startswith(MJPEG_BOUNDARY) and part.endswith(b"\r\n"))
+        decoded = cv2.imdecode(np.frombuffer(part[len(MJPEG_BOUNDARY):-2], np.uint8), cv2.IMREAD_COLOR)
+        self.assertLess(np.abs(decoded.astype(int) - frame).mean(), 4)
+
+    def test_display_streams_to_the_current_tuner(self):
+        # rather than hosting its own MJPEG stream on the first free port from 7645
+        bd = BDSim(graphics=False).blockdiagram()
+        with self.tuner:
+            display = Display(bd.CONSTANT(0), name="camera", web_stream_host=True, bd=bd)
+        self.assertIs(display.web_stream_host, self.tuner)
+        display.start(None)
+        self.assertEqual(self.tuner.video_streams, ["http://%s:7646/camera" % self.tuner.ip])
+        display.done(display)
+
+    def test_other_formats_need_the_link(self):
+        with self.assertRaises(AssertionError):
+            self.tuner.register_video_stream("camera", "raw")
+
+
+if __name__ == "__main__":
+    unittest.main()